@@ -0,0 +1,490 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, "..", "web_test", "project"))
+sys.path.insert(0, os.path.join(BASE_DIR, "..", "train"))
+from backends import load_backend, BACKEND_FILES
+from postprocess import box_arrays
+from detection_cache import weights_fingerprint
+from tiling import merge_nms
+from dataset_index import DatasetIndex, load_data_yaml, STATUS_BAD_IMAGE
+
+#======================================
+# EVALUATE - đánh giá checkpoint / backend export trên tập valid, quét conf / iou
+#======================================
+# python run_test/evaluate.py --weights runs/detect/.../best.pt --backend onnx
+# python run_test/evaluate.py --sweep-conf 0.1:0.9:0.05 --sweep-iou 0.3,0.4,0.5,0.6,0.7
+#
+# Model chỉ chạy một lần với conf thấp (0.001) và iou NMS cao (0.9); box thô được
+# lưu vào cache .npz (khoá = hash weights + backend + imgsz + danh sách ảnh). Mọi
+# phép tính sau đó chạy trên cache bằng NumPy:
+#   - NMS lại theo từng iou cần thử (NMS tham lam lồng nhau: iou thấp hơn chỉ bỏ bớt box)
+#   - ghép box dự đoán / nhãn cho cả tập trong một lần (không vòng lặp theo ảnh ở bước ghép)
+#   - P, R, AP50, AP50-95 theo lớp (nội suy 101 điểm như COCO / ultralytics), đường PR
+#   - ma trận nhầm lẫn, P / R / F1 cho cả lưới conf (searchsorted trên conf đã sắp xếp)
+# Kết quả ghi vào <out>/report.json, confusion_matrix.csv, pr_curves.png.
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+CACHE_CONF = 0.001
+CACHE_IOU = 0.9
+CONFUSION_IOU = 0.45
+RECALL_GRID = np.linspace(0, 1, 101)
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+DEFAULT_WEIGHTS = os.path.join(BASE_DIR, "../../runs/detect/my_yolov8n_train_meme/weights/best.pt")
+if not os.path.exists(DEFAULT_WEIGHTS):
+    DEFAULT_WEIGHTS = "runs/detect/my_yolov8n_train_meme/weights/best.pt"
+DEFAULT_DATA = os.path.join(BASE_DIR, "..", "train", "vehicle dataset", "data.yaml")
+DEFAULT_CACHE = os.path.join(BASE_DIR, "eval_cache")
+DEFAULT_OUTPUT = os.path.join(BASE_DIR, "eval")
+
+
+# ===== load_ground_truth =====
+# Nhãn của một split (qua dataset_index) → box pixel xyxy + lớp + ảnh chứa box
+def load_ground_truth(data_yaml, split="val"):
+    data = load_data_yaml(data_yaml)
+    image_dir = data.get(split)
+    if not image_dir or not os.path.isdir(image_dir):
+        raise FileNotFoundError(f"split '{split}' not found: {image_dir}")
+    index = DatasetIndex.load(image_dir)
+    if index is None or index.meta.get("nc") != data["nc"]:
+        index = DatasetIndex.build(image_dir, data["nc"], data["names"])
+    images = np.asarray(index.images)
+    # dấu vân tay danh sách ảnh (tên, kích thước, mtime) cho khoá cache dự đoán
+    fingerprint = hashlib.blake2b(np.ascontiguousarray(index.names).tobytes(), digest_size=16)
+    fingerprint.update(np.stack([images["size"], images["mtime_ns"]], axis=1).tobytes())
+    boxes = np.asarray(index.boxes, np.float32)
+    img = np.repeat(np.arange(len(images)), images["box_count"])
+    w = images["width"][img].astype(np.float32)
+    h = images["height"][img].astype(np.float32)
+    cx, cy, bw, bh = boxes[:, 1] * w, boxes[:, 2] * h, boxes[:, 3] * w, boxes[:, 4] * h
+    xyxy = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+    return {
+        "image_dir": image_dir,
+        "files": [str(n) for n in index.names],
+        "names": data["names"],
+        "nc": data["nc"],
+        "xyxy": xyxy.reshape(-1, 4),
+        "cls": boxes[:, 0].astype(np.int64),
+        "img": img.astype(np.int64),
+        "valid": images["status"] != STATUS_BAD_IMAGE,
+        "fingerprint": fingerprint.hexdigest(),
+    }
+
+
+# ===== predict_split =====
+# Chạy model một lần trên mọi ảnh của split (conf / iou nới rộng) → mảng box gộp theo ảnh
+def predict_split(model, gt, batch_size=8, conf=CACHE_CONF, iou=CACHE_IOU, read_threads=4):
+    paths = [os.path.join(gt["image_dir"], name) for name in gt["files"]]
+    out_img, out_xyxy, out_conf, out_cls = [], [], [], []
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=read_threads) as pool:
+        for start in range(0, len(paths), batch_size):
+            idx = [i for i in range(start, min(start + batch_size, len(paths))) if gt["valid"][i]]
+            frames = list(pool.map(cv2.imread, [paths[i] for i in idx]))
+            keep = [(i, f) for i, f in zip(idx, frames) if f is not None]
+            if not keep:
+                continue
+            results = model([f for _, f in keep], conf=conf, iou=iou)
+            for (i, _), result in zip(keep, results):
+                xyxy, scores, cls = box_arrays(result)
+                out_img.append(np.full(len(cls), i, np.int64))
+                out_xyxy.append(xyxy)
+                out_conf.append(scores)
+                out_cls.append(cls)
+    print(f"Predicted {len(paths)} images in {time.perf_counter() - t0:.1f}s")
+    return {
+        "img": np.concatenate(out_img) if out_img else np.zeros(0, np.int64),
+        "xyxy": np.concatenate(out_xyxy).astype(np.float32) if out_xyxy else np.zeros((0, 4), np.float32),
+        "conf": np.concatenate(out_conf).astype(np.float32) if out_conf else np.zeros(0, np.float32),
+        "cls": np.concatenate(out_cls).astype(np.int64) if out_cls else np.zeros(0, np.int64),
+    }
+
+
+# ===== cached_predictions =====
+# Đọc box thô từ cache; chưa có / khác khoá → chạy model (make_model() chỉ gọi khi cần)
+def cached_predictions(cache_path, key, make_model, gt, batch_size=8, refresh=False):
+    if not refresh and os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            if str(data["key"]) == key:
+                print(f"Using cached predictions {cache_path}")
+                return {k: data[k] for k in ("img", "xyxy", "conf", "cls")}
+    preds = predict_split(make_model(), gt, batch_size)
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    tmp = cache_path + ".tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, key=np.array(key), **preds)
+    os.replace(tmp, cache_path)
+    return preds
+
+
+# ===== nms_keep =====
+# NMS lại box thô (đã qua NMS iou=CACHE_IOU) với ngưỡng iou mới → mask box giữ lại
+def nms_keep(preds, iou):
+    n = len(preds["conf"])
+    if iou >= CACHE_IOU or n == 0:
+        return np.ones(n, dtype=bool)
+    keep = np.zeros(n, dtype=bool)
+    order = np.argsort(preds["img"], kind="stable")
+    bounds = np.flatnonzero(np.diff(preds["img"][order])) + 1
+    for group in np.split(order, bounds):
+        kept = merge_nms(preds["xyxy"][group], preds["conf"][group], preds["cls"][group], iou, "iou")
+        keep[group[kept]] = True
+    return keep
+
+
+# ===== box_iou =====
+# IoU giữa hai tập box (N, 4) x (M, 4)
+def box_iou(a, b):
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+# ===== candidate_pairs =====
+# Mọi cặp (nhãn, dự đoán) cùng ảnh có IoU >= min_iou, chỉ số toàn cục
+# → (gt_idx, pred_idx, iou, same_class)
+def candidate_pairs(gt, preds, min_iou=CONFUSION_IOU):
+    gt_order = np.argsort(gt["img"], kind="stable")
+    pred_order = np.argsort(preds["img"], kind="stable")
+    n_img = len(gt["files"])
+    gt_bounds = np.searchsorted(gt["img"][gt_order], np.arange(n_img + 1))
+    pred_bounds = np.searchsorted(preds["img"][pred_order], np.arange(n_img + 1))
+    gi_all, pj_all, iou_all = [], [], []
+    for i in np.flatnonzero((np.diff(gt_bounds) > 0) & (np.diff(pred_bounds) > 0)):
+        g = gt_order[gt_bounds[i]:gt_bounds[i + 1]]
+        p = pred_order[pred_bounds[i]:pred_bounds[i + 1]]
+        iou = box_iou(gt["xyxy"][g], preds["xyxy"][p])
+        gi, pj = np.nonzero(iou >= min_iou)
+        gi_all.append(g[gi])
+        pj_all.append(p[pj])
+        iou_all.append(iou[gi, pj])
+    if not gi_all:
+        empty = np.zeros(0, np.int64)
+        return empty, empty, np.zeros(0, np.float32), np.zeros(0, dtype=bool)
+    gi, pj, iou = np.concatenate(gi_all), np.concatenate(pj_all), np.concatenate(iou_all)
+    return gi, pj, iou, gt["cls"][gi] == preds["cls"][pj]
+
+
+# ===== greedy_match =====
+# Ghép 1-1 theo IoU giảm dần cho cả tập cùng lúc → (gt_idx, pred_idx) được ghép
+def greedy_match(gi, pj, iou):
+    order = np.argsort(-iou, kind="stable")
+    gi, pj = gi[order], pj[order]
+    _, first = np.unique(pj, return_index=True)        # mỗi dự đoán giữ cặp IoU cao nhất
+    first = np.sort(first)
+    gi, pj = gi[first], pj[first]
+    _, first = np.unique(gi, return_index=True)        # mỗi nhãn chỉ ghép một dự đoán
+    first = np.sort(first)
+    return gi[first], pj[first]
+
+
+# ===== match_predictions =====
+# tp (P, 10): dự đoán p đúng ở ngưỡng IoU thứ t (cùng lớp, ghép 1-1)
+def match_predictions(pairs, n_pred, thresholds=IOU_THRESHOLDS):
+    gi, pj, iou, same = pairs
+    tp = np.zeros((n_pred, len(thresholds)), dtype=bool)
+    for t, thr in enumerate(thresholds):
+        m = same & (iou >= thr)
+        _, matched = greedy_match(gi[m], pj[m], iou[m])
+        tp[matched, t] = True
+    return tp
+
+
+# ===== compute_ap =====
+# AP từ đường recall / precision (bao precision giảm dần, nội suy 101 điểm)
+def compute_ap(recall, precision):
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    mpre = np.concatenate(([1.0], precision, [0.0]))
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    curve = np.interp(RECALL_GRID, mrec, mpre)
+    return float(_trapezoid(curve, RECALL_GRID)), curve
+
+
+# ===== ap_per_class =====
+# → ap (nc, 10), đường PR (nc, 101) ở IoU 0.5, precision / recall / f1 (nc, 101) theo conf 0..1
+def ap_per_class(tp, conf, pred_cls, gt_cls, nc):
+    order = np.argsort(-conf, kind="stable")
+    tp, conf, pred_cls = tp[order], conf[order], pred_cls[order]
+    n_gt = np.bincount(gt_cls, minlength=nc)[:nc]
+    conf_grid = np.linspace(0, 1, 101)
+    ap = np.zeros((nc, tp.shape[1]))
+    pr_curve = np.zeros((nc, len(RECALL_GRID)))
+    p_conf = np.zeros((nc, len(conf_grid)))
+    r_conf = np.zeros((nc, len(conf_grid)))
+    for c in range(nc):
+        m = pred_cls == c
+        if not m.any() or n_gt[c] == 0:
+            continue
+        tpc = np.cumsum(tp[m], axis=0)
+        fpc = np.cumsum(~tp[m], axis=0)
+        recall = tpc / n_gt[c]
+        precision = tpc / (tpc + fpc)
+        # conf giảm dần → np.interp cần trục tăng dần nên đảo dấu
+        r_conf[c] = np.interp(-conf_grid, -conf[m], recall[:, 0], left=0)
+        p_conf[c] = np.interp(-conf_grid, -conf[m], precision[:, 0], left=1)
+        for t in range(tp.shape[1]):
+            ap[c, t], curve = compute_ap(recall[:, t], precision[:, t])
+            if t == 0:
+                pr_curve[c] = curve
+    f1 = 2 * p_conf * r_conf / np.maximum(p_conf + r_conf, 1e-16)
+    return ap, pr_curve, p_conf, r_conf, f1, conf_grid, n_gt
+
+
+# ===== operating_points =====
+# P / R / F1 theo lớp cho từng ngưỡng conf (tp ở IoU 0.5): đếm bằng searchsorted trên conf đã sắp
+# → tp_count, pred_count (len(confs), nc)
+def operating_points(tp50, conf, pred_cls, nc, confs):
+    tp_count = np.zeros((len(confs), nc), np.int64)
+    pred_count = np.zeros((len(confs), nc), np.int64)
+    for c in range(nc):
+        m = pred_cls == c
+        order = np.argsort(-conf[m], kind="stable")
+        sorted_conf = -conf[m][order]
+        cum_tp = np.concatenate(([0], np.cumsum(tp50[m][order])))
+        n = np.searchsorted(sorted_conf, -np.asarray(confs), side="right")   # số box conf >= ngưỡng
+        pred_count[:, c] = n
+        tp_count[:, c] = cum_tp[n]
+    return tp_count, pred_count
+
+
+# ===== confusion_matrix =====
+# (nc + 1) x (nc + 1), hàng = dự đoán, cột = nhãn thật, chỉ số nc = nền (bỏ sót / báo nhầm)
+def confusion_matrix(gt, preds, pairs, pred_mask, nc, iou_thr=CONFUSION_IOU):
+    gi, pj, iou, _ = pairs
+    m = pred_mask[pj] & (iou > iou_thr)
+    gi, pj = greedy_match(gi[m], pj[m], iou[m])
+    matrix = np.zeros((nc + 1, nc + 1), np.int64)
+    np.add.at(matrix, (preds["cls"][pj], gt["cls"][gi]), 1)
+    missed = np.ones(len(gt["cls"]), dtype=bool)
+    missed[gi] = False
+    np.add.at(matrix, (np.full(missed.sum(), nc), gt["cls"][missed]), 1)
+    extra = pred_mask.copy()
+    extra[pj] = False
+    np.add.at(matrix, (preds["cls"][extra], np.full(extra.sum(), nc)), 1)
+    return matrix
+
+
+# ===== evaluate_predictions =====
+# Toàn bộ chỉ số cho một ngưỡng NMS iou, mAP tính trên mọi box (conf >= CACHE_CONF)
+def evaluate_predictions(gt, preds, iou=0.7, conf=0.25, names=None):
+    nc = gt["nc"]
+    names = names or gt["names"] or [str(i) for i in range(nc)]
+    keep = nms_keep(preds, iou)
+    sub = {k: v[keep] for k, v in preds.items()}
+    pairs = candidate_pairs(gt, sub, min(CONFUSION_IOU, IOU_THRESHOLDS[0]))
+    tp = match_predictions(pairs, len(sub["conf"]))
+    ap, pr_curve, p_conf, r_conf, f1, conf_grid, n_gt = ap_per_class(tp, sub["conf"], sub["cls"], gt["cls"], nc)
+    tp_count, pred_count = operating_points(tp[:, 0], sub["conf"], sub["cls"], nc, [conf])
+    precision = tp_count[0] / np.maximum(pred_count[0], 1)
+    recall = tp_count[0] / np.maximum(n_gt, 1)
+    present = n_gt > 0
+    best = int(f1[present].mean(axis=0).argmax()) if present.any() else 0
+    classes = []
+    for c in range(nc):
+        classes.append({
+            "class": names[c] if c < len(names) else str(c),
+            "instances": int(n_gt[c]),
+            "precision": round(float(precision[c]), 4),
+            "recall": round(float(recall[c]), 4),
+            "mAP50": round(float(ap[c, 0]), 4),
+            "mAP50-95": round(float(ap[c].mean()), 4),
+            "best_f1_conf": round(float(conf_grid[int(f1[c].argmax())]), 2),
+            "best_f1": round(float(f1[c].max()), 4),
+        })
+    tp_all, pred_all, gt_all = int(tp_count[0].sum()), int(pred_count[0].sum()), int(n_gt.sum())
+    p_all = tp_all / max(pred_all, 1)
+    r_all = tp_all / max(gt_all, 1)
+    return {
+        "iou": iou,
+        "conf": conf,
+        "precision": round(p_all, 4),
+        "recall": round(r_all, 4),
+        "f1": round(2 * p_all * r_all / max(p_all + r_all, 1e-16), 4),
+        "mAP50": round(float(ap[present, 0].mean()), 4) if present.any() else 0.0,
+        "mAP50-95": round(float(ap[present].mean()), 4) if present.any() else 0.0,
+        "best_f1_conf": round(float(conf_grid[best]), 2),
+        "classes": classes,
+        "confusion_matrix": confusion_matrix(gt, sub, pairs, sub["conf"] >= conf, nc).tolist(),
+        "pr_curves": {classes[c]["class"]: pr_curve[c].round(4).tolist() for c in range(nc)},
+    }
+
+
+# ===== sweep =====
+# Lưới (iou NMS x conf) → P / R / F1 tổng + mAP50 theo iou; mỗi iou chỉ NMS + ghép một lần
+def sweep(gt, preds, confs, ious):
+    nc = gt["nc"]
+    n_gt = np.bincount(gt["cls"], minlength=nc)[:nc]
+    rows = []
+    for iou in ious:
+        keep = nms_keep(preds, iou)
+        sub = {k: v[keep] for k, v in preds.items()}
+        pairs = candidate_pairs(gt, sub, IOU_THRESHOLDS[0])
+        tp = match_predictions(pairs, len(sub["conf"]))
+        ap = ap_per_class(tp, sub["conf"], sub["cls"], gt["cls"], nc)[0]
+        present = n_gt > 0
+        map50 = float(ap[present, 0].mean()) if present.any() else 0.0
+        tp_count, pred_count = operating_points(tp[:, 0], sub["conf"], sub["cls"], nc, confs)
+        tp_all, pred_all = tp_count.sum(axis=1), pred_count.sum(axis=1)
+        p = tp_all / np.maximum(pred_all, 1)
+        r = tp_all / max(int(n_gt.sum()), 1)
+        f1 = 2 * p * r / np.maximum(p + r, 1e-16)
+        for k, conf in enumerate(confs):
+            rows.append({"iou": round(float(iou), 3), "conf": round(float(conf), 3),
+                         "precision": round(float(p[k]), 4), "recall": round(float(r[k]), 4),
+                         "f1": round(float(f1[k]), 4), "mAP50": round(map50, 4),
+                         "detections": int(pred_all[k])})
+    return rows
+
+
+# ===== parse_range =====
+# "0.1:0.9:0.05" → lưới; "0.3,0.5,0.7" → danh sách
+def parse_range(text):
+    if ":" in text:
+        start, stop, step = (float(v) for v in text.split(":"))
+        return np.round(np.arange(start, stop + step / 2, step), 4).tolist()
+    return [float(v) for v in text.split(",") if v.strip()]
+
+
+# ===== plot_pr_curves =====
+# Vẽ đường PR (IoU 0.5) bằng OpenCV (không cần matplotlib)
+def plot_pr_curves(report, path, size=(640, 480)):
+    w, h = size
+    m = 50
+    img = np.full((h, w, 3), 255, np.uint8)
+    cv2.rectangle(img, (m, 20), (w - 20, h - m), (0, 0, 0), 1)
+    colors = [(255, 56, 56), (56, 56, 255), (56, 160, 56), (0, 140, 255), (180, 0, 180), (160, 160, 0),
+              (0, 0, 0), (128, 128, 128)]
+    for k, (name, curve) in enumerate(report["pr_curves"].items()):
+        xs = m + RECALL_GRID * (w - 20 - m)
+        ys = (h - m) - np.asarray(curve) * (h - m - 20)
+        pts = np.stack([xs, ys], axis=1).astype(np.int32)
+        color = colors[k % len(colors)]
+        cv2.polylines(img, [pts], False, color, 2)
+        ap = next((c["mAP50"] for c in report["classes"] if c["class"] == name), 0)
+        cv2.putText(img, f"{name} {ap:.3f}", (w - 200, 40 + 18 * k), cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1)
+    cv2.putText(img, "recall", (w // 2 - 20, h - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+    cv2.putText(img, "precision", (5, 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+    cv2.putText(img, f"mAP50 {report['mAP50']:.3f}", (m + 10, h - m - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+    cv2.imwrite(path, img)
+
+
+# ===== print_report =====
+def print_report(report):
+    print(f"\n===== conf={report['conf']}, iou={report['iou']} =====")
+    print(f"{'class':<12}{'inst':>6}{'P':>8}{'R':>8}{'mAP50':>8}{'mAP50-95':>10}{'bestF1@conf':>13}")
+    for c in report["classes"]:
+        print(f"{c['class']:<12}{c['instances']:>6}{c['precision']:>8.4f}{c['recall']:>8.4f}{c['mAP50']:>8.4f}"
+              f"{c['mAP50-95']:>10.4f}{c['best_f1']:>8.3f}@{c['best_f1_conf']:.2f}")
+    print(f"{'all':<12}{sum(c['instances'] for c in report['classes']):>6}{report['precision']:>8.4f}"
+          f"{report['recall']:>8.4f}{report['mAP50']:>8.4f}{report['mAP50-95']:>10.4f}")
+    names = [c["class"] for c in report["classes"]] + ["background"]
+    print("\nconfusion matrix (rows = predicted, cols = true)")
+    print(" " * 12 + "".join(f"{n[:9]:>10}" for n in names))
+    for name, row in zip(names, report["confusion_matrix"]):
+        print(f"{name[:11]:<12}" + "".join(f"{v:>10}" for v in row))
+
+
+# ===== print_sweep =====
+def print_sweep(rows, top=10):
+    print(f"\n===== sweep: top {top} by F1 =====")
+    print(f"{'iou':>6}{'conf':>7}{'P':>8}{'R':>8}{'F1':>8}{'mAP50':>8}{'dets':>7}")
+    for r in sorted(rows, key=lambda r: -r["f1"])[:top]:
+        print(f"{r['iou']:>6.2f}{r['conf']:>7.2f}{r['precision']:>8.4f}{r['recall']:>8.4f}{r['f1']:>8.4f}"
+              f"{r['mAP50']:>8.4f}{r['detections']:>7}")
+
+
+# ===== evaluate_weights =====
+# API: đánh giá weights / backend trên split của data.yaml → (report, sweep rows)
+def evaluate_weights(weights=DEFAULT_WEIGHTS, backend="torch", data=DEFAULT_DATA, split="val", imgsz=640,
+                     conf=0.5, iou=0.5, sweep_confs=None, sweep_ious=None, batch_size=8, threads=None,
+                     cache_dir=DEFAULT_CACHE, refresh=False, out_dir=DEFAULT_OUTPUT, model=None):
+    gt = load_ground_truth(data, split)
+    names = gt["names"]
+    if model is not None:
+        # model truyền vào (test / wrapper) không có weights để làm khoá → chạy thẳng, không cache
+        preds = predict_split(model, gt, batch_size)
+    else:
+        model_key = weights_fingerprint(weights, backend)
+        key = json.dumps({"model": model_key, "backend": backend, "imgsz": imgsz, "images": gt["fingerprint"],
+                          "conf": CACHE_CONF, "iou": CACHE_IOU})
+        cache_path = os.path.join(cache_dir, f"{model_key[:16]}_{backend}_{imgsz}_{split}.npz")
+        preds = cached_predictions(cache_path, key, lambda: load_backend(backend, weights, threads, imgsz, names),
+                                   gt, batch_size, refresh)
+
+    t0 = time.perf_counter()
+    report = evaluate_predictions(gt, preds, iou=iou, conf=conf, names=names)
+    report["eval_seconds"] = round(time.perf_counter() - t0, 3)
+    report.update({"weights": weights, "backend": backend, "split": split, "images": len(gt["files"])})
+    rows = []
+    if sweep_confs or sweep_ious:
+        t0 = time.perf_counter()
+        rows = sweep(gt, preds, sweep_confs or [conf], sweep_ious or [iou])
+        report["sweep_seconds"] = round(time.perf_counter() - t0, 3)
+        best = max(rows, key=lambda r: r["f1"])
+        report["recommended"] = {"conf": best["conf"], "iou": best["iou"], "f1": best["f1"]}
+    # ngưỡng riêng từng lớp (F1 tốt nhất) theo định dạng YOLO_CLASS_CONF của app.py
+    report["class_conf"] = ",".join(f"{c['best_f1_conf']:.2f}" for c in report["classes"])
+
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, "report.json"), 'w', encoding='utf-8') as f:
+            json.dump({**report, "sweep": rows}, f, ensure_ascii=False, indent=1)
+        labels = [c["class"] for c in report["classes"]] + ["background"]
+        with open(os.path.join(out_dir, "confusion_matrix.csv"), 'w', encoding='utf-8') as f:
+            f.write("predicted\\true," + ",".join(labels) + "\n")
+            for name, row in zip(labels, report["confusion_matrix"]):
+                f.write(name + "," + ",".join(str(v) for v in row) + "\n")
+        plot_pr_curves(report, os.path.join(out_dir, "pr_curves.png"))
+    return report, rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a checkpoint / exported backend on a dataset split")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    parser.add_argument("--backend", default=os.environ.get("YOLO_BACKEND", "torch"), choices=sorted(BACKEND_FILES))
+    parser.add_argument("--data", default=DEFAULT_DATA, help="data.yaml")
+    parser.add_argument("--split", default="val")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=0, help="inference threads (0 = CPU count)")
+    parser.add_argument("--conf", type=float, default=0.5, help="operating conf for P/R and the confusion matrix")
+    parser.add_argument("--iou", type=float, default=0.5, help="NMS iou")
+    parser.add_argument("--sweep-conf", default=None, help="e.g. 0.1:0.9:0.05 or 0.25,0.5")
+    parser.add_argument("--sweep-iou", default=None, help="e.g. 0.3,0.4,0.5,0.6,0.7")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="raw prediction cache folder")
+    parser.add_argument("--refresh", action="store_true", help="re-run the model even if cached")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="report folder")
+    args = parser.parse_args(argv)
+
+    report, rows = evaluate_weights(
+        args.weights, args.backend, args.data, args.split, args.imgsz, args.conf, args.iou,
+        parse_range(args.sweep_conf) if args.sweep_conf else None,
+        parse_range(args.sweep_iou) if args.sweep_iou else None,
+        args.batch, args.threads or None, args.cache, args.refresh, args.out)
+    print_report(report)
+    if rows:
+        print_sweep(rows)
+        rec = report["recommended"]
+        print(f"\nBest F1 {rec['f1']:.4f} at conf={rec['conf']}, iou={rec['iou']} "
+              f"(sweep {len(rows)} settings in {report['sweep_seconds']:.2f}s)")
+    print(f"Per-class conf: YOLO_CLASS_CONF={report['class_conf']}")
+    print(f"Report: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,22 @@
-import pandas as pd
+import os
+import sys
+from evaluate import evaluate_weights, print_report, DEFAULT_WEIGHTS
 
-csv_path = "runs/detect/my_yolov8n_train_meme/results.csv"
+# Đánh giá best.pt trên tập valid (dự đoán được cache trong run_test/eval_cache,
+# chạy lại chỉ tính lại chỉ số). Báo cáo đầy đủ / quét conf, iou: run_test/evaluate.py
+weights = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_WEIGHTS
+backend = os.environ.get("YOLO_BACKEND", "torch")
 
-# Đọc file CSV
-df = pd.read_csv(csv_path)
+report, _ = evaluate_weights(weights, backend, conf=0.5, iou=0.5)
+print_report(report)
 
-# Lấy dòng cuối (epoch cuối)
-last = df.iloc[-1]
-
-precision = last["metrics/precision(B)"]
-recall = last["metrics/recall(B)"]
-map50 = last["metrics/mAP50(B)"]
-map5095 = last["metrics/mAP50-95(B)"]
+precision = report["precision"]
+recall = report["recall"]
+map50 = report["mAP50"]
+map5095 = report["mAP50-95"]
 
 # Tính F1-score
-f1 = 2 * (precision * recall) / (precision + recall)
+f1 = 2 * (precision * recall) / (precision + recall) if precision + recall else 0.0
 
 print("\n===== KẾT QUẢ TỔNG HỢP =====")
 print(f"Precision : {precision:.4f}")
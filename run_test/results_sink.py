@@ -0,0 +1,176 @@
+import os
+import csv
+import json
+import math
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+#======================================
+# RESULTS SINK - ghi detection của cả lượt chạy vào một file dạng bảng
+#======================================
+# Thay cho hàng nghìn file nhãn .txt: mỗi box là một dòng, ghi theo từng khối
+# (chunk_rows dòng) vào .parquet (cần pyarrow), .csv hoặc .jsonl. Phân tích sau chỉ
+# cần một lần đọc, vd. pandas.read_parquet("detections.parquet").
+#
+# Cột: image, timestamp (mtime ảnh, epoch giây), class_id, class_name, conf,
+#      x1, y1, x2, y2 (pixel ảnh gốc), roi_x1, roi_y1, roi_x2, roi_y2
+# Ảnh không có xe vẫn có một dòng với class_id = -1 (box / conf rỗng) để đếm được ảnh.
+#
+# Mỗi lần flush dữ liệu được fsync xuống đĩa rồi mới gọi on_flush (roi_cli ghi manifest
+# các ảnh đó lúc này, nên chạy tiếp sau khi mất điện không bỏ sót ảnh chưa ghi kết quả).
+# Parquet chỉ đọc được khi file đã đóng (footer) → mỗi khối là một file hoàn chỉnh:
+# <tên>.parquet, <tên>.part1.parquet, ... (pandas.read_parquet đọc được cả danh sách / thư mục).
+
+COLUMNS = ["image", "timestamp", "class_id", "class_name", "conf",
+           "x1", "y1", "x2", "y2", "roi_x1", "roi_y1", "roi_x2", "roi_y2"]
+FORMATS = ("parquet", "csv", "jsonl")
+
+
+# ===== sink_format =====
+# Định dạng theo đuôi file
+def sink_format(path):
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    if ext in ("ndjson", "json"):
+        ext = "jsonl"
+    if ext not in FORMATS:
+        raise ValueError(f"Unsupported results format {ext!r} (use .parquet, .csv or .jsonl)")
+    return ext
+
+
+# ===== next_part_path =====
+# File Parquet không ghi nối được → lượt chạy tiếp theo ghi ra <tên>.partN.parquet
+def next_part_path(path):
+    if not os.path.exists(path):
+        return path
+    base, ext = os.path.splitext(path)
+    n = 1
+    while os.path.exists(f"{base}.part{n}{ext}"):
+        n += 1
+    return f"{base}.part{n}{ext}"
+
+
+class ResultsSink:
+    # ===== __init__ =====
+    # path: .parquet / .csv / .jsonl; csv, jsonl ghi nối nếu file đã có
+    # names: {class_id: tên lớp}; chunk_rows: số dòng giữ trong bộ nhớ trước khi ghi
+    # on_flush(): gọi sau khi một khối đã ghi + fsync xong
+    def __init__(self, path, names=None, chunk_rows=50000, on_flush=None):
+        self.format = sink_format(path)
+        self._base_path = path
+        if self.format == "parquet":
+            if pa is None:
+                raise ValueError("Writing .parquet needs pyarrow (pip install pyarrow), or use .csv / .jsonl")
+            path = next_part_path(path)
+        self.path = path
+        self.paths = []              # các file đã ghi (Parquet: một file mỗi khối)
+        self.on_flush = on_flush
+        self.names = dict(names or {})
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.columns = {c: [] for c in COLUMNS}
+        self.buffered = 0
+        self.rows = 0
+        self.images = 0
+        self._file = None
+        self._csv = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    # ===== add =====
+    # item: dict kết quả một ảnh của RoiBatchEngine (ảnh lỗi bị bỏ qua)
+    def add(self, item):
+        if item.get("error"):
+            return
+        cols = self.columns
+        n = len(item["cls"])
+        roi = item.get("roi") or [None] * 4
+        if n == 0:
+            # ảnh không có xe: một dòng class_id = -1
+            cls, conf, boxes = [-1], [None], [[None] * 4]
+            n = 1
+        else:
+            cls, conf, boxes = item["cls"], item["conf"], item["boxes"]
+        cols["image"].extend([item["path"]] * n)
+        cols["timestamp"].extend([item.get("timestamp")] * n)
+        cols["class_id"].extend(cls)
+        cols["class_name"].extend(self.names.get(c, str(c)) if c >= 0 else None for c in cls)
+        cols["conf"].extend(conf)
+        for i, key in enumerate(("x1", "y1", "x2", "y2")):
+            cols[key].extend(b[i] for b in boxes)
+        for i, key in enumerate(("roi_x1", "roi_y1", "roi_x2", "roi_y2")):
+            cols[key].extend([roi[i]] * n)
+        self.buffered += n
+        self.images += 1
+        if self.buffered >= self.chunk_rows:
+            self.flush()
+
+    # ===== flush =====
+    # Ghi khối đang giữ ra file (Parquet: một file mới), fsync rồi báo on_flush
+    def flush(self):
+        if not self.buffered:
+            return
+        getattr(self, f"_flush_{self.format}")()
+        self.rows += self.buffered
+        self.buffered = 0
+        self.columns = {c: [] for c in COLUMNS}
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def _flush_parquet(self):
+        table = pa.table({
+            "image": pa.array(self.columns["image"], pa.string()),
+            "timestamp": pa.array(self.columns["timestamp"], pa.float64()),
+            "class_id": pa.array(self.columns["class_id"], pa.int16()),
+            "class_name": pa.array(self.columns["class_name"], pa.string()),
+            "conf": pa.array(self.columns["conf"], pa.float32()),
+            **{k: pa.array(self.columns[k], pa.float32()) for k in ("x1", "y1", "x2", "y2")},
+            **{k: pa.array(self.columns[k], pa.int32()) for k in ("roi_x1", "roi_y1", "roi_x2", "roi_y2")},
+        })
+        path = self.path if not self.paths else next_part_path(self._base_path)
+        pq.write_table(table, path, compression="zstd")
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.paths.append(path)
+
+    def _flush_csv(self):
+        if self._file is None:
+            new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            self._file = open(self.path, 'a', newline='', encoding='utf-8')
+            self._csv = csv.writer(self._file)
+            if new:
+                self._csv.writerow(COLUMNS)
+            self.paths.append(self.path)
+        self._csv.writerows(zip(*(self._csv_column(c) for c in COLUMNS)))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _csv_column(self, name):
+        return ("" if v is None or (isinstance(v, float) and math.isnan(v)) else v for v in self.columns[name])
+
+    def _flush_jsonl(self):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self.paths.append(self.path)
+        lines = (json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False)
+                 for row in zip(*(self.columns[c] for c in COLUMNS)))
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    # ===== close =====
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
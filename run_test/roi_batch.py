@@ -0,0 +1,258 @@
+import os
+import sys
+import time
+import glob
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import cv2
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, "..", "web_test", "project"))
+from postprocess import box_arrays
+from backends import Boxes, Detections
+from detection_cache import image_hash
+
+#======================================
+# ROI BATCH ENGINE - detect trong ROI cho cả thư mục ảnh
+#======================================
+# Process pool đọc + crop ROI song song (cv2.imread giải nén JPEG là phần tốn CPU),
+# crop đi thẳng vào model theo batch trong bộ nhớ (không ghi file _roi tạm), kết
+# quả được trả ra ngay khi xong từng batch; vẽ box + ghi ảnh / nhãn ở thread nền.
+#
+# Đầu ra giống model.predict(save=True, save_txt=True, save_conf=True) trước đây:
+#   <out_dir>/<tên>_roi.jpg           ảnh crop đã vẽ box
+#   <out_dir>/labels/<tên>_roi.txt    "cls cx cy w h conf" (chuẩn hoá theo crop)
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+
+# ===== roi_box =====
+# ROI (x1, y1, x2, y2) → box pixel trong ảnh w x h (kẹp vào ảnh)
+# relative=True: ROI tính theo tỉ lệ 0..1 của ảnh
+def roi_box(roi, w, h, relative=False):
+    if roi is None:
+        return 0, 0, w, h
+    x1, y1, x2, y2 = roi
+    if relative:
+        x1, x2 = x1 * w, x2 * w
+        y1, y2 = y1 * h, y2 * h
+    x1, x2 = sorted((int(x1), int(x2)))
+    y1, y2 = sorted((int(y1), int(y2)))
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(w, x2), min(h, y2)
+    if x2 <= x1 or y2 <= y1:
+        return 0, 0, w, h
+    return x1, y1, x2, y2
+
+
+# ===== _init_worker =====
+# Mỗi process chỉ dùng 1 thread OpenCV, song song bằng số process
+def _init_worker():
+    cv2.setNumThreads(1)
+
+
+# ===== load_roi =====
+# Chạy trong process con: đọc ảnh + crop ROI → (path, crop, box ROI pixel, mtime ảnh, hash crop, lỗi)
+# with_hash: tính luôn hash nội dung crop cho DetectionCache (song song ở process con)
+def load_roi(path, roi, relative=False, with_hash=False):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        return path, None, None, mtime, None, "cannot read image"
+    h, w = img.shape[:2]
+    box = roi_box(roi, w, h, relative)
+    x1, y1, x2, y2 = box
+    # copy để chỉ gửi phần crop về process chính
+    crop = np.ascontiguousarray(img[y1:y2, x1:x2])
+    return path, crop, box, mtime, image_hash(crop) if with_hash and crop.size else None, None
+
+
+# ===== list_images =====
+# Thư mục → danh sách ảnh (sắp xếp), hoặc glob / một file
+def list_images(target):
+    if os.path.isdir(target):
+        paths = [os.path.join(target, f) for f in os.listdir(target)]
+    else:
+        paths = glob.glob(target)
+    return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTS))
+
+
+# ===== output_paths =====
+def output_paths(out_dir, image_path):
+    base, ext = os.path.splitext(os.path.basename(image_path))
+    return (os.path.join(out_dir, f"{base}_roi{ext}"),
+            os.path.join(out_dir, "labels", f"{base}_roi.txt"))
+
+
+# ===== save_outputs =====
+# Ghi ảnh đã vẽ box + file nhãn YOLO cho một crop
+def save_outputs(result, crop, xyxy, conf, cls, image_path, out_dir, save_image=True, save_txt=True):
+    img_path, txt_path = output_paths(out_dir, image_path)
+    if save_image:
+        try:
+            img_out = result.plot()
+        except Exception:
+            img_out = crop
+        cv2.imwrite(img_path, img_out)
+    if save_txt:
+        h, w = crop.shape[:2]
+        cxcy = (xyxy[:, :2] + xyxy[:, 2:]) / 2
+        wh = xyxy[:, 2:] - xyxy[:, :2]
+        norm = np.concatenate([cxcy, wh], axis=1) / np.array([w, h, w, h], np.float32)
+        with open(txt_path, 'w', encoding='utf-8') as f:
+            for c, box, p in zip(cls, norm, conf):
+                f.write(f"{int(c)} {box[0]:g} {box[1]:g} {box[2]:g} {box[3]:g} {p:g}\n")
+
+
+class RoiBatchEngine:
+    # ===== __init__ =====
+    # model: backend (backends.load_backend) hoặc YOLO của ultralytics, gọi model(list ảnh, conf=, iou=)
+    # roi: (x1, y1, x2, y2) pixel ảnh gốc, hoặc tỉ lệ 0..1 nếu relative=True; None = cả ảnh
+    # batch_size: số crop mỗi lần gọi model; workers: số process đọc + crop
+    # out_dir: None = không ghi ảnh / nhãn, chỉ trả kết quả
+    # cache: DetectionCache (tuỳ chọn) + model_hash = detection_cache.weights_fingerprint(...)
+    def __init__(self, model, roi=None, relative=False, batch_size=16, workers=None,
+                 conf=0.25, iou=0.7, out_dir=None, save_image=True, save_txt=True,
+                 num_classes=None, prefetch=2, writer_threads=2, cache=None, model_hash=""):
+        self.model = model
+        self.cache = cache
+        self.model_hash = model_hash
+        self.roi = roi
+        self.relative = relative
+        self.batch_size = max(1, int(batch_size))
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self.conf = conf
+        self.iou = iou
+        self.out_dir = out_dir
+        self.save_image = save_image
+        self.save_txt = save_txt
+        names = getattr(model, "names", None) or {}
+        self.names = names
+        self.num_classes = num_classes or len(names) or 6
+        # số ảnh đang đọc tối đa: đủ để process pool luôn bận trong lúc model chạy
+        self.max_pending = max(self.batch_size, self.workers) * max(1, prefetch)
+        self.writer_threads = max(1, writer_threads)
+        self.stats = {"images": 0, "errors": 0, "batches": 0, "cache_hits": 0,
+                      "infer_seconds": 0.0, "seconds": 0.0}
+
+    # ===== run =====
+    # Generator: trả dict kết quả của từng ảnh khi batch chứa ảnh đó xong và file
+    # ảnh / nhãn của nó đã ghi xong (thứ tự theo lúc đọc xong, không nhất thiết theo thứ tự paths).
+    # Ghi file lỗi → item["error"] được đặt (manifest không đánh dấu ảnh đó là xong)
+    def run(self, paths):
+        t0 = time.perf_counter()
+        if self.out_dir:
+            os.makedirs(os.path.join(self.out_dir, "labels") if self.save_txt else self.out_dir, exist_ok=True)
+        paths = iter(paths)
+        pending = set()
+        batch = []
+        writes = deque()
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as pool, \
+                ThreadPoolExecutor(max_workers=self.writer_threads) as writer:
+
+            def refill():
+                while len(pending) < self.max_pending:
+                    path = next(paths, None)
+                    if path is None:
+                        return
+                    pending.add(pool.submit(load_roi, path, self.roi, self.relative, self.cache is not None))
+
+            refill()
+            while pending or batch:
+                if pending:
+                    done, _ = wait(pending, timeout=0 if len(batch) >= self.batch_size else None,
+                                   return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        pending.discard(fut)
+                        path, crop, box, mtime, chash, error = fut.result()
+                        if error is not None or crop.size == 0:
+                            self.stats["errors"] += 1
+                            yield {"path": path, "error": error or "empty ROI"}
+                            continue
+                        batch.append((path, crop, box, mtime, chash))
+                    refill()
+                # đủ batch, hoặc đã đọc hết ảnh → chạy model
+                if len(batch) >= self.batch_size or (batch and not pending):
+                    chunk, batch = batch[:self.batch_size], batch[self.batch_size:]
+                    for item in self._infer(chunk, writer, writes):
+                        yield item
+            while writes:
+                yield self._drain(writes)
+        self.stats["seconds"] = time.perf_counter() - t0
+
+    # ===== _drain =====
+    # Chờ job ghi cũ nhất, trả item của nó; lỗi ghi file không dừng cả lượt chạy
+    def _drain(self, writes):
+        fut, item = writes.popleft()
+        try:
+            fut.result()
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"ROI save error: {e}")
+            item["error"] = f"save failed: {e}"
+        return item
+
+    # ===== _predict =====
+    # Kết quả cho một batch crop: lấy từ cache nếu có, chỉ đưa crop chưa gặp vào model
+    def _predict(self, chunk):
+        results = [None] * len(chunk)
+        keys = [None] * len(chunk)
+        miss = list(range(len(chunk)))
+        if self.cache is not None:
+            miss = []
+            for i, (_, crop, box, _, chash) in enumerate(chunk):
+                keys[i] = self.cache.make_key(chash, self.model_hash, self.conf, self.iou, box)
+                value = self.cache.get(keys[i])
+                if value is None:
+                    miss.append(i)
+                else:
+                    results[i] = Detections(crop, Boxes(*value), self.names)
+                    self.stats["cache_hits"] += 1
+        if miss:
+            t0 = time.perf_counter()
+            fresh = self.model([chunk[i][1] for i in miss], conf=self.conf, iou=self.iou)
+            self.stats["infer_seconds"] += time.perf_counter() - t0
+            self.stats["batches"] += 1
+            for i, result in zip(miss, fresh):
+                results[i] = result
+                if self.cache is not None:
+                    self.cache.put(keys[i], *box_arrays(result))
+        return results
+
+    # ===== _infer =====
+    # Chạy model cho một batch crop, gửi việc ghi file cho writer; ảnh có ghi file
+    # chỉ được trả ra sau khi job ghi của nó xong (xem _drain)
+    def _infer(self, chunk, writer, writes):
+        results = self._predict(chunk)
+        for (path, crop, box, mtime, _), result in zip(chunk, results):
+            ox, oy = box[0], box[1]
+            xyxy, conf, cls = box_arrays(result)
+            valid = (cls >= 0) & (cls < self.num_classes)
+            counts = np.bincount(cls[valid], minlength=self.num_classes)
+            self.stats["images"] += 1
+            item = {
+                "path": path,
+                "counts": counts.tolist(),
+                "total_vehicles": int(counts.sum()),
+                # box theo toạ độ ảnh gốc
+                "boxes": (xyxy + np.array([ox, oy, ox, oy])).round(1).tolist(),
+                "conf": conf.astype(np.float64).round(4).tolist(),
+                "cls": cls.tolist(),
+                "roi": list(box),
+                "timestamp": mtime,
+                "error": None,
+            }
+            if self.out_dir and (self.save_image or self.save_txt):
+                writes.append((writer.submit(save_outputs, result, crop, xyxy, conf, cls, path,
+                                             self.out_dir, self.save_image, self.save_txt), item))
+            else:
+                yield item
+        # giới hạn số ảnh chờ ghi (mỗi job giữ một crop trong bộ nhớ), trả các ảnh đã ghi xong
+        while len(writes) > self.max_pending:
+            yield self._drain(writes)
+        while writes and writes[0][0].done():
+            yield self._drain(writes)
@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, "..", "web_test", "project"))
+from backends import load_backend, BACKEND_FILES
+from roi_batch import RoiBatchEngine, list_images
+from results_sink import ResultsSink
+from detection_cache import DetectionCache, weights_fingerprint
+
+#======================================
+# ROI CLI - detect trong ROI không cần GUI, chạy tiếp được khi bị ngắt
+#======================================
+# Ví dụ:
+#   python run_test/roi_cli.py archive/2024-05/ --roi 320,180,1600,1000 --batch 16 --workers 8
+#   python run_test/roi_cli.py "archive/*/cam1_*.jpg" --roi 0,0,1280,720 --no-images \
+#       --results run_test/roi_predict/detections.parquet
+#
+# ROI tính theo pixel ảnh gốc. Mỗi ảnh xong (file ảnh / nhãn đã ghi xong) được ghi
+# một dòng path / status / counts vào manifest (<out>/manifest.jsonl); chạy lại cùng
+# lệnh sẽ bỏ qua các ảnh status "ok" trong manifest.
+# Dòng đầu manifest lưu cấu hình (ROI, conf, iou, weights); đổi cấu hình thì phải
+# chạy với --restart để không trộn kết quả cũ và mới.
+# --results: ghi mọi box vào một file .parquet / .csv / .jsonl (results_sink.py);
+# khi đó mặc định không ghi file nhãn .txt cho từng ảnh (bật lại bằng --txt).
+# --cache DIR: chạy lại trên cùng kho ảnh (cùng ROI, weights, conf, iou) lấy box
+# từ cache theo hash nội dung crop, không chạy model (vd. sau --restart).
+
+DEFAULT_WEIGHTS = os.path.join(BASE_DIR, "../../runs/detect/my_yolov8n_train_meme/weights/best.pt")
+if not os.path.exists(DEFAULT_WEIGHTS):
+    DEFAULT_WEIGHTS = "runs/detect/my_yolov8n_train_meme/weights/best.pt"
+DEFAULT_OUTPUT = os.path.join(BASE_DIR, "roi_predict")
+MANIFEST_NAME = "manifest.jsonl"
+
+
+class Manifest:
+    """ File JSONL ghi kết quả từng ảnh; dùng để chạy tiếp sau khi bị ngắt """
+
+    # ===== __init__ =====
+    # config: dict cấu hình của lượt chạy (so với dòng đầu của manifest cũ)
+    # sync_every: fsync sau mỗi bấy nhiêu dòng
+    def __init__(self, path, config, restart=False, sync_every=64):
+        self.path = path
+        self.config = config
+        self.sync_every = max(1, sync_every)
+        self.done = set()
+        self._unsynced = 0
+        if restart and os.path.exists(path):
+            os.replace(path, path + ".old")
+        if os.path.exists(path):
+            self._load()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        fresh = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', encoding='utf-8')
+        if fresh:
+            self._write({"config": config})
+
+    # ===== _load =====
+    # Đọc manifest cũ; dòng cuối ghi dở (bị ngắt giữa chừng) được bỏ qua
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if i == 0 and "config" in entry:
+                    if entry["config"] != self.config:
+                        raise ValueError(f"{self.path} was written with a different config "
+                                         f"({entry['config']}); use --restart to start over")
+                    continue
+                if not entry.get("error"):
+                    self.done.add(entry.get("path"))
+
+    # ===== _write =====
+    def _write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            os.fsync(self.file.fileno())
+            self._unsynced = 0
+
+    # ===== record =====
+    # Chỉ ghi path / trạng thái / số xe; box đầy đủ nằm trong file --results
+    def record(self, item):
+        self._write({
+            "path": item["path"],
+            "status": "error" if item.get("error") else "ok",
+            "counts": item.get("counts"),
+            "total_vehicles": item.get("total_vehicles"),
+            "error": item.get("error"),
+        })
+        if not item.get("error"):
+            self.done.add(item["path"])
+
+    # ===== close =====
+    def close(self):
+        if not self.file.closed:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+
+# ===== parse_roi =====
+# "x1,y1,x2,y2" → tuple số nguyên (pixel ảnh gốc)
+def parse_roi(text):
+    if not text:
+        return None
+    parts = [p for p in text.replace(" ", "").split(",") if p]
+    if len(parts) != 4:
+        raise ValueError(f"ROI must be x1,y1,x2,y2, got {text!r}")
+    return tuple(int(float(p)) for p in parts)
+
+
+# ===== run_roi_detection =====
+# API dùng được từ code khác: detect trong ROI cho thư mục / glob, có checkpoint
+# on_result(item): gọi cho mỗi ảnh xong (kể cả ảnh lỗi)
+def run_roi_detection(target, roi=None, batch_size=16, workers=None, conf=0.25, iou=0.7,
+                      backend="torch", weights=DEFAULT_WEIGHTS, out_dir=DEFAULT_OUTPUT,
+                      save_images=True, save_txt=True, manifest_path=None, restart=False,
+                      threads=None, model=None, on_result=None, results_path=None, chunk_rows=50000,
+                      cache_dir=None, cache_mb=512):
+    config = {
+        "roi": list(roi) if roi else None,
+        "conf": conf,
+        "iou": iou,
+        "backend": backend,
+        # nội dung weights (không chỉ tên file): hai best.pt khác nhau là hai lượt chạy khác nhau
+        "weights": weights_fingerprint(weights, backend) if os.path.exists(weights) else os.path.abspath(weights),
+    }
+    manifest = Manifest(manifest_path or os.path.join(out_dir, MANIFEST_NAME), config, restart)
+    sink = None
+    pending = []             # ảnh đã detect nhưng kết quả còn trong bộ nhớ của sink
+    try:
+        # đường dẫn tuyệt đối: chạy lại từ thư mục khác vẫn khớp manifest
+        paths = [os.path.abspath(p) for p in list_images(target)]
+        todo = [p for p in paths if p not in manifest.done]
+        print(f"{len(paths)} images, {len(paths) - len(todo)} already done, {len(todo)} to process")
+        if not todo:
+            return {"images": 0, "errors": 0, "skipped": len(paths), "seconds": 0.0}
+        if model is None:
+            model = load_backend(backend, weights, threads=threads)
+        cache = model_hash = None
+        if cache_dir:
+            cache = DetectionCache(cache_dir, max_bytes=int(cache_mb * 1024 * 1024))
+            model_hash = weights_fingerprint(weights, backend)
+        if results_path:
+            # manifest chỉ ghi ảnh sau khi kết quả của nó đã xuống đĩa → bị kill thì các ảnh đó chạy lại
+            def record_pending():
+                for done in pending:
+                    manifest.record(done)
+                pending.clear()
+            sink = ResultsSink(results_path, names=getattr(model, "names", None), chunk_rows=chunk_rows,
+                               on_flush=record_pending)
+        engine = RoiBatchEngine(model, roi=roi, batch_size=batch_size, workers=workers,
+                                conf=conf, iou=iou, out_dir=out_dir,
+                                save_image=save_images, save_txt=save_txt,
+                                cache=cache, model_hash=model_hash)
+        for item in engine.run(todo):
+            if sink is not None:
+                pending.append(item)
+                sink.add(item)
+            else:
+                manifest.record(item)
+            if on_result is not None:
+                on_result(item)
+        stats = dict(engine.stats)
+        stats["skipped"] = len(paths) - len(todo)
+        if sink is not None:
+            stats["results"] = sink.paths or [sink.path]     # parquet: một file cho mỗi khối
+        if cache is not None:
+            stats["cache"] = cache.stats()
+        return stats
+    finally:
+        # khi bị ngắt (Ctrl+C) vẫn ghi nốt khối kết quả đang giữ trong bộ nhớ
+        if sink is not None:
+            sink.close()
+            # ảnh lỗi (không có dòng trong sink) còn lại sau lần flush cuối
+            for done in pending:
+                manifest.record(done)
+        manifest.close()
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless ROI vehicle detection over an image folder / glob")
+    parser.add_argument("target", help="image folder or glob pattern (quote it)")
+    parser.add_argument("--roi", default=None, help="x1,y1,x2,y2 in source image pixels (default: whole image)")
+    parser.add_argument("--batch", type=int, default=16, help="crops per model call")
+    parser.add_argument("--workers", type=int, default=0, help="decode/crop processes (0 = CPU count)")
+    parser.add_argument("--threads", type=int, default=0, help="inference threads (0 = CPU count)")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.7)
+    parser.add_argument("--backend", default=os.environ.get("YOLO_BACKEND", "torch"), choices=sorted(BACKEND_FILES))
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="output folder (annotated crops, labels/, manifest)")
+    parser.add_argument("--manifest", default=None, help="checkpoint manifest path (default: <out>/manifest.jsonl)")
+    parser.add_argument("--restart", action="store_true", help="ignore the existing manifest and start over")
+    parser.add_argument("--no-images", action="store_true", help="do not write annotated crops")
+    parser.add_argument("--txt", action=argparse.BooleanOptionalAction, default=None,
+                        help="write per-image YOLO label files (default: on unless --results is given)")
+    parser.add_argument("--results", default=None, help="detections table: .parquet (needs pyarrow), .csv or .jsonl")
+    parser.add_argument("--cache", default=None, help="detection cache folder (reuse boxes for unchanged crops)")
+    parser.add_argument("--cache-mb", type=float, default=512, help="max detection cache size on disk (MB)")
+    parser.add_argument("--chunk-rows", type=int, default=50000, help="rows buffered per results chunk")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    state = {"n": 0}
+
+    def progress(item):
+        state["n"] += 1
+        if args.quiet:
+            return
+        name = os.path.basename(item["path"])
+        if item.get("error"):
+            print(f"[{state['n']}] {name}: ERROR {item['error']}")
+        else:
+            print(f"[{state['n']}] {name}: {item['total_vehicles']} vehicles {item['counts']}")
+
+    try:
+        stats = run_roi_detection(
+            args.target, roi=parse_roi(args.roi), batch_size=args.batch, workers=args.workers or None,
+            conf=args.conf, iou=args.iou, backend=args.backend, weights=args.weights, out_dir=args.out,
+            save_images=not args.no_images, save_txt=args.txt if args.txt is not None else not args.results,
+            manifest_path=args.manifest, restart=args.restart, threads=args.threads or None,
+            on_result=progress, results_path=args.results, chunk_rows=args.chunk_rows,
+            cache_dir=args.cache, cache_mb=args.cache_mb)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted after {state['n']} images; run the same command again to resume")
+        return 130
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+    elapsed = time.perf_counter() - t0
+    print(f"Done: {stats['images']} images, {stats['errors']} errors, {stats['skipped']} skipped "
+          f"in {elapsed:.1f}s ({stats['images'] / max(elapsed, 1e-9):.1f} img/s)")
+    if stats.get("cache"):
+        c = stats["cache"]
+        print(f"Cache: {c['hits']} hits ({c['hits_memory']} memory, {c['hits_disk']} disk), "
+              f"{c['misses']} misses, hit rate {c['hit_rate']:.1%}, {c['disk_bytes'] / 1e6:.1f} MB on disk")
+    if stats.get("results"):
+        print(f"Detections written to {', '.join(stats['results'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,19 @@
 import os
+import sys
 import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
-from ultralytics import YOLO
 from PIL import Image, ImageTk, ImageDraw
 import csv
 import glob
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# dùng chung module backend với web app
+sys.path.insert(0, os.path.join(BASE_DIR, "..", "web_test", "project"))
+from backends import load_backend
+from roi_batch import RoiBatchEngine, list_images
+from results_sink import ResultsSink
+from detection_cache import DetectionCache, weights_fingerprint
 
 # =============================
 # Load YOLO model path
@@ -16,6 +22,20 @@ model_path = os.path.join(BASE_DIR, "../../runs/detect/my_yolov8n_train_meme/wei
 
 if not os.path.exists(model_path):
     model_path = "runs/detect/my_yolov8n_train_meme/weights/best.pt"
+# Backend: torch | onnx | onnx-int8 | openvino | openvino-int8 (giống web app)
+INFER_BACKEND = os.environ.get("YOLO_BACKEND", "torch")
+# Batch engine: số crop mỗi lần gọi model, số process đọc + crop ảnh (0 = số CPU)
+ROI_BATCH_SIZE = int(os.environ.get("YOLO_ROI_BATCH", "16"))
+ROI_WORKERS = int(os.environ.get("YOLO_ROI_WORKERS", "0")) or None
+OUTPUT_DIR = os.path.join(BASE_DIR, "roi_predict")
+# File bảng kết quả (.parquet / .csv / .jsonl); đặt thì không ghi nhãn .txt từng ảnh nữa
+RESULTS_PATH = os.environ.get("YOLO_ROI_RESULTS", "")
+ROI_SAVE_IMAGES = os.environ.get("YOLO_ROI_SAVE_IMAGES", "1") == "1"   # ảnh crop đã vẽ box
+# Thư mục cache detection (chạy lại cùng ROI + weights không phải inference lại); rỗng = tắt
+ROI_CACHE_DIR = os.environ.get("YOLO_ROI_CACHE", "")
+ROI_CACHE_MB = float(os.environ.get("YOLO_ROI_CACHE_MB", "512"))
+# Kích thước ảnh preview trên GUI (ROI vẽ theo toạ độ preview)
+PREVIEW_W, PREVIEW_H = 500, 400
 # =============================
 
 
@@ -54,7 +74,7 @@ def show_image(img_path, img_label):
     loaded_preview_path = img_path
 
     img = Image.open(img_path)
-    img = img.resize((500, 400))
+    img = img.resize((PREVIEW_W, PREVIEW_H))
     img = draw_roi_on_preview(img)
 
     img_tk = ImageTk.PhotoImage(img)
@@ -63,30 +83,14 @@ def show_image(img_path, img_label):
 
 
 # -----------------------------
-# CROP ROI
+# ROI PREVIEW → TỈ LỆ ẢNH GỐC
 # -----------------------------
-def crop_roi(image_path):
-    img = Image.open(image_path)
-    w, h = img.size
+# ROI vẽ trên preview → (x1, y1, x2, y2) theo tỉ lệ 0..1, mỗi ảnh tự nhân theo kích thước của nó
+# (chạy không cần GUI, ROI theo pixel ảnh gốc: xem roi_cli.py)
+def roi_relative():
+    return (ROI["x1"] / PREVIEW_W, ROI["y1"] / PREVIEW_H, ROI["x2"] / PREVIEW_W, ROI["y2"] / PREVIEW_H)
 
-    # scale lại ROI theo kích thước ảnh gốc
-    scale_x = w / 500
-    scale_y = h / 400
 
-    x1 = int(min(ROI["x1"], ROI["x2"]) * scale_x)
-    y1 = int(min(ROI["y1"], ROI["y2"]) * scale_y)
-    x2 = int(max(ROI["x1"], ROI["x2"]) * scale_x)
-    y2 = int(max(ROI["y1"], ROI["y2"]) * scale_y)
-
-    cropped = img.crop((x1, y1, x2, y2))
-
-    # tạo file mới an toàn bằng os.path.splitext
-    base, ext = os.path.splitext(image_path)
-    new_path = f"{base}_roi{ext}"
-
-    cropped.save(new_path)
-
-    return new_path
 # -----------------------------
 # CHẠY YOLO DETECT TRONG ROI
 # -----------------------------
@@ -95,33 +99,39 @@ def run_detection(folder, log_widget, img_label):
         log_widget.insert(tk.END, "🔍 Loading YOLO model...\n")
         log_widget.see(tk.END)
 
-        model = YOLO(model_path)
-        CLASS_NAMES = model.names
-
-        img_list = glob.glob(os.path.join(folder, "*.jpg")) + \
-                   glob.glob(os.path.join(folder, "*.jpeg")) + \
-                   glob.glob(os.path.join(folder, "*.png"))
-
-        os.makedirs("runs/detect/roi_predict", exist_ok=True)
-
-        for img_path in img_list:
-            log_widget.insert(tk.END, f"🟦 ROI detect: {os.path.basename(img_path)}\n")
+        model = load_backend(INFER_BACKEND, model_path)
+
+        img_list = list_images(folder)
+
+        # đọc + crop song song, detect theo batch trong bộ nhớ, ghi kết quả ở thread nền
+        sink = ResultsSink(RESULTS_PATH, names=model.names) if RESULTS_PATH else None
+        cache = DetectionCache(ROI_CACHE_DIR, max_bytes=int(ROI_CACHE_MB * 1024 * 1024)) if ROI_CACHE_DIR else None
+        engine = RoiBatchEngine(model, roi=roi_relative(), relative=True,
+                                batch_size=ROI_BATCH_SIZE, workers=ROI_WORKERS, out_dir=OUTPUT_DIR,
+                                save_image=ROI_SAVE_IMAGES, save_txt=sink is None, cache=cache,
+                                model_hash=weights_fingerprint(model_path, INFER_BACKEND) if cache else "")
+        for item in engine.run(img_list):
+            if sink is not None:
+                sink.add(item)
+            name = os.path.basename(item["path"])
+            if item["error"]:
+                log_widget.insert(tk.END, f"⚠️ {name}: {item['error']}\n")
+            else:
+                log_widget.insert(tk.END, f"🟦 ROI detect: {name} → {item['total_vehicles']} xe\n")
             log_widget.see(tk.END)
 
-            roi_img_path = crop_roi(img_path)
-
-            model.predict(
-                source=roi_img_path,
-                save=True,
-                save_txt=True,
-                save_conf=True,
-                project="run_test",
-                name="roi_predict",
-                exist_ok=True
-            )
+        if sink is not None:
+            sink.close()
+            log_widget.insert(tk.END, f"\n📄 Kết quả: {', '.join(sink.paths) or sink.path} ({sink.rows} dòng)\n")
+        stats = engine.stats
+        if cache is not None:
+            c = cache.stats()
+            log_widget.insert(tk.END, f"♻️ Cache: {c['hits']} hit / {c['misses']} miss\n")
+        log_widget.insert(tk.END, f"\n⏱ {stats['images']} ảnh / {stats['seconds']:.1f}s "
+                                  f"({stats['images'] / max(stats['seconds'], 1e-9):.1f} ảnh/s)\n")
 
         # Hiển thị ảnh detect cuối
-        out_imgs = glob.glob("run_test/detect/roi_predict/*.jpg")
+        out_imgs = sorted(glob.glob(os.path.join(OUTPUT_DIR, "*.jpg")), key=os.path.getmtime)
         if out_imgs:
             show_image(out_imgs[-1], img_label)
         log_widget.insert(tk.END, "\n✅ Hoàn thành detect trong ROI!\n")
@@ -0,0 +1,414 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import yaml
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+#======================================
+# DATASET INDEX - quét ảnh + nhãn YOLO một lần, lưu index dạng .npy (mmap được)
+#======================================
+# python train/dataset_index.py "train/vehicle dataset/data.yaml"        # tạo / cập nhật index
+# python train/dataset_index.py "train/vehicle dataset/data.yaml" --rebuild
+#
+# Mỗi split (train / val) có một thư mục index cạnh thư mục ảnh (<split>/.index/):
+#   images.npy   mảng có cấu trúc: kích thước + mtime ảnh / nhãn, width, height,
+#                vị trí box trong boxes.npy, trạng thái nhãn
+#   boxes.npy    float32 (N, 5): cls, x, y, w, h (chuẩn hoá như file nhãn)
+#   names.npy    tên file ảnh (tương đối theo thư mục ảnh)
+#   meta.json    nc, names, thống kê theo lớp, kích thước ảnh, lỗi nhãn
+# Nạp lại bằng np.load(mmap_mode="r") nên gần như tức thời; chạy lại chỉ quét ảnh /
+# nhãn có kích thước hoặc mtime thay đổi. Đường dẫn trong data.yaml được tính theo
+# thư mục chứa data.yaml (đường dẫn tuyệt đối kiểu C:/Users/... không tồn tại thì
+# tìm phần đuôi tương ứng cạnh data.yaml).
+
+INDEX_VERSION = 1
+INDEX_DIR = ".index"
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# trạng thái nhãn của từng ảnh
+STATUS_OK = 0
+STATUS_MISSING = 1      # không có file nhãn → ảnh nền
+STATUS_EMPTY = 2        # file nhãn rỗng
+STATUS_CORRUPT = 3      # dòng sai định dạng / ngoài khoảng → bỏ dòng đó
+STATUS_BAD_IMAGE = 4    # không đọc được ảnh
+
+STATUS_NAMES = {STATUS_OK: "ok", STATUS_MISSING: "missing", STATUS_EMPTY: "empty",
+                STATUS_CORRUPT: "corrupt", STATUS_BAD_IMAGE: "bad_image"}
+
+IMAGE_DTYPE = np.dtype([
+    ("size", np.int64), ("mtime_ns", np.int64),
+    ("label_size", np.int64), ("label_mtime_ns", np.int64),
+    ("width", np.int32), ("height", np.int32),
+    ("box_start", np.int64), ("box_count", np.int32),
+    ("status", np.int8),
+])
+
+
+# ===== resolve_data_path =====
+# Đường dẫn trong data.yaml → đường dẫn thật, tính theo thư mục chứa yaml
+def resolve_data_path(value, yaml_dir, root=None):
+    if not value:
+        return None
+    value = str(value).replace("\\", "/")
+    base = root or yaml_dir
+    candidate = value if os.path.isabs(value) or value[1:3] == ":/" else os.path.join(base, value)
+    if os.path.exists(candidate):
+        return os.path.normpath(candidate)
+    # đường dẫn tuyệt đối của máy khác: thử các phần đuôi (".../train/images", "train/images", ...)
+    parts = [p for p in value.split("/") if p and not p.endswith(":")]
+    for i in range(len(parts)):
+        tail = os.path.join(yaml_dir, *parts[i:])
+        if len(parts) - i >= 2 and os.path.exists(tail):
+            return os.path.normpath(tail)
+    return os.path.normpath(candidate)
+
+
+# ===== load_data_yaml =====
+# → dict data.yaml với train / val / test đã thành đường dẫn thật, names dạng list
+def load_data_yaml(yaml_path):
+    yaml_path = os.path.abspath(yaml_path)
+    yaml_dir = os.path.dirname(yaml_path)
+    with open(yaml_path, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f) or {}
+    root = resolve_data_path(data["path"], yaml_dir) if data.get("path") else None
+    for split in ("train", "val", "test"):
+        if data.get(split):
+            data[split] = resolve_data_path(data[split], yaml_dir, root)
+    names = data.get("names") or []
+    if isinstance(names, dict):
+        names = [names[k] for k in sorted(names)]
+    data["names"] = list(names)
+    data["nc"] = int(data.get("nc") or len(names))
+    data["yaml_path"] = yaml_path
+    return data
+
+
+# ===== write_resolved_yaml =====
+# Ghi bản data.yaml dùng được trên máy này (path tuyệt đối + train/val tương đối)
+def write_resolved_yaml(yaml_path, out_path):
+    data = load_data_yaml(yaml_path)
+    root = os.path.dirname(data["yaml_path"])
+    out = {"path": root, "nc": data["nc"], "names": data["names"]}
+    for split in ("train", "val", "test"):
+        if data.get(split):
+            out[split] = os.path.relpath(data[split], root)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(out, f, allow_unicode=True, sort_keys=False)
+    return out_path
+
+
+# ===== label_path_for =====
+# Quy ước ultralytics: .../images/x.jpg → .../labels/x.txt
+def label_path_for(image_path):
+    head, name = os.path.split(image_path)
+    parent, leaf = os.path.split(head)
+    label_dir = os.path.join(parent, "labels") if leaf == "images" else head
+    return os.path.join(label_dir, os.path.splitext(name)[0] + ".txt")
+
+
+# ===== image_size =====
+# Chỉ đọc header (PIL) nếu có, không thì giải mã bằng OpenCV
+def image_size(path):
+    if Image is not None:
+        with Image.open(path) as im:
+            return im.size
+    import cv2
+    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError("cannot decode image")
+    return img.shape[1], img.shape[0]
+
+
+# ===== parse_label =====
+# Đọc + kiểm tra file nhãn YOLO → (mảng (n, 5) float32, trạng thái, thông báo lỗi)
+def parse_label(path, nc):
+    if not os.path.exists(path):
+        return np.zeros((0, 5), np.float32), STATUS_MISSING, None
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        rows = [line.split() for line in f if line.strip()]
+    if not rows:
+        return np.zeros((0, 5), np.float32), STATUS_EMPTY, None
+    good, problems = [], []
+    for i, row in enumerate(rows):
+        if len(row) != 5:
+            # nhãn segment (cls x1 y1 x2 y2 ...) không dùng cho detect
+            problems.append(f"line {i + 1}: {len(row)} columns")
+            continue
+        try:
+            values = [float(v) for v in row]
+        except ValueError:
+            problems.append(f"line {i + 1}: not a number")
+            continue
+        good.append(values)
+    boxes = np.array(good, np.float32).reshape(-1, 5)
+    if len(boxes):
+        cls_ok = (boxes[:, 0] >= 0) & (boxes[:, 0] < nc) & (boxes[:, 0] == np.round(boxes[:, 0]))
+        xy_ok = ((boxes[:, 1:3] >= 0) & (boxes[:, 1:3] <= 1)).all(axis=1)
+        wh_ok = ((boxes[:, 3:5] > 0) & (boxes[:, 3:5] <= 1.0001)).all(axis=1)
+        valid = cls_ok & xy_ok & wh_ok
+        if not valid.all():
+            problems.append(f"{int((~cls_ok).sum())} bad class, {int((~(xy_ok & wh_ok)).sum())} out of range")
+        boxes = boxes[valid]
+        # dòng trùng lặp (hay gặp khi gộp dataset)
+        uniq = np.unique(boxes, axis=0)
+        if len(uniq) < len(boxes):
+            problems.append(f"{len(boxes) - len(uniq)} duplicate rows")
+            boxes = uniq
+    status = STATUS_CORRUPT if problems else STATUS_OK
+    return boxes, status, "; ".join(problems) or None
+
+
+# ===== scan_one =====
+# Chạy trong process con: kích thước ảnh + nhãn đã kiểm tra của một ảnh
+def scan_one(args):
+    image_path, nc = args
+    try:
+        width, height = image_size(image_path)
+    except Exception as e:
+        return 0, 0, np.zeros((0, 5), np.float32), STATUS_BAD_IMAGE, f"image: {e}"
+    boxes, status, message = parse_label(label_path_for(image_path), nc)
+    return width, height, boxes, status, message
+
+
+# ===== _stat =====
+def _stat(path):
+    try:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return -1, 0
+
+
+class DatasetIndex:
+    """ Index của một split: images (có cấu trúc), boxes, names; mở bằng mmap """
+
+    def __init__(self, image_dir, names, images, boxes, meta):
+        self.image_dir = image_dir
+        self.names = names            # tên file ảnh (tương đối theo image_dir)
+        self.images = images
+        self.boxes = boxes
+        self.meta = meta
+
+    def __len__(self):
+        return len(self.images)
+
+    # ===== image_path / labels =====
+    def image_path(self, i):
+        return os.path.join(self.image_dir, str(self.names[i]))
+
+    def labels(self, i):
+        start, count = int(self.images["box_start"][i]), int(self.images["box_count"][i])
+        return self.boxes[start:start + count]
+
+    # ===== class_counts =====
+    # Số instance theo lớp (vector hoá trên toàn bộ boxes)
+    def class_counts(self, nc=None):
+        nc = nc or self.meta.get("nc", 0)
+        return np.bincount(self.boxes[:, 0].astype(np.int64), minlength=nc)[:nc] if len(self.boxes) \
+            else np.zeros(nc, np.int64)
+
+    # ===== index_dir =====
+    @staticmethod
+    def index_dir(image_dir):
+        return os.path.join(os.path.dirname(os.path.normpath(image_dir)), INDEX_DIR)
+
+    # ===== load =====
+    # Mở index đã có (mmap); None nếu chưa có / khác phiên bản
+    @classmethod
+    def load(cls, image_dir, mmap=True):
+        idx_dir = cls.index_dir(image_dir)
+        meta_path = os.path.join(idx_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            return None
+        mode = "r" if mmap else None
+        try:
+            images = np.load(os.path.join(idx_dir, "images.npy"), mmap_mode=mode)
+            boxes = np.load(os.path.join(idx_dir, "boxes.npy"), mmap_mode=mode)
+            names = np.load(os.path.join(idx_dir, "names.npy"), mmap_mode=mode)
+        except (OSError, ValueError):
+            return None
+        return cls(image_dir, names, images, boxes, meta)
+
+    # ===== build =====
+    # Quét thư mục ảnh; ảnh + nhãn không đổi (kích thước, mtime) lấy lại từ index cũ
+    @classmethod
+    def build(cls, image_dir, nc, class_names=None, workers=None, rebuild=False, verbose=True):
+        t0 = time.perf_counter()
+        image_dir = os.path.normpath(image_dir)
+        files = sorted(e.name for e in os.scandir(image_dir)
+                       if e.is_file() and e.name.lower().endswith(IMAGE_EXTS))
+        old = None if rebuild else cls.load(image_dir, mmap=True)
+        old_rows = {}
+        if old is not None and old.meta.get("nc") == nc:
+            old_rows = {str(name): i for i, name in enumerate(old.names)}
+
+        images = np.zeros(len(files), IMAGE_DTYPE)
+        per_image = [None] * len(files)
+        messages = {}
+        todo = []
+        for i, name in enumerate(files):
+            path = os.path.join(image_dir, name)
+            size, mtime = _stat(path)
+            lsize, lmtime = _stat(label_path_for(path))
+            images[i]["size"], images[i]["mtime_ns"] = size, mtime
+            images[i]["label_size"], images[i]["label_mtime_ns"] = lsize, lmtime
+            j = old_rows.get(name)
+            if j is not None:
+                prev = old.images[j]
+                if (prev["size"], prev["mtime_ns"], prev["label_size"], prev["label_mtime_ns"]) == \
+                        (size, mtime, lsize, lmtime):
+                    images[i]["width"], images[i]["height"] = prev["width"], prev["height"]
+                    images[i]["status"] = prev["status"]
+                    per_image[i] = np.array(old.labels(j))
+                    msg = old.meta.get("problems", {}).get(name)
+                    if msg:
+                        messages[name] = msg
+                    continue
+            todo.append(i)
+
+        if todo:
+            args = [(os.path.join(image_dir, files[i]), nc) for i in todo]
+            workers = max(1, int(workers or os.cpu_count() or 1))
+            chunksize = max(1, len(args) // (workers * 8))
+            if workers == 1 or len(args) < 64:
+                scanned = map(scan_one, args)
+                pool = None
+            else:
+                pool = ProcessPoolExecutor(max_workers=workers)
+                scanned = pool.map(scan_one, args, chunksize=chunksize)
+            try:
+                for i, (width, height, boxes, status, message) in zip(todo, scanned):
+                    images[i]["width"], images[i]["height"], images[i]["status"] = width, height, status
+                    per_image[i] = boxes
+                    if message:
+                        messages[files[i]] = message
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+
+        counts = np.array([len(b) for b in per_image], np.int64)
+        images["box_count"] = counts
+        images["box_start"] = np.concatenate([[0], np.cumsum(counts)[:-1]]) if len(counts) else counts
+        boxes = np.concatenate(per_image) if per_image else np.zeros((0, 5), np.float32)
+        boxes = boxes.astype(np.float32, copy=False).reshape(-1, 5)
+        names = np.array(files, dtype=f"U{max([len(f) for f in files] + [1])}")
+
+        meta = cls._summarize(images, boxes, nc, class_names, image_dir)
+        meta["problems"] = messages
+        meta["built_seconds"] = round(time.perf_counter() - t0, 3)
+        meta["rescanned"] = len(todo)
+        cls._save(image_dir, images, boxes, names, meta)
+        if verbose:
+            print(f"{image_dir}: {len(files)} images, rescanned {len(todo)} in {meta['built_seconds']:.2f}s")
+        return cls.load(image_dir)
+
+    # ===== _summarize =====
+    # Thống kê: instance / ảnh theo lớp, trạng thái nhãn, kích thước ảnh
+    @staticmethod
+    def _summarize(images, boxes, nc, class_names, image_dir):
+        cls_ids = boxes[:, 0].astype(np.int64) if len(boxes) else np.zeros(0, np.int64)
+        instances = np.bincount(cls_ids, minlength=nc)[:nc]
+        # số ảnh chứa mỗi lớp: (ảnh, lớp) duy nhất
+        owner = np.repeat(np.arange(len(images)), images["box_count"])
+        pairs = np.unique(owner * max(nc, 1) + cls_ids) if len(cls_ids) else np.zeros(0, np.int64)
+        images_per_class = np.bincount(pairs % max(nc, 1), minlength=nc)[:nc]
+        sizes, size_counts = np.unique(np.stack([images["width"], images["height"]], axis=1), axis=0,
+                                       return_counts=True) if len(images) else (np.zeros((0, 2)), [])
+        order = np.argsort(size_counts)[::-1][:20] if len(images) else []
+        status = np.bincount(images["status"].astype(np.int64), minlength=len(STATUS_NAMES))
+        names = list(class_names or [str(i) for i in range(nc)])
+        return {
+            "version": INDEX_VERSION,
+            "image_dir": image_dir,
+            "nc": nc,
+            "names": names,
+            "images": int(len(images)),
+            "instances": int(len(boxes)),
+            "class_instances": {names[i] if i < len(names) else str(i): int(v) for i, v in enumerate(instances)},
+            "class_images": {names[i] if i < len(names) else str(i): int(v) for i, v in enumerate(images_per_class)},
+            "label_status": {STATUS_NAMES[i]: int(v) for i, v in enumerate(status) if i in STATUS_NAMES},
+            "image_sizes": [{"width": int(sizes[i][0]), "height": int(sizes[i][1]), "count": int(size_counts[i])}
+                            for i in order],
+            "boxes_per_image": {"mean": round(float(images["box_count"].mean()), 3) if len(images) else 0.0,
+                                "max": int(images["box_count"].max()) if len(images) else 0},
+        }
+
+    # ===== _save =====
+    # Ghi file tạm rồi os.replace để tiến trình khác không đọc phải index ghi dở
+    @staticmethod
+    def _save(image_dir, images, boxes, names, meta):
+        idx_dir = DatasetIndex.index_dir(image_dir)
+        os.makedirs(idx_dir, exist_ok=True)
+        for fname, arr in (("images.npy", images), ("boxes.npy", boxes), ("names.npy", names)):
+            tmp = os.path.join(idx_dir, fname + ".tmp")
+            with open(tmp, 'wb') as f:
+                np.save(f, arr)
+            os.replace(tmp, os.path.join(idx_dir, fname))
+        tmp = os.path.join(idx_dir, "meta.json.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, os.path.join(idx_dir, "meta.json"))
+
+
+# ===== index_dataset =====
+# data.yaml → {split: DatasetIndex}; mặc định dùng lại / cập nhật index có sẵn
+def index_dataset(yaml_path, splits=("train", "val"), workers=None, rebuild=False, verbose=True):
+    data = load_data_yaml(yaml_path)
+    out = {}
+    for split in splits:
+        image_dir = data.get(split)
+        if not image_dir or not os.path.isdir(image_dir):
+            if verbose:
+                print(f"Skip split '{split}': {image_dir} not found")
+            continue
+        out[split] = DatasetIndex.build(image_dir, data["nc"], data["names"], workers=workers,
+                                        rebuild=rebuild, verbose=verbose)
+    return out
+
+
+# ===== print_report =====
+def print_report(split, index):
+    meta = index.meta
+    print(f"\n===== {split}: {meta['images']} images, {meta['instances']} instances =====")
+    print(f"{'class':<12}{'instances':>10}{'images':>8}")
+    for name, n in meta["class_instances"].items():
+        print(f"{name:<12}{n:>10}{meta['class_images'].get(name, 0):>8}")
+    print("labels: " + ", ".join(f"{k}={v}" for k, v in meta["label_status"].items()))
+    sizes = ", ".join(f"{s['width']}x{s['height']} ({s['count']})" for s in meta["image_sizes"][:5])
+    print(f"image sizes: {sizes}")
+    problems = meta.get("problems") or {}
+    for name, msg in list(problems.items())[:10]:
+        print(f"  ! {name}: {msg}")
+    if len(problems) > 10:
+        print(f"  ... {len(problems) - 10} more label problems (see {DatasetIndex.index_dir(index.image_dir)}/meta.json)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index a YOLO dataset (images, labels, class stats)")
+    parser.add_argument("data", help="data.yaml")
+    parser.add_argument("--splits", nargs="+", default=["train", "val"])
+    parser.add_argument("--workers", type=int, default=0, help="scan processes (0 = CPU count)")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the existing index")
+    parser.add_argument("--resolved-yaml", default=None, help="also write a data.yaml with paths valid on this machine")
+    args = parser.parse_args(argv)
+    indexes = index_dataset(args.data, args.splits, workers=args.workers or None, rebuild=args.rebuild)
+    for split, index in indexes.items():
+        print_report(split, index)
+    if args.resolved_yaml:
+        print(f"\nWrote {write_resolved_yaml(args.data, args.resolved_yaml)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,426 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+from dataset_index import index_dataset, load_data_yaml
+
+#======================================
+# IMAGE SHARDS - ảnh đã giải mã + resize sẵn, lưu uint8 liền mạch để mmap khi train
+#======================================
+# python train/image_shards.py "train/vehicle dataset/data.yaml" --imgsz 640
+#
+# Giải mã JPEG / PNG + resize về imgsz chiếm phần lớn thời gian mỗi epoch khi train
+# CPU. Bước này làm việc đó một lần: mỗi ảnh được resize (cạnh dài = imgsz, giữ tỉ
+# lệ, giống ultralytics load_image) rồi ghi nối tiếp dạng uint8 HWC (BGR) vào các
+# file shard_XXX.bin. Thư mục <split>/.shards_<imgsz>/ gồm:
+#   shard_000.bin ...  byte ảnh thô, không header
+#   index.npy          mảng có cấu trúc: shard, offset, height, width, kích thước gốc, checksum
+#   names.npy          tên file ảnh (theo thứ tự của DatasetIndex)
+#   boxes.npy + meta.json
+# Đọc ảnh = một view np.memmap (không copy, không giải mã), nên byte ảnh giống hệt
+# nhau ở mọi epoch. Nhãn lấy từ dataset_index (toạ độ chuẩn hoá không đổi khi resize).
+
+SHARD_VERSION = 1
+DEFAULT_SHARD_MB = 1024
+
+ENTRY_DTYPE = np.dtype([
+    ("shard", np.int32), ("offset", np.int64),
+    ("height", np.int32), ("width", np.int32),
+    ("orig_height", np.int32), ("orig_width", np.int32),
+    ("checksum", np.uint8, 16),
+])
+
+
+# ===== resize_long_side =====
+# Resize giữ tỉ lệ sao cho cạnh dài = imgsz (INTER_AREA khi thu nhỏ, LINEAR khi phóng to)
+def resize_long_side(img, imgsz):
+    h0, w0 = img.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r == 1:
+        return img
+    w, h = min(int(np.ceil(w0 * r)), imgsz), min(int(np.ceil(h0 * r)), imgsz)
+    return cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA if r < 1 else cv2.INTER_LINEAR)
+
+
+# ===== decode_one =====
+# Chạy trong process con: đọc + resize một ảnh → (bytes, (h, w), (h0, w0)); lỗi → None
+def decode_one(args):
+    path, imgsz = args
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    h0, w0 = img.shape[:2]
+    img = np.ascontiguousarray(resize_long_side(img, imgsz))
+    return img.tobytes(), img.shape[:2], (h0, w0)
+
+
+# ===== shard_dir_for =====
+def shard_dir_for(image_dir, imgsz):
+    return os.path.join(os.path.dirname(os.path.normpath(image_dir)), f".shards_{int(imgsz)}")
+
+
+# ===== _source_fingerprint =====
+# Hash (tên, kích thước, mtime) của mọi ảnh nguồn → biết shard còn khớp dataset không
+def _source_fingerprint(index):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(index.names).tobytes())
+    h.update(np.stack([index.images["size"], index.images["mtime_ns"]], axis=1).tobytes())
+    return h.hexdigest()
+
+
+# ===== build_shards =====
+# DatasetIndex của một split → thư mục shard; đã có và khớp nguồn thì bỏ qua
+def build_shards(index, imgsz=640, shard_mb=DEFAULT_SHARD_MB, workers=None, rebuild=False, verbose=True):
+    out_dir = shard_dir_for(index.image_dir, imgsz)
+    fingerprint = _source_fingerprint(index)
+    if not rebuild:
+        store = ShardStore.open(out_dir)
+        if store is not None and store.meta.get("source") == fingerprint:
+            if verbose:
+                print(f"{out_dir}: up to date ({len(store)} images)")
+            return store
+    t0 = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    for name in os.listdir(out_dir):
+        if name == "meta.json" or (name.startswith("shard_") and name.endswith(".bin")):
+            os.remove(os.path.join(out_dir, name))
+
+    n = len(index)
+    entries = np.zeros(n, ENTRY_DTYPE)
+    entries["shard"] = -1
+    shard_limit = max(1, int(shard_mb)) * 1024 * 1024
+    shard, offset, written, failed = 0, 0, 0, []
+    out = open(os.path.join(out_dir, f"shard_{shard:03d}.bin"), 'wb')
+
+    args = [(index.image_path(i), imgsz) for i in range(n)]
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and n >= 64 else None
+    decoded = pool.map(decode_one, args, chunksize=max(1, n // (workers * 8))) if pool else map(decode_one, args)
+    try:
+        # ghi tuần tự theo thứ tự index (pool.map giữ thứ tự) → offset tăng dần trong shard
+        for i, item in enumerate(decoded):
+            if item is None:
+                failed.append(str(index.names[i]))
+                continue
+            data, (h, w), (h0, w0) = item
+            if offset and offset + len(data) > shard_limit:
+                out.close()
+                shard, offset = shard + 1, 0
+                out = open(os.path.join(out_dir, f"shard_{shard:03d}.bin"), 'wb')
+            out.write(data)
+            entries[i] = (shard, offset, h, w, h0, w0,
+                          np.frombuffer(hashlib.blake2b(data, digest_size=16).digest(), np.uint8))
+            offset += len(data)
+            written += len(data)
+    finally:
+        out.close()
+        if pool is not None:
+            pool.shutdown()
+
+    meta = {
+        "version": SHARD_VERSION,
+        "imgsz": int(imgsz),
+        "image_dir": index.image_dir,
+        "source": fingerprint,
+        "shards": shard + 1,
+        "images": n,
+        "bytes": written,
+        "failed": failed,
+        "nc": index.meta.get("nc"),
+        "names": index.meta.get("names"),
+        "built_seconds": round(time.perf_counter() - t0, 3),
+    }
+    arrays = (("index.npy", entries), ("names.npy", np.asarray(index.names)),
+              ("box_start.npy", np.asarray(index.images["box_start"])),
+              ("box_count.npy", np.asarray(index.images["box_count"])),
+              ("boxes.npy", np.asarray(index.boxes)))
+    for fname, arr in arrays:
+        tmp = os.path.join(out_dir, fname + ".tmp")
+        with open(tmp, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp, os.path.join(out_dir, fname))
+    # meta.json ghi sau cùng: có meta.json nghĩa là shard đã ghi xong
+    tmp = os.path.join(out_dir, "meta.json.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(out_dir, "meta.json"))
+    if verbose:
+        print(f"{out_dir}: {n - len(failed)} images, {written / 1e6:.1f} MB in {shard + 1} shard(s), "
+              f"{meta['built_seconds']:.2f}s" + (f", {len(failed)} unreadable" if failed else ""))
+    return ShardStore.open(out_dir)
+
+
+class ShardStore:
+    """ Đọc ảnh từ shard: store.image(i) là view np.memmap (H, W, 3) uint8, không copy """
+
+    def __init__(self, shard_dir, entries, names, box_start, box_count, boxes, meta):
+        self.shard_dir = shard_dir
+        self.entries = entries
+        self.names = names
+        self.box_start = box_start
+        self.box_count = box_count
+        self.boxes = boxes
+        self.meta = meta
+        self.imgsz = meta["imgsz"]
+        self._maps = {}
+        self._pid = os.getpid()
+
+    def __len__(self):
+        return len(self.entries)
+
+    # ===== open =====
+    # None nếu thư mục chưa có shard hoàn chỉnh / khác phiên bản
+    @classmethod
+    def open(cls, shard_dir):
+        meta_path = os.path.join(shard_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("version") != SHARD_VERSION:
+            return None
+        try:
+            arrays = [np.load(os.path.join(shard_dir, name), mmap_mode="r")
+                      for name in ("index.npy", "names.npy", "box_start.npy", "box_count.npy", "boxes.npy")]
+        except (OSError, ValueError):
+            return None
+        return cls(shard_dir, *arrays, meta)
+
+    # ===== _shard =====
+    # Mỗi process mở memmap riêng (sau fork của DataLoader mở lại cho chắc)
+    def _shard(self, k):
+        if self._pid != os.getpid():
+            self._maps, self._pid = {}, os.getpid()
+        mm = self._maps.get(k)
+        if mm is None:
+            mm = np.memmap(os.path.join(self.shard_dir, f"shard_{k:03d}.bin"), dtype=np.uint8, mode="r")
+            self._maps[k] = mm
+        return mm
+
+    # ===== image =====
+    # View chỉ đọc (H, W, 3) BGR; None nếu ảnh gốc không đọc được lúc build
+    def image(self, i):
+        e = self.entries[i]
+        if e["shard"] < 0:
+            return None
+        h, w = int(e["height"]), int(e["width"])
+        start = int(e["offset"])
+        return self._shard(int(e["shard"]))[start:start + h * w * 3].reshape(h, w, 3)
+
+    # ===== labels =====
+    # (n, 5) cls, x, y, w, h chuẩn hoá
+    def labels(self, i):
+        start = int(self.box_start[i])
+        return self.boxes[start:start + int(self.box_count[i])]
+
+    # ===== orig_size =====
+    def orig_size(self, i):
+        e = self.entries[i]
+        return int(e["orig_height"]), int(e["orig_width"])
+
+    # ===== path_lookup =====
+    # Đường dẫn ảnh gốc (chuẩn hoá) → chỉ số trong shard
+    def path_lookup(self):
+        image_dir = self.meta["image_dir"]
+        return {os.path.normcase(os.path.normpath(os.path.join(image_dir, str(name)))): i
+                for i, name in enumerate(self.names)}
+
+    # ===== verify =====
+    # So checksum lúc build với byte đang có trên đĩa → danh sách chỉ số bị hỏng
+    def verify(self):
+        bad = []
+        for i in range(len(self)):
+            img = self.image(i)
+            if img is None:
+                continue
+            if hashlib.blake2b(img.tobytes(), digest_size=16).digest() != self.entries[i]["checksum"].tobytes():
+                bad.append(i)
+        return bad
+
+
+# ===== letterbox_into =====
+# Đặt ảnh (H, W, 3), H, W <= imgsz, vào giữa ô out (imgsz, imgsz, 3) đã tô màu pad → (pad_x, pad_y)
+def letterbox_into(out, img, pad_value=114):
+    h, w = img.shape[:2]
+    size_h, size_w = out.shape[:2]
+    top, left = (size_h - h) // 2, (size_w - w) // 2
+    out[:] = pad_value
+    out[top:top + h, left:left + w] = img
+    return left, top
+
+
+class ShardLoader:
+    """ Duyệt store theo batch: ảnh letterbox vuông imgsz (uint8 NHWC) + nhãn + chỉ số """
+
+    # ===== __init__ =====
+    # buffer batch cấp phát một lần, dùng lại mỗi batch (chỉ một lần copy từ memmap)
+    def __init__(self, store, batch_size=16, shuffle=True, seed=0, drop_last=False):
+        self.store = store
+        self.batch_size = max(1, int(batch_size))
+        self.shuffle = shuffle
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+        self.valid = np.flatnonzero(store.entries["shard"] >= 0)
+        size = store.imgsz
+        self._buffer = np.empty((self.batch_size, size, size, 3), np.uint8)
+
+    def __len__(self):
+        n = len(self.valid)
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    # ===== __iter__ =====
+    # Thứ tự xáo theo (seed, epoch) → tái lập được; batch trả về là view của buffer dùng chung
+    def __iter__(self):
+        order = self.valid
+        if self.shuffle:
+            order = np.random.default_rng((self.seed, self.epoch)).permutation(order)
+        self.epoch += 1
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            if self.drop_last and len(idx) < self.batch_size:
+                break
+            batch = self._buffer[:len(idx)]
+            pads = np.zeros((len(idx), 2), np.int32)
+            for k, i in enumerate(idx):
+                pads[k] = letterbox_into(batch[k], self.store.image(i))
+            yield batch, [self.store.labels(i) for i in idx], idx, pads
+
+
+# ===== build_dataset_shards =====
+# data.yaml → {split: ShardStore} (tạo / cập nhật dataset index trước)
+def build_dataset_shards(yaml_path, imgsz=640, splits=("train", "val"), shard_mb=DEFAULT_SHARD_MB,
+                         workers=None, rebuild=False, verbose=True):
+    indexes = index_dataset(yaml_path, splits, workers=workers, verbose=verbose)
+    return {split: build_shards(index, imgsz, shard_mb, workers, rebuild, verbose)
+            for split, index in indexes.items()}
+
+
+# ===== open_dataset_shards =====
+# Shard đã có của các split trong data.yaml (không build)
+def open_dataset_shards(yaml_path, imgsz=640, splits=("train", "val")):
+    data = load_data_yaml(yaml_path)
+    stores = {}
+    for split in splits:
+        if data.get(split):
+            store = ShardStore.open(shard_dir_for(data[split], imgsz))
+            if store is not None:
+                stores[split] = store
+    return stores
+
+
+# ===== ShardImageLoader =====
+# load_image của một dataset, đọc từ shard. Gắn vào từng dataset dạng thuộc tính instance
+# (không sửa class) nên được pickle cùng dataset sang worker DataLoader: trên Windows worker
+# được tạo bằng spawn, import lại ultralytics gốc, patch class ở process cha không có tác dụng.
+# Chỉ pickle đường dẫn shard; mỗi process tự mở memmap ở lần đọc đầu tiên.
+# Chỉ áp dụng khi imgsz khớp và ở rect_mode (mặc định); ảnh không có trong shard → hàm gốc.
+# Trả bản copy vì augment (RandomHSV, ...) sửa ảnh tại chỗ; memcpy vẫn rẻ hơn nhiều so với giải mã.
+class ShardImageLoader:
+    def __init__(self, dataset, shard_dirs):
+        self.dataset = dataset
+        self.shard_dirs = list(shard_dirs)
+        self._lookup = None          # đường dẫn ảnh → (ShardStore, chỉ số), mở lười theo process
+        self.hits = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lookup"] = None
+        return state
+
+    def _open(self):
+        lookup = {}
+        for shard_dir in self.shard_dirs:
+            store = ShardStore.open(shard_dir)
+            if store is None:
+                continue
+            for path, i in store.path_lookup().items():
+                lookup[path] = (store, i)
+        self._lookup = lookup
+
+    def __call__(self, i, rect_mode=True):
+        ds = self.dataset
+        if self._lookup is None:
+            self._open()
+        hit = self._lookup.get(os.path.normcase(os.path.normpath(ds.im_files[i])))
+        if hit is None or not rect_mode or ds.ims[i] is not None or hit[0].imgsz != ds.imgsz:
+            return type(ds).load_image(ds, i, rect_mode)
+        store, k = hit
+        img = store.image(k)
+        if img is None:
+            return type(ds).load_image(ds, i, rect_mode)
+        self.hits += 1
+        img = img.copy()
+        return img, store.orig_size(k), img.shape[:2]
+
+
+# ===== use_shards =====
+# Cho ultralytics đọc ảnh từ shard thay vì giải mã file: mọi dataset tạo sau lời gọi này
+# (BaseDataset.__init__ được bọc) có load_image = ShardImageLoader
+def use_shards(stores):
+    from ultralytics.data.base import BaseDataset
+    original = getattr(BaseDataset.__init__, "_original", BaseDataset.__init__)
+    shard_dirs = [store.shard_dir for store in stores.values()]
+
+    def __init__(self, *args, **kwargs):
+        original(self, *args, **kwargs)
+        self.load_image = ShardImageLoader(self, shard_dirs)
+
+    __init__._original = original
+    BaseDataset.__init__ = __init__
+    count = sum(len(store) for store in stores.values())
+    print(f"Shards attached to datasets: {count} images in {len(shard_dirs)} split(s)")
+    return count
+
+
+# ===== benchmark =====
+# So thời gian một lượt đọc: giải mã file gốc + resize vs view từ shard
+def benchmark(store, limit=500):
+    n = min(limit, len(store))
+    t0 = time.perf_counter()
+    for i in range(n):
+        decode_one((os.path.join(store.meta["image_dir"], str(store.names[i])), store.imgsz))
+    decode_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    total = 0
+    for i in range(n):
+        img = store.image(i)
+        if img is not None:
+            total += int(img[0, 0, 0])          # chạm vào dữ liệu để trang được đọc thật
+    shard_s = time.perf_counter() - t0
+    print(f"{n} images: decode+resize {decode_s / n * 1000:.2f} ms/img, "
+          f"shard {shard_s / n * 1000:.3f} ms/img ({decode_s / max(shard_s, 1e-9):.0f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-decode a YOLO dataset into memory-mapped uint8 shards")
+    parser.add_argument("data", help="data.yaml")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--splits", nargs="+", default=["train", "val"])
+    parser.add_argument("--shard-mb", type=int, default=DEFAULT_SHARD_MB, help="max size of one shard file")
+    parser.add_argument("--workers", type=int, default=0, help="decode processes (0 = CPU count)")
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--verify", action="store_true", help="check shard bytes against build checksums")
+    parser.add_argument("--benchmark", action="store_true", help="compare file decode vs shard read")
+    args = parser.parse_args(argv)
+    stores = build_dataset_shards(args.data, args.imgsz, args.splits, args.shard_mb,
+                                  args.workers or None, args.rebuild)
+    status = 0
+    for split, store in stores.items():
+        if args.verify:
+            bad = store.verify()
+            print(f"{split}: {len(bad)} corrupted image(s)" + (f" e.g. {store.names[bad[0]]}" if bad else ""))
+            status = status or (1 if bad else 0)
+        if args.benchmark:
+            print(f"{split}: ", end="")
+            benchmark(store)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
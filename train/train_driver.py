@@ -0,0 +1,332 @@
+import os
+import sys
+import json
+import time
+import copy
+import platform
+import argparse
+import yaml
+
+#======================================
+# TRAIN DRIVER - train theo file cấu hình, tự chọn thread / worker, đo thông lượng
+#======================================
+# python train_driver.py train_config.yaml                 # train (biến thể đầu tiên)
+# python train_driver.py train_config.yaml --resume        # train tiếp từ weights/last.pt
+# python train_driver.py train_config.yaml --compare       # train mọi biến thể rồi so sánh
+# python train_driver.py train_config.yaml --dry-run       # chỉ in cấu hình đã phân giải
+#
+# Đường dẫn trong file cấu hình tính theo thư mục chứa file đó. Mỗi epoch ghi một
+# dòng vào <save_dir>/profile.jsonl: ảnh/giây, thời gian nạp dữ liệu (chờ
+# dataloader) vs forward/backward, thời gian validate và metric của epoch.
+
+# Tham số của driver; mọi khoá khác trong `train:` chuyển thẳng cho model.train()
+DEFAULTS = {
+    "name": "yolov8n",
+    "model": "yolov8n.yaml",
+    "weights": None,             # checkpoint pretrained để nạp vào model yaml
+    "data": "vehicle dataset/data.yaml",
+    "project": "runs/train",
+    "threads": "auto",
+    "workers": "auto",
+    "shards": False,             # đọc ảnh từ image_shards (tạo nếu chưa có)
+    "seed": 0,
+    "train": {},
+    "variants": [],
+}
+
+TRAIN_DEFAULTS = {
+    "epochs": 2,
+    "batch": 16,
+    "imgsz": 640,
+    "device": "cpu",
+    "deterministic": True,
+}
+
+
+# ===== cpu_count =====
+# Số CPU process này được phép dùng (tôn trọng taskset / cgroup affinity)
+def cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# ===== auto_threads =====
+# Train CPU: worker dataloader và thread tính toán dùng chung CPU → chia ra,
+# khoảng 1/4 cho worker (giải mã + augment), phần còn lại cho torch
+# Đọc từ shard thì không phải giải mã nữa → ít worker hơn
+def auto_threads(threads="auto", workers="auto", device="cpu", batch=16, shards=False):
+    cpus = cpu_count()
+    on_cpu = str(device).lower() == "cpu"
+    if workers in (None, "auto"):
+        share = 8 if shards else 4
+        workers = max(1, min(8, int(batch), cpus // share)) if on_cpu else min(8, cpus)
+    if threads in (None, "auto"):
+        threads = max(1, cpus - int(workers)) if on_cpu else max(1, cpus // 2)
+    return int(threads), int(workers)
+
+
+# ===== _resolve =====
+def _resolve(path, base_dir):
+    if not path or os.path.isabs(path):
+        return path
+    candidate = os.path.join(base_dir, path)
+    # "yolov8n.pt" / "yolov8n.yaml" không có sẵn → để ultralytics tự tải / tìm
+    return candidate if os.path.exists(candidate) or os.sep in path or "/" in path else path
+
+
+# ===== load_config =====
+# File YAML → danh sách biến thể đã gộp mặc định; mỗi biến thể ghi đè một phần cấu hình chung
+def load_config(path):
+    path = os.path.abspath(path)
+    base_dir = os.path.dirname(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = yaml.safe_load(f) or {}
+    unknown = set(raw) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown config keys: {sorted(unknown)} (train arguments go under 'train:')")
+    base = copy.deepcopy(DEFAULTS)
+    base.update({k: v for k, v in raw.items() if k != "variants"})
+    base["train"] = {**TRAIN_DEFAULTS, **(raw.get("train") or {})}
+    runs = []
+    for variant in raw.get("variants") or [{}]:
+        cfg = copy.deepcopy(base)
+        for key, value in variant.items():
+            if key == "train":
+                cfg["train"].update(value or {})
+            elif key in DEFAULTS and key != "variants":
+                cfg[key] = value
+            else:
+                raise ValueError(f"Unknown variant key: {key}")
+        for key in ("model", "weights", "data", "project"):
+            cfg[key] = _resolve(cfg[key], base_dir)
+        cfg["config_path"] = path
+        runs.append(cfg)
+    names = [cfg["name"] for cfg in runs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Variant names must be unique: {names}")
+    return runs
+
+
+class EpochProfiler:
+    """ Callback ultralytics: đo thời gian chờ dữ liệu / tính toán / validate từng epoch """
+
+    def __init__(self, out_path, threads, workers):
+        self.out_path = out_path
+        self.threads = threads
+        self.workers = workers
+        self.epochs = []
+        self._reset()
+
+    def _reset(self):
+        self.data_s = 0.0
+        self.compute_s = 0.0
+        self.batches = 0
+        self._epoch_start = self._mark = self._train_end = None
+
+    # ===== attach =====
+    def attach(self, model):
+        model.add_callback("on_train_epoch_start", self.on_train_epoch_start)
+        model.add_callback("on_train_batch_start", self.on_train_batch_start)
+        model.add_callback("on_train_batch_end", self.on_train_batch_end)
+        model.add_callback("on_train_epoch_end", self.on_train_epoch_end)
+        model.add_callback("on_fit_epoch_end", self.on_fit_epoch_end)
+
+    # ===== callback =====
+    # batch_start - mốc trước = chờ dataloader; batch_end - batch_start = forward + backward + step
+    def on_train_epoch_start(self, trainer):
+        self._reset()
+        self._epoch_start = self._mark = time.perf_counter()
+
+    def on_train_batch_start(self, trainer):
+        now = time.perf_counter()
+        if self._mark is not None:
+            self.data_s += now - self._mark
+        self._mark = now
+
+    def on_train_batch_end(self, trainer):
+        now = time.perf_counter()
+        if self._mark is not None:
+            self.compute_s += now - self._mark
+        self._mark = now
+        self.batches += 1
+
+    def on_train_epoch_end(self, trainer):
+        self._train_end = time.perf_counter()
+
+    def on_fit_epoch_end(self, trainer):
+        if self._epoch_start is None:
+            return
+        now = time.perf_counter()
+        train_end = self._train_end or now
+        train_s = train_end - self._epoch_start
+        images = len(trainer.train_loader.dataset)
+        metrics = {k: round(float(v), 5) for k, v in (getattr(trainer, "metrics", None) or {}).items()}
+        row = {
+            "epoch": int(trainer.epoch) + 1,
+            "images": images,
+            "batches": self.batches,
+            "train_s": round(train_s, 3),
+            "data_s": round(self.data_s, 3),
+            "compute_s": round(self.compute_s, 3),
+            "val_s": round(now - train_end, 3),
+            "images_per_sec": round(images / train_s, 2) if train_s > 0 else 0.0,
+            "data_fraction": round(self.data_s / train_s, 4) if train_s > 0 else 0.0,
+            "threads": self.threads,
+            "workers": self.workers,
+            "metrics": metrics,
+        }
+        self.epochs.append(row)
+        with open(self.out_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(row) + "\n")
+        print(f"[epoch {row['epoch']}] {row['images_per_sec']:.1f} img/s, data {row['data_s']:.1f}s, "
+              f"compute {row['compute_s']:.1f}s, val {row['val_s']:.1f}s")
+
+
+# ===== plan =====
+# Cấu hình một biến thể → (thư mục lưu, tham số model.train(), threads, workers)
+def plan(cfg):
+    train_args = dict(cfg["train"])
+    threads, workers = auto_threads(cfg["threads"], train_args.get("workers", cfg["workers"]), train_args.get("device", "cpu"),
+                                    train_args.get("batch", 16), cfg["shards"])
+    save_dir = os.path.join(cfg["project"], cfg["name"])
+    train_args.update({
+        "task": "detect",
+        "project": cfg["project"],
+        "name": cfg["name"],
+        "exist_ok": True,
+        "seed": cfg["seed"],
+        "workers": workers,
+    })
+    return save_dir, train_args, threads, workers
+
+
+# ===== run_variant =====
+# Train một biến thể; resume=True và có weights/last.pt → train tiếp đúng từ epoch đã dừng
+def run_variant(cfg, resume=False):
+    from dataset_index import write_resolved_yaml
+    save_dir, train_args, threads, workers = plan(cfg)
+    os.makedirs(save_dir, exist_ok=True)
+    # thread phải đặt trước lần tính toán đầu tiên của torch
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    import torch
+    torch.set_num_threads(threads)
+    from ultralytics import YOLO
+
+    # data.yaml của dataset dùng đường dẫn Windows tuyệt đối → ghi bản dùng được trên máy này
+    train_args["data"] = write_resolved_yaml(cfg["data"], os.path.join(save_dir, "data.resolved.yaml"))
+    if cfg["shards"]:
+        from image_shards import build_dataset_shards, use_shards
+        use_shards(build_dataset_shards(cfg["data"], imgsz=train_args.get("imgsz", 640)))
+
+    last = os.path.join(save_dir, "weights", "last.pt")
+    resuming = resume and os.path.exists(last)
+    if resuming:
+        model = YOLO(last)
+        train_args = {"resume": True, "workers": workers}
+        print(f"Resuming {cfg['name']} from {last}")
+    else:
+        if resume:
+            print(f"No checkpoint at {last}, starting {cfg['name']} from scratch")
+        model = YOLO(cfg["model"])
+        if cfg["weights"]:
+            model = model.load(cfg["weights"])
+        with open(os.path.join(save_dir, "profile.jsonl"), 'w', encoding='utf-8'):
+            pass
+
+    run_info = {
+        "config": cfg,
+        "train_args": train_args,
+        "threads": threads,
+        "workers": workers,
+        "cpus": cpu_count(),
+        "resumed": resuming,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+    }
+    with open(os.path.join(save_dir, "driver_run.json"), 'w', encoding='utf-8') as f:
+        json.dump(run_info, f, ensure_ascii=False, indent=1, default=str)
+
+    profiler = EpochProfiler(os.path.join(save_dir, "profile.jsonl"), threads, workers)
+    profiler.attach(model)
+    t0 = time.perf_counter()
+    model.train(**train_args)
+    total_s = time.perf_counter() - t0
+    params = sum(p.numel() for p in model.model.parameters()) if getattr(model, "model", None) is not None else None
+    return summarize(cfg["name"], save_dir, total_s, params)
+
+
+# ===== summarize =====
+# Tổng hợp profile.jsonl của một lần train (kể cả các epoch trước khi resume)
+def summarize(name, save_dir, total_s=None, params=None):
+    rows = []
+    path = os.path.join(save_dir, "profile.jsonl")
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    last = rows[-1]["metrics"] if rows else {}
+    n = len(rows) or 1
+    return {
+        "name": name,
+        "save_dir": save_dir,
+        "epochs": len(rows),
+        "params": params,
+        "wall_s": round(total_s, 1) if total_s is not None else None,
+        "epoch_s": round(sum(r["train_s"] + r["val_s"] for r in rows) / n, 2),
+        "images_per_sec": round(sum(r["images_per_sec"] for r in rows) / n, 2),
+        "data_fraction": round(sum(r["data_fraction"] for r in rows) / n, 4),
+        "mAP50": last.get("metrics/mAP50(B)"),
+        "mAP50-95": last.get("metrics/mAP50-95(B)"),
+    }
+
+
+# ===== print_comparison =====
+def print_comparison(summaries):
+    print(f"\n{'variant':<20}{'params':>10}{'epochs':>7}{'s/epoch':>9}{'img/s':>8}{'data%':>7}{'mAP50':>8}{'mAP50-95':>9}")
+    for s in summaries:
+        params = f"{s['params'] / 1e6:.2f}M" if s["params"] else "-"
+        fmt = lambda v: f"{v:.4f}" if isinstance(v, float) else "-"
+        print(f"{s['name']:<20}{params:>10}{s['epochs']:>7}{s['epoch_s']:>9.1f}{s['images_per_sec']:>8.1f}"
+              f"{s['data_fraction'] * 100:>6.1f}%{fmt(s['mAP50']):>8}{fmt(s['mAP50-95']):>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train YOLO from a config file with throughput profiling")
+    parser.add_argument("config", help="training config (YAML)")
+    parser.add_argument("--variant", action="append", help="only run these variant names")
+    parser.add_argument("--compare", action="store_true", help="run every variant and compare them")
+    parser.add_argument("--resume", action="store_true", help="continue from <save_dir>/weights/last.pt")
+    parser.add_argument("--dry-run", action="store_true", help="print the resolved plan and exit")
+    args = parser.parse_args(argv)
+
+    runs = load_config(args.config)
+    if args.variant:
+        runs = [cfg for cfg in runs if cfg["name"] in args.variant]
+        if not runs:
+            parser.error(f"no variant named {args.variant}")
+    elif not args.compare:
+        runs = runs[:1]
+
+    if args.dry_run:
+        for cfg in runs:
+            save_dir, train_args, threads, workers = plan(cfg)
+            print(json.dumps({"name": cfg["name"], "model": cfg["model"], "weights": cfg["weights"],
+                              "data": cfg["data"], "save_dir": save_dir, "threads": threads,
+                              "workers": workers, "shards": cfg["shards"], "train": train_args},
+                             ensure_ascii=False, indent=1))
+        return 0
+
+    summaries = [run_variant(cfg, args.resume) for cfg in runs]
+    print_comparison(summaries)
+    if len(summaries) > 1:
+        out = os.path.join(runs[0]["project"], "compare.json")
+        with open(out, 'w', encoding='utf-8') as f:
+            json.dump(summaries, f, ensure_ascii=False, indent=1)
+        print(f"Wrote {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
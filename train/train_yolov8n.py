@@ -2,8 +2,15 @@
 # 🎯 Train YOLOv8n (pretrained) với dataset của bạn
 # ============================================================
 
+import os
 from ultralytics import YOLO
 
+# 0️⃣ (Tuỳ chọn) đọc ảnh từ shard đã giải mã sẵn: YOLO_SHARDS=1 python train_yolov8n.py
+#    lần đầu tự tạo shard (python image_shards.py "vehicle dataset/data.yaml" --imgsz 640)
+if os.environ.get("YOLO_SHARDS", "0") == "1":
+    from image_shards import build_dataset_shards, use_shards
+    use_shards(build_dataset_shards("vehicle dataset/data.yaml", imgsz=640))
+
 # 1️⃣ Load model yolov8n.pt pretrained
 #model = YOLO("yolov8n.pt") 
 model = YOLO("my_yolov8n.yaml").load("yolov8n.pt")
@@ -0,0 +1,295 @@
+import math
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer
+import metrics
+
+#======================================
+# ADMISSION CONTROL - giới hạn số inference đồng thời, UART luôn được ưu tiên
+#======================================
+# Mỗi lần chụp + detect phải giữ một "slot" inference. Có hai mức ưu tiên:
+#   uart  điều khiển đèn (ESP32 'yell'): chờ được slot, dùng được mọi slot
+#   web   /camera_capture: không dùng các slot dành riêng cho UART, chỉ chờ khi
+#         hàng chờ còn chỗ và tối đa max_wait giây, nếu không → từ chối ngay
+#         (Overloaded + gợi ý Retry-After) thay vì làm chậm mọi request khác.
+# Slot trống được trao cho UART đang chờ trước. SharedResults gộp các request
+# giống nhau (cùng nguồn, conf, iou) trong một cửa sổ ngắn thành một lần detect.
+
+PRIORITIES = ("uart", "web")
+
+
+class Overloaded(Exception):
+    """ Quá tải: request bị từ chối, thử lại sau retry_after giây """
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    # ===== __init__ =====
+    # max_inflight: số inference đồng thời tối đa (mọi mức ưu tiên)
+    # reserved: số slot chỉ UART được dùng (web dùng tối đa max_inflight - reserved)
+    # max_waiting: số request web được xếp hàng chờ slot; max_wait: web chờ tối đa (giây)
+    def __init__(self, max_inflight=2, reserved=1, max_waiting=4, max_wait=2.0):
+        self.max_inflight = max(1, int(max_inflight))
+        self.reserved = min(max(0, int(reserved)), self.max_inflight - 1)
+        self.max_waiting = max(0, int(max_waiting))
+        self.max_wait = max(0.0, float(max_wait))
+        self.cond = threading.Condition()
+        self.inflight = {p: 0 for p in PRIORITIES}
+        self.waiting = {p: 0 for p in PRIORITIES}
+        self.admitted = {p: 0 for p in PRIORITIES}
+        self.rejected = 0
+        self.timeouts = 0
+        self._service_s = 0.5             # EWMA thời gian giữ slot (ước lượng Retry-After)
+
+    # ===== _limit =====
+    def _limit(self, priority):
+        return self.max_inflight if priority == "uart" else self.max_inflight - self.reserved
+
+    def _can_enter(self, priority):
+        if sum(self.inflight.values()) >= self.max_inflight:
+            return False
+        if priority == "uart":
+            return True
+        # web nhường khi có UART đang chờ
+        return self.waiting["uart"] == 0 and sum(self.inflight.values()) < self._limit("web")
+
+    # ===== retry_after =====
+    # Ước lượng thời gian tới khi có slot: (đang chạy + đang chờ) / số slot x thời gian một lần
+    def retry_after(self):
+        queued = sum(self.inflight.values()) + sum(self.waiting.values())
+        return max(0.1, self._service_s * (queued + 1) / max(1, self._limit("web")))
+
+    # ===== acquire =====
+    # timeout: UART chờ tối đa bao lâu (None = mặc định max_wait của web); hết hạn → Overloaded
+    def acquire(self, priority="web", timeout=None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        with self.cond:
+            if not self._can_enter(priority):
+                if priority == "web" and (self.waiting["web"] >= self.max_waiting or not self.max_wait):
+                    self.rejected += 1
+                    metrics.inc("admission_rejected_total", priority=priority)
+                    raise Overloaded("Inference capacity full", self.retry_after())
+                wait = self.max_wait if timeout is None else timeout
+                self.waiting[priority] += 1
+                try:
+                    ok = self.cond.wait_for(lambda: self._can_enter(priority), wait)
+                finally:
+                    self.waiting[priority] -= 1
+                if not ok:
+                    self.timeouts += 1
+                    metrics.inc("admission_rejected_total", priority=priority)
+                    self.cond.notify_all()
+                    raise Overloaded("Timed out waiting for inference capacity", self.retry_after())
+            self.inflight[priority] += 1
+            self.admitted[priority] += 1
+        return time.monotonic()
+
+    # ===== release =====
+    def release(self, priority, started):
+        with self.cond:
+            self.inflight[priority] -= 1
+            self._service_s = 0.8 * self._service_s + 0.2 * (time.monotonic() - started)
+            self.cond.notify_all()
+
+    # ===== slot =====
+    # with admission.slot("web"): ...  (Overloaded nếu không vào được)
+    def slot(self, priority="web", timeout=None):
+        return _Slot(self, priority, timeout)
+
+    # ===== stats =====
+    def stats(self):
+        with self.cond:
+            return {
+                "max_inflight": self.max_inflight,
+                "reserved_uart": self.reserved,
+                "inflight": dict(self.inflight),
+                "waiting": dict(self.waiting),
+                "admitted": dict(self.admitted),
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "retry_after": round(self.retry_after(), 3),
+            }
+
+
+class _Slot:
+    def __init__(self, controller, priority, timeout):
+        self.controller = controller
+        self.priority = priority
+        self.timeout = timeout
+        self.started = None
+
+    def __enter__(self):
+        self.started = self.controller.acquire(self.priority, self.timeout)
+        return self
+
+    def __exit__(self, *exc):
+        self.controller.release(self.priority, self.started)
+        return False
+
+
+class SharedResults:
+    """ Gộp request giống nhau: đang chạy → chờ chung; vừa xong (trong window giây) → dùng lại """
+
+    # ===== __init__ =====
+    def __init__(self, window=0.3):
+        self.window = window
+        self.lock = threading.Lock()
+        self._flights = {}          # key -> Future (đang chạy)
+        self._recent = {}           # key -> (thời điểm xong, kết quả)
+        self.shared = 0
+        self.executed = 0
+
+    # ===== run =====
+    # fn() chỉ chạy một lần cho mọi caller cùng key; ngoại lệ cũng được chia sẻ
+    # reusable(result): kết quả có được giữ lại cho caller đến sau không (vd. bỏ qua kết quả lỗi)
+    def run(self, key, fn, reusable=None):
+        now = time.monotonic()
+        with self.lock:
+            recent = self._recent.get(key)
+            if recent is not None and now - recent[0] <= self.window:
+                self.shared += 1
+                return recent[1]
+            future = self._flights.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._flights[key] = future
+                self.executed += 1
+            else:
+                self.shared += 1
+        if not owner:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            with self.lock:
+                self._flights.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self.lock:
+            self._flights.pop(key, None)
+            if self.window and (reusable is None or reusable(result)):
+                self._recent[key] = (time.monotonic(), result)
+                # dọn kết quả hết hạn
+                for k in [k for k, (t, _) in self._recent.items() if time.monotonic() - t > self.window]:
+                    del self._recent[k]
+        future.set_result(result)
+        return result
+
+    # ===== stats =====
+    def stats(self):
+        return {"window": self.window, "executed": self.executed, "shared": self.shared,
+                "in_flight": len(self._flights)}
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """ Server WSGI với số thread cố định: quá workers + backlog kết nối → trả 503 ngay
+
+    Response kéo dài (MJPEG /camera_stream, SSE /events) giữ kết nối mãi; nếu chạy trong pool
+    chúng chiếm hết worker của /camera_capture. Request tới stream_paths được chuyển sang
+    thread riêng ngoài pool, tối đa max_streams kết nối (quá → 503).
+    """
+
+    # ===== __init__ =====
+    # workers: số thread xử lý request; backlog: số kết nối được xếp hàng chờ thread
+    # stream_paths: path phục vụ ở thread riêng; max_streams: số stream đồng thời tối đa
+    def __init__(self, host, port, app, workers=16, backlog=32, stream_paths=(), max_streams=16, **kwargs):
+        super().__init__(host, port, app, **kwargs)
+        self.workers = max(1, int(workers))
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="http")
+        self.slots = threading.BoundedSemaphore(self.workers + max(0, int(backlog)))
+        self.stream_paths = tuple(stream_paths)
+        self.max_streams = max(0, int(max_streams))
+        self.stream_slots = threading.BoundedSemaphore(self.max_streams) if self.max_streams else None
+        self.streams = 0
+        self.rejected = 0
+        self.rejected_streams = 0
+
+    # ===== process_request =====
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            self.rejected += 1
+            metrics.inc("http_rejected_total")
+            _send_503(request)
+            self.shutdown_request(request)
+            return
+        self.pool.submit(self._handle, request, client_address)
+
+    # ===== _handle =====
+    # Worker của pool: request stream → giao cho thread riêng rồi trả worker ngay
+    def _handle(self, request, client_address):
+        handed_off = False
+        try:
+            if self.stream_paths and self._request_path(request).startswith(self.stream_paths):
+                if self.stream_slots is None or not self.stream_slots.acquire(blocking=False):
+                    self.rejected_streams += 1
+                    metrics.inc("http_stream_rejected_total")
+                    _send_503(request)
+                    return
+                self.streams += 1
+                threading.Thread(target=self._handle_stream, args=(request, client_address),
+                                 name="http-stream", daemon=True).start()
+                handed_off = True
+                return
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            if not handed_off:
+                self.shutdown_request(request)
+            self.slots.release()
+
+    def _handle_stream(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.streams -= 1
+            self.stream_slots.release()
+
+    # ===== _request_path =====
+    # Đọc trước (MSG_PEEK, không lấy khỏi socket) dòng đầu "GET /path HTTP/1.1" → "/path"
+    def _request_path(self, request, timeout=2.0):
+        try:
+            request.settimeout(timeout)
+            head = request.recv(2048, socket.MSG_PEEK)
+        except OSError:
+            return ""
+        finally:
+            try:
+                request.settimeout(None)
+            except OSError:
+                pass
+        parts = head.split(b"\r\n", 1)[0].split(b" ")
+        if len(parts) < 2:
+            return ""
+        return parts[1].split(b"?", 1)[0].decode("latin-1")
+
+    # ===== server_close =====
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+# ===== _send_503 =====
+# Trả 503 thô (chưa qua Flask) trước khi đóng kết nối
+def _send_503(request):
+    try:
+        request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\n"
+                        b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+    except OSError:
+        pass
+
+
+# ===== retry_after_header =====
+# Giây (float) → giá trị header Retry-After (số nguyên >= 1)
+def retry_after_header(seconds):
+    return str(max(1, int(math.ceil(seconds))))
@@ -1,18 +1,27 @@
 from flask import Flask, render_template, jsonify, request, url_for, Response
-from ultralytics import YOLO
-import cv2
 import os
 import uuid
 import urllib.request
 import numpy as np
-import json
-import threading
 import time
 import atexit
-try:
-    import serial
-except ImportError:
-    serial = None
+from backends import load_backend, Boxes, Detections
+from scheduler import InferenceScheduler
+from persistence import PersistJob, ResultWriter, persist_detection
+from streaming import MjpegBroadcaster
+from sources import SourceRegistry
+from postprocess import summarize, parse_class_conf
+from detector import StreamingDetector
+from uart import UARTHandler
+from detection_cache import DetectionCache, CachedModel, weights_fingerprint
+from scene_gate import SceneGate
+from roi import RoiStore, detect_in_roi
+from tiling import TiledModel
+from events import ResultBus, parse_last_event_id
+from lifecycle import Startup
+from admission import AdmissionController, Overloaded, PooledWSGIServer, SharedResults, retry_after_header
+import metrics
+from concurrent.futures import ThreadPoolExecutor
 
 # -------------------------------------------------------------------------
 # CẤU HÌNH FLASK APP VÀ THƯ MỤC
@@ -24,11 +33,13 @@ TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
 #khởi tạo Flask app
 app = Flask(__name__, static_folder=STATIC_DIR, template_folder=TEMPLATE_DIR)
 
-# Thư mục chứa ảnh upload và ảnh output
+# Thư mục chứa ảnh upload và ảnh output (tạo lúc khởi động, xem start_writer)
 UPLOAD_FOLDER = os.path.join(STATIC_DIR, "uploads")
 OUTPUT_FOLDER = os.path.join(STATIC_DIR, "outputs")
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+
+# Import module chỉ tạo đối tượng; model, camera, UART được khởi tạo ở thread nền
+# khi gọi create_app() (hoặc ở request đầu tiên), xem lifecycle.py
+startup = Startup()
 
 # -------------------------------------------------------------------------
 # LOAD MODEL YOLO
@@ -39,8 +50,81 @@ model_path = os.path.join(BASE_DIR, "../../runs/detect/my_yolov8n_train_meme/wei
 # Nếu đường dẫn tuyệt đối không tồn tại → dùng đường dẫn tương đối
 if not os.path.exists(model_path):
     model_path = "runs/detect/my_yolov8n_train_meme/weights/best.pt"
-# Load model YOLO vào RAM (mất thời gian 1 lần duy nhất)
-model = YOLO(model_path)
+# Backend inference: torch (best.pt) | onnx | onnx-int8 | openvino | openvino-int8
+# Backend export được tạo 1 lần từ best.pt nếu chưa có (xem backends.py)
+INFER_BACKEND = os.environ.get("YOLO_BACKEND", "torch")
+INFER_THREADS = int(os.environ.get("YOLO_THREADS", "0")) or None   # 0 = số core CPU
+INFER_IMGSZ = int(os.environ.get("YOLO_IMGSZ", "640"))
+# Model YOLO được load ở bước khởi động "model" (load_model), None tới khi xong
+model = None
+
+# -------------------------------------------------------------------------
+# INFERENCE SCHEDULER - một thread duy nhất sở hữu model, gom frame thành batch
+# -------------------------------------------------------------------------
+# Cấu hình qua biến môi trường (export trong yolo_flask.sh nếu cần)
+BATCH_MAX_SIZE = int(os.environ.get("YOLO_BATCH_MAX_SIZE", "4"))           # số frame tối đa / batch
+BATCH_MAX_WAIT_MS = float(os.environ.get("YOLO_BATCH_MAX_WAIT_MS", "15"))  # chờ gom batch (ms)
+LATENCY_BUDGET_MS = float(os.environ.get("YOLO_LATENCY_BUDGET_MS", "1500"))  # giới hạn p99 (ms)
+INFER_TIMEOUT = float(os.environ.get("YOLO_INFER_TIMEOUT", "30"))          # caller chờ tối đa (s)
+
+# scheduler.model được gán và thread worker được start trong load_model
+scheduler = InferenceScheduler(
+    None,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait=BATCH_MAX_WAIT_MS / 1000.0,
+    latency_budget=LATENCY_BUDGET_MS / 1000.0,
+    timeout=INFER_TIMEOUT,
+)
+atexit.register(lambda: scheduler.stop())
+
+def warmup_model(size=INFER_IMGSZ):
+    """Run one dummy inference so the first real request / UART yell does not pay warm-up.
+
+    Runs as a required startup step: the app only reports ready after it succeeds.
+    """
+    t0 = time.time()
+    scheduler(np.zeros((size, size, 3), dtype=np.uint8), conf=0.5, iou=0.5)
+    print(f"Model warm-up done in {time.time() - t0:.2f}s")
+
+# -------------------------------------------------------------------------
+# DETECTION CACHE - ảnh giống hệt từng byte ảnh đã detect không chạy lại model
+# -------------------------------------------------------------------------
+# Chỉ có ích cho ảnh lặp lại nguyên vẹn: upload lại cùng file (/detect), nguồn
+# test phát lại video / ảnh tĩnh, camera treo trả mãi một frame. Frame camera
+# thật luôn khác nhau vì nhiễu cảm biến → gần như không trúng; cảnh đứng yên
+# trên camera thật do scene gate (YOLO_SCENE_THRESHOLD) xử lý. Luồng streaming
+# (start_streaming) gọi scheduler trực tiếp, không qua cache.
+CACHE_DIR = os.environ.get("YOLO_CACHE_DIR", "")                               # rỗng = chỉ cache trong RAM
+CACHE_ENABLED = os.environ.get("YOLO_CACHE", "1" if CACHE_DIR else "0") == "1"
+CACHE_MAX_MB = float(os.environ.get("YOLO_CACHE_MAX_MB", "256"))              # dung lượng tối đa trên đĩa
+CACHE_MEM_ITEMS = int(os.environ.get("YOLO_CACHE_MEM_ITEMS", "512"))          # số mục tối đa trong RAM
+
+detection_cache = None
+detect_model = scheduler
+if CACHE_ENABLED:
+    detection_cache = DetectionCache(CACHE_DIR or None, max_bytes=int(CACHE_MAX_MB * 1024 * 1024),
+                                     mem_items=CACHE_MEM_ITEMS)
+
+# -------------------------------------------------------------------------
+# RESULT WRITER - vẽ box, encode JPEG, ghi file ở thread nền (có backpressure)
+# -------------------------------------------------------------------------
+WRITER_WORKERS = int(os.environ.get("YOLO_WRITER_WORKERS", "2"))    # số thread ghi file
+WRITER_MAX_PENDING = int(os.environ.get("YOLO_WRITER_QUEUE", "8"))  # job chờ tối đa, đầy thì bỏ
+SAVE_RAW_UPLOAD = os.environ.get("YOLO_SAVE_RAW", "1") != "0"       # 0 = không lưu ảnh gốc
+
+result_writer = ResultWriter(workers=WRITER_WORKERS, max_pending=WRITER_MAX_PENDING)
+atexit.register(lambda: result_writer.stop())
+
+# -------------------------------------------------------------------------
+# RESULT BUS - mỗi kết quả detect được đẩy tới dashboard qua /events (SSE)
+# -------------------------------------------------------------------------
+EVENTS_HISTORY = int(os.environ.get("YOLO_EVENTS_HISTORY", "20"))            # số kết quả giữ cho client mới vào
+EVENTS_MAX_CLIENTS = int(os.environ.get("YOLO_EVENTS_MAX_CLIENTS", "8"))     # số dashboard /events đồng thời
+EVENTS_KEEPALIVE = float(os.environ.get("YOLO_EVENTS_KEEPALIVE", "15"))      # ping khi không có kết quả (giây)
+WRITE_LAST_JSON = os.environ.get("YOLO_LAST_DETECTION_JSON", "0") == "1"    # 1 = vẫn ghi static/last_detection.json
+
+result_bus = ResultBus(history=EVENTS_HISTORY, keepalive=EVENTS_KEEPALIVE, max_clients=EVENTS_MAX_CLIENTS)
+atexit.register(lambda: result_bus.stop())
 
 # -------------------------------------------------------------------------
 # LOAD DANH SÁCH CLASS TỪ FILE classes.txt
@@ -54,104 +138,75 @@ if os.path.exists(classes_file):
         CLASS_NAMES = []
 else:
     CLASS_NAMES = []
+
+# Ngưỡng conf riêng theo lớp, vd "0.5,0.4,0.5,0.5,0.3,0.5" (chỉ nâng ngưỡng so với conf chung)
+CLASS_CONF = parse_class_conf(os.environ.get("YOLO_CLASS_CONF", ""), len(CLASS_NAMES) if CLASS_NAMES else 6)
 #=================================
 #=====Module Detect Frame ========
 #=================================
-def detect_frame(frame, model, class_names, upload_folder, output_folder, static_dir, conf=0.5, iou=0.5):
-    """Run YOLO detection on a single frame, save input/output images.
+def detect_frame(frame, model, class_names, upload_folder, output_folder, static_dir, conf=0.5, iou=0.5,
+                 writer=None, save_raw=True, source_id=None, class_conf=None, roi_mask=None, roi=None,
+                 bus=None, write_json=True):
+    """Run YOLO detection on a single frame and queue input/output images for saving.
+
+    Counts and cmd are returned as soon as inference finishes; plotting, JPEG
+    encoding and file writes go to `writer` (ResultWriter) or run inline if None.
+    The result is published to `bus` (ResultBus, /events) if given; static/last_detection.json
+    is only written when write_json is True.
 
     Returns: (result_dict, cmd_str)
     """
     try:
-        # ensure folders exist
-        os.makedirs(upload_folder, exist_ok=True)
-        os.makedirs(output_folder, exist_ok=True)
-
-        # save original image
         timestamp = str(uuid.uuid4())[:8]
-        filename = f"camera_{timestamp}.jpg"
-        save_path = os.path.join(upload_folder, filename)
-        cv2.imwrite(save_path, frame)
+        prefix = f"camera_{source_id}" if source_id is not None else "camera"
+        filename = f"{prefix}_{timestamp}.jpg"
+        save_path = os.path.join(upload_folder, filename) if save_raw else None
 
-        # run model
-        results = model(frame, conf=conf, iou=iou)
-
-        # draw / create output image
-        try:
-            img_out = results[0].plot()
-        except Exception:
-            img_out = frame
+        # run model (có ROI → chỉ crop theo bbox ROI vào model, box trả về theo toạ độ frame)
+        if roi is not None:
+            det = detect_in_roi(model, frame, roi, conf=conf, iou=iou)
+        else:
+            det = model(frame, conf=conf, iou=iou)[0]
 
         name_only = os.path.splitext(filename)[0]
         ext = os.path.splitext(filename)[1]
         output_filename = f"{name_only}_detect{ext}"
         output_path = os.path.join(output_folder, output_filename)
-        cv2.imwrite(output_path, img_out)
 
-        # count classes
+        # count classes (vector hoá: lọc conf theo lớp + ROI + bincount trong 1 lần)
         num_classes = len(class_names) if class_names else 6
-        counts = [0] * num_classes
-        try:
-            boxes = results[0].boxes
-            if hasattr(boxes, 'cls'):
-                cls_vals = boxes.cls
-                # Convert class values to plain Python ints to avoid numpy __array__ deprecation
-                try:
-                    cls_arr = [int(x) for x in cls_vals]
-                except Exception:
-                    try:
-                        cls_arr = [int(float(x)) for x in cls_vals]
-                    except Exception:
-                        cls_arr = []
-                for c in cls_arr:
-                    if 0 <= int(c) < num_classes:
-                        counts[int(c)] += 1
-        except Exception:
-            counts = [0] * num_classes
-
-        total_vehicles = sum(counts)
-
-        # mapping total vehicles -> seconds and cmd
-        if 0 < total_vehicles < 5:
-            total_seconds = 20
-            cmd = "m1"
-        elif 5 <= total_vehicles <= 10:
-            total_seconds = 45
-            cmd = "m2"
-        elif 10 < total_vehicles <= 20:
-            total_seconds = 60
-            cmd = "m3"
-        elif total_vehicles > 20:
-            total_seconds = 90
-            cmd = "m4"
-        else:
-            total_seconds = 30
-            cmd = "m0"
-
-        yellow_seconds = 3
-        red_seconds = int(total_seconds)
-        green_seconds = max(0, red_seconds - yellow_seconds)
+        tiling = getattr(det, "tiling", None)
+        with metrics.timer("postprocess"):
+            summary = summarize(det, num_classes, class_conf=class_conf, roi_mask=roi_mask, roi=roi)
+        if roi is not None:
+            # ảnh kết quả chỉ vẽ box được đếm (trong đa giác) + viền ROI
+            det = Detections(frame, Boxes(summary.xyxy, summary.conf, summary.cls), det.names, det.polygons)
+        cmd = summary.cmd
 
         processed_url = f"/static/outputs/{output_filename}"
-        input_url = f"/static/uploads/{filename}"
+        input_url = f"/static/uploads/{filename}" if save_raw else None
 
         result = {
             "processed_image_url": processed_url,
             "input_image_url": input_url,
-            "counts": counts,
-            "total_vehicles": total_vehicles,
-            "total_seconds": total_seconds,
-            "green_seconds": green_seconds,
+            **summary.to_dict(),
             "status": "ready",
             "timestamp": int(time.time())
         }
-        # write last_detection.json so frontend polling can pick up UART-triggered detects
-        try:
-            last_path = os.path.join(static_dir, 'last_detection.json')
-            with open(last_path, 'w', encoding='utf-8') as jf:
-                json.dump(result, jf, ensure_ascii=False)
-        except Exception:
-            pass
+        if source_id is not None:
+            result["source"] = source_id
+        if tiling is not None:
+            result["tiling"] = tiling
+        # plot + imwrite (+ last_detection.json nếu bật) chạy ở thread nền
+        json_path = os.path.join(static_dir, 'last_detection.json') if write_json else None
+        job = PersistJob(frame, det, save_path, output_path, json_path, result)
+        if writer is not None:
+            writer.submit(job)
+        else:
+            persist_detection(job)
+        # đẩy ngay tới dashboard (ảnh có thể chưa ghi xong, frontend tự nạp lại ảnh)
+        if bus is not None:
+            bus.publish(result)
 
         return result, cmd
 
@@ -166,282 +221,249 @@ def index():
     # Trả về giao diện chính + gửi danh sách tên lớp về frontend
     return render_template("index.html", class_names=CLASS_NAMES)
 
-#======================================
-# CAMERA HANDLER - Quản lý camera trong thread riêng
-#======================================
-class CameraHandler:
-    # ===== __init__ =====
-    # Khởi tạo camera handler: thiết lập source, khoảng time reconnect, ngưỡng frame lỗi
-    def __init__(self, src=0, reconnect_interval=2.0, max_missed=20):
-        self.src = src
-        self.reconnect_interval = reconnect_interval  # khoảng time reconnect (giây)
-        self.max_missed = max_missed  # số frame lỗi tối đa trước khi reset camera
-        self.cap = None          # đối tượng VideoCapture
-        self.frame = None        # frame mới nhất
-        self.lock = threading.Lock()   # tránh xung đột khi đọc / ghi frame
-        self.thread = None
-        self.running = False
-        self._missed = 0         # đếm số frame lỗi liên tiếp
-    # ===== _open =====
-    # Mở kết nối camera: nếu đang mở thì release rồi mở lại
-    def _open(self):
-        """ Mở kết nối camera. Nếu đang mở thì release rồi mở lại. """
-        try:
-            if self.cap is not None:
-                try:
-                    self.cap.release()
-                except Exception:
-                    pass
-            # Windows dùng CAP_DSHOW tránh delay lúc mở camera
-            if os.name == 'nt':
-                self.cap = cv2.VideoCapture(self.src, cv2.CAP_DSHOW)
-            else:
-                self.cap = cv2.VideoCapture(self.src)
-            # giảm buffer để hạn chế độ trễ
-            try:
-                self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            except Exception:
-                pass
-        except Exception:
-            self.cap = None
-    # ===== start =====
-    # Bắt đầu đọc camera trong thread nền riêng
-    def start(self):
-        """ Bắt đầu đọc camera trong thread nền riêng """
-        if self.running:
-            return
-        self.running = True
-        self._open()  # mở camera lần đầu
-        self.thread = threading.Thread(target=self._reader, daemon=True)
-        self.thread.start()
-    # ===== _reader =====
-    # Luồng nền: đọc camera theo vòng lặp liên tục, lưu frame mới nhất, xử lý reconnect
-    def _reader(self):
-        """ Luồng nền: đọc camera theo vòng lặp liên tục """
-        while self.running:
-            if self.cap is None or not self.cap.isOpened():
-                self._open()                        # thử mở lại camera
-                time.sleep(self.reconnect_interval)
-                continue
-            try:
-                ret, frame = self.cap.read()       # đọc một frame
-            except Exception:
-                ret, frame = False, None
-            if not ret or frame is None:
-                self._missed += 1
-                if self._missed >= self.max_missed:
-                    # Nếu lỗi quá nhiều → reset camera
-                    try:
-                        self._open()
-                    except Exception:
-                        pass
-                    self._missed = 0
-                time.sleep(0.05)
-                continue
-            # Lưu frame vào biến chung
-            with self.lock:
-                self.frame = frame.copy()
-
-            self._missed = 0
-            time.sleep(0.01)
-
-    # ===== read =====
-    # Lấy frame mới nhất từ camera handler
-    def read(self):
-        """ Lấy frame mới nhất """
-        with self.lock:
-            if self.frame is None:
-                return False, None
-            return True, self.frame.copy()
-
-    # ===== is_opened =====
-    # Kiểm tra camera có mở được hay không
-    def is_opened(self):
-        """ Kiểm tra camera có mở được hay không """
-        return self.cap is not None and self.cap.isOpened()
-
-    # ===== stop =====
-    # Tắt thread đọc camera khi app dừng
-    def stop(self):
-        """ Tắt thread đọc camera khi app dừng """
-        self.running = False
-        if self.thread is not None:
-            self.thread.join(timeout=1.0)
-        try:
-            if self.cap is not None:
-                self.cap.release()
-        except Exception:
-            pass
-
-# Khởi tạo handler và bắt đầu đọc camera
-camera_handler = CameraHandler(0)
-camera_handler.start()
+# Khởi tạo các nguồn camera (mỗi hướng giao lộ một CameraHandler); bắt đầu đọc ở bước "cameras"
+CAMERA_RING_SIZE = int(os.environ.get("YOLO_CAMERA_RING", "4"))  # số buffer frame cấp phát sẵn
+SOURCES_FILE = os.environ.get("YOLO_SOURCES", os.path.join(BASE_DIR, "sources.json"))
+source_registry = SourceRegistry(ring_size=CAMERA_RING_SIZE).load(SOURCES_FILE)
+# camera mặc định (nguồn đầu tiên) cho các API không chỉ định source
+camera_handler = source_registry.get().camera
 
 # Khi app đóng → đảm bảo tắt camera
-atexit.register(lambda: camera_handler.stop())
-
-# -------------------------------------------------------------------------
-# UART HANDLER - Giao tiếp với ESP32
-# -------------------------------------------------------------------------
-class UARTHandler:
-    # ===== __init__ =====
-    # Khởi tạo UART handler: thiết lập port, baudrate, timeout, kết nối
-    def __init__(self, port="/dev/ttyAMA0", baudrate=115200, timeout=1):
-        self.port = port
-        self.baudrate = baudrate
-        self.timeout = timeout
-        self.uart = None
-        self.lock = threading.Lock()
-        self.running = False
-        self.thread = None
-        self._connect()
-    
-    # ===== _connect =====
-    # Kết nối UART với serial port (nếu pyserial có sẵn)
-    def _connect(self):
-        try:
-            if serial is None:
-                print("serial module not available")
-                return
-            self.uart = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
-            print(f"UART connected to {self.port}")
-        except Exception as e:
-            print(f"UART connection failed: {e}")
-            self.uart = None
-    
-    # ===== send =====
-    # Gửi cmd/message đến ESP32 qua UART
-    def send(self, msg):
-        if self.uart is None:
-            return False
-        try:
-            with self.lock:
-                self.uart.write((msg + "\n").encode())
-                print(f"UART sent: {msg}")
-            return True
-        except Exception as e:
-            print(f"UART send error: {e}")
-            return False
-    
-    # ===== start_listening =====
-    # Bắt đầu thread lắng nghe UART từ ESP32
-    def start_listening(self):
-        if self.running:
-            return
-        self.running = True
-        self.thread = threading.Thread(target=self._listen, daemon=True)
-        self.thread.start()
-        print("UART listener started")
-    
-    # ===== _listen =====
-    # Thread nền: lắng nghe UART từ ESP32, trigger xử lý khi nhận 'yell'
-    def _listen(self):
-        while self.running:
-            if self.uart is None or not self.uart.is_open:
-                time.sleep(0.5)
-                continue
-            try:
-                data = self.uart.readline().decode().strip()
-                if data:
-                    print(f"UART received: {data}")
-                    if data.lower() == "yell":
-                        # Trigger auto capture & detect
-                        self._handle_yell()
-            except Exception as e:
-                print(f"UART read error: {e}")
-                time.sleep(0.1)
-
-    # ===== _handle_yell =====
-    # Xử lý khi nhận 'yell' từ ESP32: chụp ảnh, detect, lưu, gửi lại m1..m4
-    def _handle_yell(self):
-        try:
-            # Use the shared capture flow so behavior matches /camera_capture
-            res, cmd = capture_and_detect(conf=0.5, iou=0.5)
-            if isinstance(res, dict) and res.get('error'):
-                print(f"Yell capture error: {res.get('error')}")
-                self.send("m0")
-            else:
-                self.send(cmd)
-                print(f"Detected {res.get('total_vehicles', 0)} vehicles, sent {cmd}")
-        except Exception as e:
-            print(f"Error handling yell: {e}")
-    
-    # ===== stop =====
-    # Tắt UART: dừng thread lắng nghe, đóng serial port
-    def stop(self):
-        """Tắt UART"""
-        self.running = False
-        if self.thread:
-            self.thread.join(timeout=1)
-        try:
-            if self.uart:
-                self.uart.close()
-        except:
-            pass
+atexit.register(lambda: source_registry.stop())
+
+# -------------------------------------------------------------------------
+# ROI - vùng đếm xe theo nguồn (rect / đa giác, xem roi.py), sửa file là có hiệu lực
+# -------------------------------------------------------------------------
+ROIS_FILE = os.environ.get("YOLO_ROIS", os.path.join(BASE_DIR, "rois.json"))
+roi_store = RoiStore(ROIS_FILE)
+
+# -------------------------------------------------------------------------
+# TILING - detect theo tile chồng lấn cho camera độ phân giải cao (xem tiling.py)
+# -------------------------------------------------------------------------
+TILE_SIZE = int(os.environ.get("YOLO_TILE_SIZE", "0"))                  # mặc định cho mọi nguồn, 0 = tắt
+TILE_OVERLAP = float(os.environ.get("YOLO_TILE_OVERLAP", "0.2"))        # tỉ lệ chồng lấn giữa 2 tile
+TILE_FULL_FRAME = os.environ.get("YOLO_TILE_FULL_FRAME", "1") == "1"    # thêm ảnh cả frame vào batch
+
+# model theo nguồn: nguồn có tiling (sources.json "tiling" hoặc YOLO_TILE_SIZE) chạy qua TiledModel
+# (điền trong load_model, khi đã biết tên lớp của model)
+source_models = {}
+
+def build_source_models(names):
+    for source in source_registry:
+        cfg = source.tiling
+        if cfg is None and TILE_SIZE:
+            cfg = {"tile_size": TILE_SIZE}
+        if cfg:
+            cfg = dict({"overlap": TILE_OVERLAP, "full_frame": TILE_FULL_FRAME}, **cfg)
+            source_models[source.id] = TiledModel(detect_model, names=names, source_id=source.id, **cfg)
+        else:
+            source_models[source.id] = detect_model
+
+# -------------------------------------------------------------------------
+# SCENE GATE - cảnh gần như không đổi (đêm, đèn đỏ) → dùng lại kết quả lần trước
+# -------------------------------------------------------------------------
+# Mặc định tắt: bật lên thì xe nhỏ / ở xa thay đổi < threshold pixel sẽ bị bỏ qua (dùng lại kết quả + lệnh UART cũ)
+SCENE_THRESHOLD = float(os.environ.get("YOLO_SCENE_THRESHOLD", "0"))      # tỉ lệ pixel thay đổi (vd. 0.01), 0 = tắt
+SCENE_PIXEL_DELTA = float(os.environ.get("YOLO_SCENE_PIXEL_DELTA", "12"))  # lệch bao nhiêu mức xám thì tính là đổi
+SCENE_MAX_AGE_S = float(os.environ.get("YOLO_SCENE_MAX_AGE", "30"))        # dùng lại tối đa (giây)
 
-uart_handler = UARTHandler()
-uart_handler.start_listening()
-atexit.register(lambda: uart_handler.stop())
+scene_gates = {s.id: SceneGate(SCENE_THRESHOLD, SCENE_PIXEL_DELTA, SCENE_MAX_AGE_S) for s in source_registry}
+
+# -------------------------------------------------------------------------
+# STREAMING DETECTOR - detect liên tục, UART 'yell' trả lời từ số xe đã tính sẵn
+# -------------------------------------------------------------------------
+STREAMING_ENABLED = os.environ.get("YOLO_STREAMING", "0") == "1"                # bật detect liên tục
+STREAMING_WINDOW_S = float(os.environ.get("YOLO_STREAMING_WINDOW", "10"))      # cửa sổ đếm (giây)
+STREAMING_MAX_AGE_S = float(os.environ.get("YOLO_STREAMING_MAX_AGE", "3"))     # mẫu cũ hơn → chụp lại
+STREAMING_MIN_STRIDE = int(os.environ.get("YOLO_STREAMING_MIN_STRIDE", "1"))   # stride nhỏ nhất (frame)
+
+streaming_detectors = {}
+atexit.register(lambda: [d.stop() for d in streaming_detectors.values()])
+
+def start_streaming():
+    for source in source_registry:
+        streaming_detectors[source.id] = StreamingDetector(
+            source.id, source.camera,
+            source_models[source.id] if isinstance(source_models[source.id], TiledModel) else scheduler,
+            num_classes=len(CLASS_NAMES) if CLASS_NAMES else 6, class_conf=CLASS_CONF,
+            window=STREAMING_WINDOW_S, min_stride=STREAMING_MIN_STRIDE,
+            roi_getter=lambda sid=source.id: roi_store.get(sid))
+        streaming_detectors[source.id].start()
+
+# -------------------------------------------------------------------------
+# ADMISSION CONTROL - giới hạn inference đồng thời, UART được ưu tiên (xem admission.py)
+# -------------------------------------------------------------------------
+ADMISSION_MAX_INFLIGHT = int(os.environ.get("YOLO_MAX_INFLIGHT", "2"))        # số chụp + detect đồng thời
+ADMISSION_UART_RESERVED = int(os.environ.get("YOLO_UART_RESERVED", "1"))      # slot chỉ dành cho UART
+ADMISSION_MAX_WAITING = int(os.environ.get("YOLO_MAX_WAITING", "4"))          # request web được xếp hàng
+ADMISSION_MAX_WAIT_MS = float(os.environ.get("YOLO_ADMISSION_WAIT_MS", "1000"))  # web chờ slot tối đa (ms)
+DEDUP_WINDOW_MS = float(os.environ.get("YOLO_DEDUP_WINDOW_MS", "300"))        # request giống nhau dùng chung kết quả
+
+admission = AdmissionController(ADMISSION_MAX_INFLIGHT, ADMISSION_UART_RESERVED,
+                                ADMISSION_MAX_WAITING, ADMISSION_MAX_WAIT_MS / 1000.0)
+shared_results = SharedResults(DEDUP_WINDOW_MS / 1000.0)
+
+# -------------------------------------------------------------------------
+# UART HANDLER - Giao tiếp với ESP32 (xem uart.py)
+# -------------------------------------------------------------------------
+UART_PORT = os.environ.get("YOLO_UART_PORT", "/dev/ttyAMA0")
+UART_DEADLINE_MS = float(os.environ.get("YOLO_UART_DEADLINE_MS", "800"))   # hạn trả lời 'yell' (ms), 0 = không giới hạn
+
+def uart_yell(target=None):
+    """Capture + detect for a UART 'yell'. Returns {source_id: (result, cmd)}"""
+    # ưu tiên số xe đã tính sẵn của streaming detector (nếu bật), không thì chụp + detect
+    if target == "all":
+        return capture_all(conf=0.5, iou=0.5, prefer_streaming=True, priority="uart")
+    # Use the shared capture flow so behavior matches /camera_capture
+    return {target: latest_or_capture(conf=0.5, iou=0.5, source_id=target, priority="uart")}
+
+# mở cổng serial ở bước khởi động "uart" (start_uart), None tới khi đó
+uart_handler = None
+atexit.register(lambda: uart_handler.stop() if uart_handler is not None else None)
+
+def start_uart():
+    global uart_handler
+    uart_handler = UARTHandler(UART_PORT, on_yell=uart_yell,
+                               deadline=UART_DEADLINE_MS / 1000.0 if UART_DEADLINE_MS > 0 else None,
+                               source_ids=source_registry.ids())
+    uart_handler.start_listening()
+    if uart_handler.uart is None:
+        raise RuntimeError(f"UART {UART_PORT} not connected")
 
 # -------------------------------------------------------------------------
 # STREAM CAMERA RA TRÌNH DUYỆT DẠNG MJPEG
 # -------------------------------------------------------------------------
-def gen_camera_frames():
+STREAM_FPS = float(os.environ.get("YOLO_STREAM_FPS", "15"))              # fps tối đa của stream
+STREAM_MAX_WIDTH = int(os.environ.get("YOLO_STREAM_MAX_WIDTH", "640"))   # độ phân giải tối đa
+STREAM_MAX_HEIGHT = int(os.environ.get("YOLO_STREAM_MAX_HEIGHT", "480"))
+STREAM_JPEG_QUALITY = int(os.environ.get("YOLO_STREAM_QUALITY", "70"))   # chất lượng JPEG
+
+# mỗi nguồn một broadcaster (thread encoder start ở bước "cameras")
+mjpeg_broadcasters = {}
+for _source in source_registry:
+    mjpeg_broadcasters[_source.id] = MjpegBroadcaster(
+        _source.camera, fps=STREAM_FPS, max_width=STREAM_MAX_WIDTH,
+        max_height=STREAM_MAX_HEIGHT, quality=STREAM_JPEG_QUALITY)
+atexit.register(lambda: [b.stop() for b in mjpeg_broadcasters.values()])
+
+def gen_camera_frames(source_id=None):
     """
     Gửi camera live stream dạng MJPEG (ảnh JPEG nối liên tục).
     Trình duyệt <img> tự cập nhật để tạo hiệu ứng video.
+    Mỗi frame chỉ encode 1 lần trong MjpegBroadcaster rồi phát cho mọi client.
     """
-    if not camera_handler.is_opened():
+    source = source_registry.get(source_id)
+    if source is None or not source.camera.is_opened():
         yield b''
         return
 
-    while True:
-        ret, frame = camera_handler.read()
-
-        if not ret or frame is None:
-            time.sleep(0.05)
-            continue
-
-        # encode khung ảnh thành JPG
-        ret2, jpeg = cv2.imencode('.jpg', frame)
-        if not ret2:
-            continue
-
+    for jpeg in mjpeg_broadcasters[source.id].frames():
         # MJPEG streaming trả về block JPEG
         yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
+               b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
 
 @app.route('/camera_stream')
 def camera_stream():
     """
     API hiển thị camera live stream.
     """
-    return Response(gen_camera_frames(),
+    return Response(gen_camera_frames(request.args.get('source')),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 # -------------------------------------------------------------------------
 # API CHỤP ẢNH + CHẠY YOLO + TRẢ KẾT QUẢ
 # -------------------------------------------------------------------------
-def capture_and_detect(conf=0.5, iou=0.5):
+def capture_and_detect(conf=0.5, iou=0.5, source_id=None, priority="web"):
     """Helper: read camera, run detect_frame, return (result_dict, cmd)
 
     Returns tuple (result, cmd). On error, result contains 'error' key.
+    priority: "uart" waits for the source / an inference slot, "web" is rejected
+    fast when overloaded (result has 'busy' and 'retry_after').
     """
-    if not camera_handler.is_opened():
-        return {"error": "Camera not available"}, "m0"
-
-    ret, frame = camera_handler.read()
-    if not ret or frame is None:
-        return {"error": "Không chụp được khung từ camera"}, "m0"
-
-    if model is None:
-        return {"error": "Model not loaded"}, "m0"
-
+    source = source_registry.get(source_id)
+    if source is None:
+        return {"error": f"Unknown source: {source_id}"}, "m0"
+
+    # đang khởi động (model chưa load / chưa warm-up) → báo bận: web nhận 503 + Retry-After, UART gửi m0
+    if not startup.ready():
+        return {"error": "Model not ready", "source": source.id, "busy": True,
+                "retry_after": startup.retry_after()}, "m0"
+
+    if not source.camera.is_opened() or source.is_stale():
+        return {"error": "Camera not available", "source": source.id}, "m0"
+
+    # mỗi nguồn giới hạn số lần detect đồng thời → camera treo không chiếm hết tài nguyên
+    # UART chờ lần detect đang chạy của nguồn xong thay vì bị từ chối
+    uart = priority == "uart"
+    if not source.acquire(timeout=INFER_TIMEOUT if uart else None):
+        return {"error": "Source busy", "source": source.id, "busy": True,
+                "retry_after": round(admission.retry_after(), 3)}, "m0"
     try:
-        res, cmd = detect_frame(frame, model, CLASS_NAMES, UPLOAD_FOLDER, OUTPUT_FOLDER, STATIC_DIR, conf=conf, iou=iou)
+        with metrics.timer("camera_read"):
+            ret, frame = source.camera.read()
+        if not ret or frame is None:
+            return {"error": "Không chụp được khung từ camera", "source": source.id}, "m0"
+        # so với frame của lần inference trước; gần như không đổi → trả lại kết quả cũ
+        roi = roi_store.get(source.id)
+        # kết quả cũ chỉ dùng lại được khi cùng ROI và cùng ngưỡng conf / iou
+        gate_tag = (roi_store.version, conf, iou)
+        gate = scene_gates[source.id]
+        with metrics.timer("scene_gate"):
+            # có ROI thì chỉ so sánh phần trong bbox ROI
+            thumb, previous = gate.check(roi.crop(frame)[0] if roi is not None else frame, tag=gate_tag)
+        if previous is not None:
+            prev_res, prev_cmd = previous
+            res = dict(prev_res, reused=True, scene_diff=round(gate.last_diff, 4), timestamp=int(time.time()))
+            # dashboard vẫn nhận kết quả qua /events dù không chạy model
+            result_bus.publish(res)
+            return res, prev_cmd
+        # read() trả view của ring buffer; inference + ghi ảnh chạy bất đồng bộ nên copy 1 lần ở đây
+        with metrics.timer("preprocess"):
+            frame = frame.copy()
+
+        # scheduler có cùng giao diện model(frame, conf=, iou=) nhưng chạy theo micro-batch
+        # giữ một slot inference trong lúc detect (quá tải → web bị từ chối ngay)
+        with admission.slot(priority, timeout=INFER_TIMEOUT if uart else None), metrics.timer("detect_total"):
+            res, cmd = detect_frame(frame, source_models[source.id], CLASS_NAMES, UPLOAD_FOLDER, OUTPUT_FOLDER, STATIC_DIR, conf=conf, iou=iou,
+                                    writer=result_writer, save_raw=SAVE_RAW_UPLOAD, source_id=source.id,
+                                    class_conf=CLASS_CONF, roi=roi, bus=result_bus, write_json=WRITE_LAST_JSON)
+        gate.update(thumb, res, cmd, tag=gate_tag)
         return res, cmd
+    except Overloaded as e:
+        return {"error": str(e), "source": source.id, "busy": True, "retry_after": round(e.retry_after, 3)}, "m0"
     except Exception as e:
-        return {"error": str(e)}, "m0"
+        return {"error": str(e), "source": source.id}, "m0"
+    finally:
+        source.release()
+
+def latest_or_capture(conf=0.5, iou=0.5, source_id=None, priority="web"):
+    """Answer from the streaming detector's rolling counts when fresh, else capture now."""
+    source = source_registry.get(source_id)
+    detector = streaming_detectors.get(source.id) if source is not None else None
+    if detector is not None:
+        snap = detector.snapshot(max_age=STREAMING_MAX_AGE_S)
+        if snap is not None:
+            return snap
+    return capture_and_detect(conf, iou, source_id, priority)
+
+# Thread pool chụp song song mọi nguồn; frame cùng lúc vào scheduler → chung 1 batch inference
+# UART có pool riêng để "yell all" không phải xếp hàng sau request web
+capture_pools = {p: ThreadPoolExecutor(max_workers=max(1, len(source_registry)), thread_name_prefix=f"capture-{p}")
+                 for p in ("web", "uart")}
+atexit.register(lambda: [p.shutdown(wait=False) for p in capture_pools.values()])
+
+def capture_all(conf=0.5, iou=0.5, prefer_streaming=False, priority="web"):
+    """Capture + detect on every source at once. Returns {source_id: (result, cmd)}"""
+    fn = latest_or_capture if prefer_streaming else capture_and_detect
+    pool = capture_pools[priority]
+    futures = {sid: pool.submit(fn, conf, iou, sid, priority) for sid in source_registry.ids()}
+    results = {}
+    for sid, fut in futures.items():
+        try:
+            results[sid] = fut.result()
+        except Exception as e:
+            results[sid] = ({"error": str(e), "source": sid}, "m0")
+    return results
 
 @app.route('/camera_capture', methods=['POST'])
 def camera_capture():
@@ -453,16 +475,226 @@ def camera_capture():
         iou = float(request.args.get('iou', 0.5))
     except Exception:
         iou = 0.5
-
-    res, cmd = capture_and_detect(conf, iou)
-
+    source_id = request.args.get('source')
+    # ?mode=stream → trả số xe theo cửa sổ của streaming detector (không chụp ảnh mới)
+    prefer_streaming = request.args.get('mode') == 'stream'
+    # request giống nhau (cùng nguồn, conf, iou, mode) trong cửa sổ dedup → dùng chung một lần detect
+    key = (source_id, conf, iou, prefer_streaming)
+
+    # ?source=all → detect mọi hướng trong một batch, trả {"sources": {id: result}}
+    if source_id == 'all':
+        results = shared_results.run(key, lambda: capture_all(conf, iou, prefer_streaming=prefer_streaming),
+                                     reusable=lambda r: not any(res.get('error') for res, _ in r.values()))
+        payload = {sid: dict(res, cmd=cmd) for sid, (res, cmd) in results.items()}
+        busy = [res for res, _ in results.values() if res.get('busy')]
+        if busy and len(busy) == len(results):
+            return busy_response({"sources": payload}, max(r["retry_after"] for r in busy))
+        return jsonify({"sources": payload})
+
+    fn = latest_or_capture if prefer_streaming else capture_and_detect
+    res, cmd = shared_results.run(key, lambda: fn(conf, iou, source_id),
+                                  reusable=lambda r: not (isinstance(r[0], dict) and r[0].get('error')))
+
+    if isinstance(res, dict) and res.get('busy'):
+        return busy_response(res, res["retry_after"])
     if isinstance(res, dict) and res.get('error'):
         return jsonify(res), 500
 
     return jsonify(res)
 
+def busy_response(payload, retry_after):
+    """503 + Retry-After: quá tải, client thử lại sau"""
+    response = jsonify(payload)
+    response.status_code = 503
+    response.headers["Retry-After"] = retry_after_header(retry_after)
+    return response
+
+@app.route('/events')
+def events():
+    """Server-Sent Events: mỗi kết quả detect (web, UART) được đẩy tới dashboard ngay khi có.
+
+    Client mới nhận lại history gần nhất; reconnect kèm Last-Event-ID chỉ nhận phần đã lỡ.
+    """
+    if not result_bus.subscribe():
+        return busy_response({"error": "Too many event clients"}, EVENTS_KEEPALIVE)
+    last_id = parse_last_event_id(request.headers.get("Last-Event-ID") or request.args.get("last_id"))
+    response = Response(result_bus.stream(last_id), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"     # nginx: không buffer stream
+    response.call_on_close(result_bus.unsubscribe)
+    return response
+
+@app.route('/last_detection')
+def last_detection():
+    """Kết quả detect mới nhất (thay cho static/last_detection.json với client không dùng SSE)"""
+    latest = result_bus.latest()
+    if latest is None:
+        return jsonify({"error": "No detection yet"}), 404
+    return jsonify(latest)
+
+@app.route('/admission')
+def admission_stats():
+    """Slot inference, hàng chờ, số request bị từ chối / dùng chung kết quả"""
+    return jsonify({"admission": admission.stats(), "dedup": shared_results.stats(),
+                    "scheduler_queue_depth": scheduler.queue.qsize()})
+
+@app.route('/rois', methods=['GET', 'POST'])
+def rois():
+    """GET: ROI đang dùng; POST: đọc lại file ROI ngay (bình thường tự đọc lại khi file đổi)"""
+    if request.method == 'POST':
+        ok = roi_store.reload()
+        return jsonify(roi_store.to_dict()), (200 if ok else 400)
+    return jsonify(roi_store.to_dict())
+
+@app.route('/sources')
+def list_sources():
+    """Danh sách nguồn camera đang cấu hình"""
+    return jsonify({"sources": [
+        {"id": s.id, "opened": s.camera.is_opened(), "seq": s.camera.latest_seq(), "age": s.camera.frame_age(),
+         "streaming": streaming_detectors[s.id].stats() if s.id in streaming_detectors else None,
+         "scene_gate": scene_gates[s.id].stats(),
+         "tiling": source_models[s.id].stats() if isinstance(source_models.get(s.id), TiledModel) else None}
+        for s in source_registry
+    ]})
+
+# -------------------------------------------------------------------------
+# KHỞI ĐỘNG - các bước chạy ở thread nền theo thứ tự (xem lifecycle.py)
+# -------------------------------------------------------------------------
+def start_writer():
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    result_writer.start()
+
+def start_cameras():
+    # mỗi camera tự mở ở thread đọc của nó → bước này không chờ thiết bị
+    source_registry.start()
+    for broadcaster in mjpeg_broadcasters.values():
+        broadcaster.start()
+
+def load_model():
+    """Load the inference backend (slow: weights + runtime import) and build the detect pipeline."""
+    global model, detect_model
+    model = load_backend(INFER_BACKEND, model_path, threads=INFER_THREADS, imgsz=INFER_IMGSZ)
+    scheduler.model = model
+    scheduler.start()
+    names = getattr(model, "names", None)
+    if detection_cache is not None:
+        detect_model = CachedModel(scheduler, detection_cache, weights_fingerprint(model_path, INFER_BACKEND),
+                                   names=names)
+    build_source_models(names)
+
+startup.add("writer", start_writer)
+startup.add("cameras", start_cameras)
+startup.add("uart", start_uart, required=False)      # ESP32 chưa cắm vẫn phục vụ web được
+startup.add("model", load_model)
+startup.add("warmup", warmup_model)
+if STREAMING_ENABLED:
+    startup.add("streaming", start_streaming, required=False)
+
+def create_app(background=True):
+    """Application factory: start model / camera / UART initialization and return the Flask app.
+
+    background=True returns at once (requests needing the model get 503 until /readyz is 200);
+    background=False runs every startup step before returning.
+    """
+    startup.start(background=background)
+    return app
+
+@app.before_request
+def lazy_start():
+    # chạy bằng "flask run" / WSGI server trỏ thẳng vào app (không qua create_app) → khởi tạo ở request đầu
+    if not startup.started():
+        startup.start()
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: process trả lời được và không có bước khởi động bắt buộc nào lỗi"""
+    status = startup.status()
+    return jsonify(status), (500 if status["failed"] else 200)
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: model đã load + warm-up xong; 503 + Retry-After khi đang khởi động"""
+    status = startup.status()
+    status["sources"] = {s.id: {"opened": s.camera.is_opened(), "age": s.camera.frame_age()} for s in source_registry}
+    status["uart"] = uart_handler is not None and uart_handler.uart is not None
+    if not status["ready"]:
+        return busy_response(status, startup.retry_after())
+    return jsonify(status)
+
+# -------------------------------------------------------------------------
+# METRICS (Prometheus text) + SAMPLING PROFILER
+# -------------------------------------------------------------------------
+PROFILER_ENABLED = os.environ.get("YOLO_PROFILER", "0") == "1"   # bật /debug/profile
+profiler = metrics.SamplingProfiler()
+
+metrics.gauge("scheduler_queue_depth", lambda: scheduler.queue.qsize(), "Frames waiting for inference")
+metrics.gauge("scheduler_batch_limit", lambda: scheduler._batch_limit, "Current adaptive batch size limit")
+metrics.gauge("writer_pending", lambda: result_writer.queue.qsize(), "Detections waiting to be written")
+metrics.gauge("writer_dropped", lambda: result_writer.dropped, "Detections dropped by the writer")
+metrics.gauge("stream_subscribers", lambda: {(("source", sid),): b._subscribers for sid, b in mjpeg_broadcasters.items()},
+              "Connected MJPEG clients")
+# uart_handler = None tới khi bước khởi tạo "uart" chạy (hoặc khi bước đó lỗi) → báo 0
+metrics.gauge("uart_inflight", lambda: len(uart_handler._inflight) if uart_handler is not None else 0,
+              "UART yells being processed")
+metrics.gauge("uart_deadline_misses", lambda: uart_handler.deadline_misses if uart_handler is not None else 0,
+              "UART yells answered with last known command")
+metrics.gauge("uart_coalesced", lambda: uart_handler.coalesced if uart_handler is not None else 0,
+              "Duplicate UART yells merged into one")
+metrics.gauge("scene_skipped_inferences", lambda: {(("source", sid),): g.skipped for sid, g in scene_gates.items()},
+              "Captures answered with the previous result (scene unchanged)")
+metrics.gauge("scene_inferences", lambda: {(("source", sid),): g.inferred for sid, g in scene_gates.items()},
+              "Captures that ran inference")
+if detection_cache is not None:
+    metrics.gauge("cache_hits", lambda: detection_cache.hits_memory + detection_cache.hits_disk,
+                  "Detections served from the cache")
+    metrics.gauge("cache_misses", lambda: detection_cache.misses, "Detections that ran inference")
+metrics.gauge("admission_inflight", lambda: {(("priority", p),): n for p, n in admission.stats()["inflight"].items()},
+              "Captures holding an inference slot")
+metrics.gauge("admission_waiting", lambda: {(("priority", p),): n for p, n in admission.stats()["waiting"].items()},
+              "Captures waiting for an inference slot")
+metrics.gauge("events_clients", lambda: result_bus.stats()["clients"], "Dashboards connected to /events")
+metrics.gauge("startup_ready", lambda: int(startup.ready()), "1 once the model is loaded and warmed up")
+metrics.gauge("startup_step_seconds",
+              lambda: {(("step", name),): st["seconds"] for name, st in startup.status()["steps"].items()
+                       if st["seconds"] is not None},
+              "Duration of each startup step")
+metrics.gauge("dedup_shared", lambda: shared_results.shared, "Capture requests answered with a shared result")
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Sample all thread stacks for ?seconds=N and return collapsed stacks (flamegraph input)."""
+    if not PROFILER_ENABLED:
+        return jsonify({"error": "Profiler disabled (set YOLO_PROFILER=1)"}), 404
+    try:
+        seconds = min(60.0, float(request.args.get('seconds', 5)))
+    except Exception:
+        seconds = 5.0
+    if not profiler.start():
+        return jsonify({"error": "Profiler already running"}), 409
+    time.sleep(seconds)
+    return Response(profiler.stop(), mimetype='text/plain')
+
 # -------------------------------------------------------------------------
 # CHAY SERVER FLASK
 # -------------------------------------------------------------------------
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    # khởi tạo model / camera / UART ở thread nền, server nhận request ngay (/readyz báo khi sẵn sàng)
+    create_app()
+    # Server thread cố định: quá YOLO_HTTP_WORKERS + YOLO_HTTP_BACKLOG kết nối → 503 ngay
+    # (flask run / app.run tạo một thread cho mỗi kết nối, không giới hạn)
+    server = PooledWSGIServer("0.0.0.0", int(os.environ.get("YOLO_PORT", "5000")), app,
+                              workers=int(os.environ.get("YOLO_HTTP_WORKERS", "16")),
+                              backlog=int(os.environ.get("YOLO_HTTP_BACKLOG", "32")),
+                              # MJPEG + SSE chạy ở thread riêng, không chiếm worker của /camera_capture
+                              stream_paths=("/camera_stream", "/events"),
+                              max_streams=int(os.environ.get("YOLO_HTTP_STREAMS", "16")))
+    print(f"Serving on http://0.0.0.0:{server.server_port} ({server.workers} HTTP workers)")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
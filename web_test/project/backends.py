@@ -0,0 +1,383 @@
+import os
+import ast
+import glob
+import argparse
+import numpy as np
+import cv2
+
+#======================================
+# INFERENCE BACKENDS - PyTorch (ultralytics) / ONNX Runtime / OpenVINO trên CPU
+#======================================
+# Mọi backend có cùng giao diện: backend(frames, conf=, iou=) -> list kết quả,
+# mỗi kết quả có .boxes.cls / .boxes.conf / .boxes.xyxy và .plot() như
+# ultralytics Results, nên detect_frame, scheduler, streaming detector dùng chung.
+#
+# Tên backend (YOLO_BACKEND):
+#   torch          best.pt qua ultralytics (PyTorch eager)
+#   onnx           best.onnx qua ONNX Runtime (FP32)
+#   onnx-int8      best_int8.onnx (quantize INT8)
+#   openvino       best_openvino_model/ qua OpenVINO
+#   openvino-int8  best_int8_openvino_model/
+# File export nằm cạnh best.pt; thiếu file thì export 1 lần từ best.pt (cần ultralytics).
+
+BACKEND_FILES = {
+    "torch": "best.pt",
+    "onnx": "best.onnx",
+    "onnx-int8": "best_int8.onnx",
+    "openvino": "best_openvino_model",
+    "openvino-int8": "best_int8_openvino_model",
+}
+
+DEFAULT_NAMES = ['car', 'threewheel', 'bus', 'truck', 'motorbike', 'van']
+
+
+# ===== default_threads =====
+# Số thread CPU mặc định cho inference
+def default_threads():
+    return max(1, os.cpu_count() or 1)
+
+
+# ===== letterbox =====
+# Resize giữ tỉ lệ + pad 114 về (size, size) giống ultralytics; trả ảnh, gain, (pad_x, pad_y)
+def letterbox(img, size=640):
+    h, w = img.shape[:2]
+    gain = min(size / h, size / w)
+    nh, nw = int(round(h * gain)), int(round(w * gain))
+    if (nh, nw) != (h, w):
+        img = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - nw) / 2, (size - nh) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return img, gain, (left, top)
+
+
+class Boxes:
+    """ Box dạng NumPy, tương thích các thuộc tính hay dùng của ultralytics Boxes """
+
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = xyxy.astype(np.float32, copy=False)
+        self.conf = conf.astype(np.float32, copy=False)
+        self.cls = cls.astype(np.float32, copy=False)
+
+    @property
+    def data(self):
+        return np.concatenate([self.xyxy, self.conf[:, None], self.cls[:, None]], axis=1)
+
+    def __len__(self):
+        return len(self.cls)
+
+
+class Detections:
+    """ Kết quả detect của một ảnh (thay cho ultralytics Results ở backend export) """
+
+    def __init__(self, orig_img, boxes, names, polygons=None):
+        self.orig_img = orig_img
+        self.boxes = boxes
+        self.names = names
+        self.polygons = polygons      # đường viền ROI vẽ kèm (list mảng (N, 2)), tuỳ chọn
+
+    # ===== plot =====
+    # Vẽ box + nhãn lên bản copy của ảnh gốc
+    def plot(self, line_width=2):
+        img = np.ascontiguousarray(self.orig_img).copy()
+        if self.polygons:
+            cv2.polylines(img, [np.round(p).astype(np.int32) for p in self.polygons], True, (0, 255, 255), line_width)
+        for (x1, y1, x2, y2), c, k in zip(self.boxes.xyxy.astype(int), self.boxes.conf, self.boxes.cls.astype(int)):
+            color = tuple(int(v) for v in cv2.applyColorMap(np.uint8([[k * 40 % 255]]), cv2.COLORMAP_HSV)[0, 0])
+            cv2.rectangle(img, (x1, y1), (x2, y2), color, line_width)
+            label = f"{self.names.get(k, k)} {c:.2f}"
+            cv2.putText(img, label, (x1, max(12, y1 - 4)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+        return img
+
+
+# ===== decode_yolov8 =====
+# Output YOLOv8 (4+nc, anchors) → lọc conf, NMS theo lớp, scale về ảnh gốc
+def decode_yolov8(pred, conf, iou, gain, pad, shape, max_det=300):
+    pred = pred.T                                   # (anchors, 4+nc)
+    scores_all = pred[:, 4:]
+    cls = scores_all.argmax(axis=1)
+    scores = scores_all[np.arange(len(cls)), cls]
+    keep = scores > conf
+    boxes, scores, cls = pred[keep, :4], scores[keep], cls[keep]
+    if len(scores) == 0:
+        empty = np.zeros((0,), np.float32)
+        return Boxes(np.zeros((0, 4), np.float32), empty, empty)
+    # cx, cy, w, h → x, y, w, h (góc trên trái) cho NMS của OpenCV
+    xywh = boxes.copy()
+    xywh[:, 0] -= xywh[:, 2] / 2
+    xywh[:, 1] -= xywh[:, 3] / 2
+    idx = cv2.dnn.NMSBoxesBatched(xywh.tolist(), scores.tolist(), cls.tolist(), conf, iou)
+    idx = np.asarray(idx, dtype=np.int64).reshape(-1)[:max_det]
+    xywh, scores, cls = xywh[idx], scores[idx], cls[idx]
+    xyxy = np.empty_like(xywh)
+    xyxy[:, 0] = (xywh[:, 0] - pad[0]) / gain
+    xyxy[:, 1] = (xywh[:, 1] - pad[1]) / gain
+    xyxy[:, 2] = (xywh[:, 0] + xywh[:, 2] - pad[0]) / gain
+    xyxy[:, 3] = (xywh[:, 1] + xywh[:, 3] - pad[1]) / gain
+    xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, shape[1])
+    xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, shape[0])
+    return Boxes(xyxy, scores, cls)
+
+
+# ===== _parse_names =====
+# Metadata 'names' do ultralytics ghi khi export ("{0: 'car', ...}")
+def _parse_names(raw, fallback):
+    try:
+        names = ast.literal_eval(raw) if isinstance(raw, str) else raw
+        if isinstance(names, dict):
+            return {int(k): v for k, v in names.items()}
+        if isinstance(names, (list, tuple)):
+            return dict(enumerate(names))
+    except Exception:
+        pass
+    return dict(enumerate(fallback or DEFAULT_NAMES))
+
+
+class ExportedBackend:
+    """ Phần chung của backend export: letterbox → chạy batch → decode """
+    batch_dynamic = False
+
+    def __init__(self, imgsz=640, names=None):
+        self.imgsz = imgsz
+        self.names = dict(enumerate(names or DEFAULT_NAMES))
+
+    def _run(self, blob):
+        raise NotImplementedError
+
+    # ===== __call__ =====
+    # frames: một ảnh BGR hoặc list ảnh BGR
+    def __call__(self, frames, conf=0.25, iou=0.7, **kwargs):
+        if isinstance(frames, np.ndarray):
+            frames = [frames]
+        metas, blobs = [], []
+        for frame in frames:
+            img, gain, pad = letterbox(frame, self.imgsz)
+            blobs.append(img)
+            metas.append((gain, pad, frame.shape))
+        # BGR HWC uint8 → RGB CHW float32 [0, 1]
+        batch = np.stack(blobs)[..., ::-1].transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+        if self.batch_dynamic:
+            preds = self._run(batch)
+        else:
+            preds = np.concatenate([self._run(batch[i:i + 1]) for i in range(len(batch))])
+        return [
+            Detections(frame, decode_yolov8(pred, conf, iou, gain, pad, shape), self.names)
+            for frame, pred, (gain, pad, shape) in zip(frames, preds, metas)
+        ]
+
+
+class OnnxBackend(ExportedBackend):
+    # ===== __init__ =====
+    # threads: số thread intra-op của ONNX Runtime
+    def __init__(self, path, threads=None, imgsz=640, names=None):
+        import onnxruntime as ort
+        super().__init__(imgsz, names)
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads or default_threads()
+        opts.inter_op_num_threads = 1
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.batch_dynamic = not isinstance(inp.shape[0], int)
+        if isinstance(inp.shape[2], int):
+            self.imgsz = inp.shape[2]
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.names = _parse_names(meta.get("names"), names)
+
+    def _run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoBackend(ExportedBackend):
+    # ===== __init__ =====
+    # path: thư mục *_openvino_model do ultralytics export (chứa .xml, .bin, metadata.yaml)
+    def __init__(self, path, threads=None, imgsz=640, names=None):
+        import openvino as ov
+        super().__init__(imgsz, names)
+        xml = glob.glob(os.path.join(path, "*.xml"))[0] if os.path.isdir(path) else path
+        core = ov.Core()
+        model = core.read_model(xml)
+        config = {"INFERENCE_NUM_THREADS": threads or default_threads(), "PERFORMANCE_HINT": "LATENCY"}
+        self.compiled = core.compile_model(model, "CPU", config)
+        shape = model.inputs[0].get_partial_shape()
+        self.batch_dynamic = shape[0].is_dynamic
+        if shape[2].is_static:
+            self.imgsz = shape[2].get_length()
+        meta_path = os.path.join(os.path.dirname(xml), "metadata.yaml")
+        if os.path.exists(meta_path):
+            import yaml
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                self.names = _parse_names(yaml.safe_load(f).get("names"), names)
+
+    def _run(self, blob):
+        return self.compiled(blob)[0]
+
+
+class TorchBackend:
+    """ best.pt qua ultralytics YOLO (PyTorch eager) """
+
+    def __init__(self, path, threads=None, imgsz=640, names=None):
+        import torch
+        from ultralytics import YOLO
+        torch.set_num_threads(threads or default_threads())
+        self.model = YOLO(path)
+        self.imgsz = imgsz
+        self.names = self.model.names
+
+    def __call__(self, frames, conf=0.25, iou=0.7, **kwargs):
+        return self.model(frames, conf=conf, iou=iou, imgsz=self.imgsz, verbose=False, **kwargs)
+
+
+# ===== backend_path =====
+# Đường dẫn file model của backend, nằm cạnh best.pt
+def backend_path(name, weights):
+    if name not in BACKEND_FILES:
+        raise ValueError(f"Unknown backend: {name} (choose from {', '.join(BACKEND_FILES)})")
+    return os.path.join(os.path.dirname(os.path.abspath(weights)), BACKEND_FILES[name])
+
+
+# ===== export_weights =====
+# Export best.pt sang định dạng của backend (chỉ cần chạy 1 lần)
+# calib_dir: thư mục ảnh để calibrate INT8 (ONNX static quantization); None → dynamic quantization
+def export_weights(weights, name, imgsz=640, calib_dir=None, data=None):
+    from ultralytics import YOLO
+    target = backend_path(name, weights)
+    model = YOLO(weights)
+    if name == "onnx":
+        out = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    elif name == "onnx-int8":
+        fp32 = backend_path("onnx", weights)
+        if not os.path.exists(fp32):
+            fp32 = export_weights(weights, "onnx", imgsz)
+        quantize_onnx(fp32, target, calib_dir, imgsz)
+        out = target
+    elif name == "openvino":
+        out = model.export(format="openvino", imgsz=imgsz, dynamic=True)
+    elif name == "openvino-int8":
+        # OpenVINO INT8 (NNCF) cần data.yaml để lấy ảnh calibrate
+        out = model.export(format="openvino", imgsz=imgsz, dynamic=True, int8=True, data=data)
+    else:
+        return weights
+    if os.path.abspath(out) != os.path.abspath(target) and os.path.exists(out):
+        os.replace(out, target)
+    return target
+
+
+# ===== quantize_onnx =====
+# INT8: static QDQ (per-channel) nếu có ảnh calibrate, không thì dynamic
+def quantize_onnx(src, dst, calib_dir=None, imgsz=640, max_images=64):
+    from onnxruntime import quantization as q
+    if not calib_dir:
+        q.quantize_dynamic(src, dst, weight_type=q.QuantType.QUInt8)
+        return dst
+
+    paths = []
+    for ext in ("*.jpg", "*.jpeg", "*.png"):
+        paths += glob.glob(os.path.join(calib_dir, ext))
+    paths = sorted(paths)[:max_images]
+
+    class _Reader(q.CalibrationDataReader):
+        def __init__(self):
+            self.it = iter(paths)
+
+        def get_next(self):
+            path = next(self.it, None)
+            if path is None:
+                return None
+            img, _, _ = letterbox(cv2.imread(path), imgsz)
+            blob = img[..., ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+            return {"images": np.ascontiguousarray(blob)}
+
+    q.quantize_static(src, dst, _Reader(), quant_format=q.QuantFormat.QDQ,
+                      per_channel=True, weight_type=q.QuantType.QInt8,
+                      activation_type=q.QuantType.QUInt8)
+    return dst
+
+
+# ===== load_backend =====
+# Tạo backend theo tên; export tự động nếu file chưa có (auto_export=True)
+def load_backend(name, weights, threads=None, imgsz=640, names=None, auto_export=True, **export_kwargs):
+    name = (name or "torch").lower()
+    if name == "torch":
+        return TorchBackend(weights, threads, imgsz, names)
+    path = backend_path(name, weights)
+    if not os.path.exists(path):
+        if not auto_export:
+            raise FileNotFoundError(path)
+        print(f"Exporting {weights} -> {path}")
+        path = export_weights(weights, name, imgsz, **export_kwargs)
+    if name.startswith("onnx"):
+        return OnnxBackend(path, threads, imgsz, names)
+    return OpenVinoBackend(path, threads, imgsz, names)
+
+
+# ===== ultralytics_model =====
+# YOLO của ultralytics chạy trên file của backend (cho code cần predict(save=True, ...))
+def ultralytics_model(name, weights, imgsz=640, **export_kwargs):
+    from ultralytics import YOLO
+    name = (name or "torch").lower()
+    if name == "torch":
+        return YOLO(weights)
+    path = backend_path(name, weights)
+    if not os.path.exists(path):
+        path = export_weights(weights, name, imgsz, **export_kwargs)
+    return YOLO(path, task="detect")
+
+
+# ===== compare_counts =====
+# So sánh số xe theo lớp giữa 2 backend trên một thư mục ảnh → số ảnh lệch
+def compare_counts(reference, candidate, image_dir, conf=0.5, iou=0.5, num_classes=6, limit=None):
+    paths = []
+    for ext in ("*.jpg", "*.jpeg", "*.png"):
+        paths += glob.glob(os.path.join(image_dir, ext))
+    paths = sorted(paths)[:limit]
+    mismatches = []
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        a = np.bincount(np.asarray(reference(img, conf=conf, iou=iou)[0].boxes.cls, dtype=np.int64), minlength=num_classes)
+        b = np.bincount(np.asarray(candidate(img, conf=conf, iou=iou)[0].boxes.cls, dtype=np.int64), minlength=num_classes)
+        if not np.array_equal(a[:num_classes], b[:num_classes]):
+            mismatches.append((os.path.basename(path), a.tolist(), b.tolist()))
+    return len(paths), mismatches
+
+
+# -----------------------------
+# CLI: export 1 lần / so sánh backend
+#   python backends.py export --backend onnx-int8 --calib "../../train/vehicle dataset/valid/images"
+#   python backends.py compare --backend onnx --images "../../train/vehicle dataset/valid/images"
+# -----------------------------
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    default_weights = os.path.join(base_dir, "../../runs/detect/my_yolov8n_train_meme/weights/best.pt")
+    parser = argparse.ArgumentParser(description="Export / compare CPU inference backends")
+    parser.add_argument("action", choices=["export", "compare"])
+    parser.add_argument("--backend", default="onnx", choices=list(BACKEND_FILES))
+    parser.add_argument("--weights", default=default_weights)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--calib", default=None, help="thư mục ảnh calibrate INT8 (onnx-int8)")
+    parser.add_argument("--data", default=None, help="data.yaml calibrate INT8 (openvino-int8)")
+    parser.add_argument("--images", default=None, help="thư mục ảnh để so sánh số xe")
+    parser.add_argument("--limit", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.action == "export":
+        print(export_weights(args.weights, args.backend, args.imgsz, calib_dir=args.calib, data=args.data))
+        return
+    reference = load_backend("torch", args.weights, args.threads, args.imgsz)
+    candidate = load_backend(args.backend, args.weights, args.threads, args.imgsz,
+                             calib_dir=args.calib, data=args.data)
+    total, mismatches = compare_counts(reference, candidate, args.images, limit=args.limit)
+    for name, a, b in mismatches:
+        print(f"{name}: torch={a} {args.backend}={b}")
+    print(f"{total - len(mismatches)}/{total} images with identical class counts")
+
+
+if __name__ == "__main__":
+    main()
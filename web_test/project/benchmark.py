@@ -0,0 +1,456 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#======================================
+# BENCHMARK - chạy code thật của app với camera giả, UART giả, client HTTP song song
+#======================================
+# python benchmark.py                                    # mọi kịch bản, nguồn synthetic, backend YOLO_BACKEND
+# python benchmark.py --video videos/south.mp4 --scenarios capture,uart --out bench.json
+# python benchmark.py --model synthetic:25               # model giả 25 ms / frame (đo phần còn lại của pipeline)
+# python benchmark.py --baseline bench_old.json          # in chênh lệch so với lần chạy trước
+#
+# Kịch bản:
+#   detect   gọi detect_frame() trực tiếp (model qua scheduler / cache như app)
+#   capture  C client song song POST /camera_capture
+#   stream   C client đọc /camera_stream (MJPEG), đo khoảng cách giữa các frame
+#   uart     gửi "yell" qua cặp pty (fake_serial.py) thay cho /dev/ttyAMA0, đo tới lúc nhận lệnh
+#   batch    RoiBatchEngine (đường chạy của run_test/run.py run_detection) trên thư mục ảnh
+# App được import trong cùng process (biến môi trường đặt trước khi import) và chạy
+# bằng server werkzeug đa luồng trên cổng ngẫu nhiên. Kết quả JSON: thông lượng,
+# độ trễ p50 / p95 / p99 (ms), RSS đỉnh (MB) theo từng kịch bản.
+# Ảnh kết quả được ghi vào static/ như khi chạy thật.
+
+SCENARIOS = ("detect", "capture", "stream", "uart", "batch")
+
+
+class SyntheticModel:
+    """ Model giả: ngủ latency_ms mỗi frame, trả vài box cố định (đo overhead ngoài model) """
+
+    def __init__(self, latency_ms=20.0, names=None):
+        from backends import DEFAULT_NAMES
+        self.latency = latency_ms / 1000.0
+        self.names = names or dict(enumerate(DEFAULT_NAMES))
+
+    def __call__(self, frames, conf=0.25, iou=0.7, **kwargs):
+        from backends import Boxes, Detections
+        if isinstance(frames, np.ndarray):
+            frames = [frames]
+        time.sleep(self.latency * len(frames))
+        results = []
+        for frame in frames:
+            h, w = frame.shape[:2]
+            xyxy = np.array([[0.1 * w, 0.2 * h, 0.3 * w, 0.5 * h], [0.5 * w, 0.5 * h, 0.8 * w, 0.9 * h]], np.float32)
+            results.append(Detections(frame, Boxes(xyxy, np.array([0.9, 0.8], np.float32),
+                                                   np.array([0, 4], np.float32)), self.names))
+        return results
+
+
+# ===== percentiles =====
+# Danh sách thời gian (giây) → thống kê ms
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples, np.float64) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"count": int(len(ms)), "mean": round(float(ms.mean()), 3), "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3), "p99": round(float(p99), 3), "max": round(float(ms.max()), 3)}
+
+
+# ===== rss_mb / reset_peak_rss =====
+# RSS đỉnh của process; Linux cho reset qua /proc/self/clear_refs để đo riêng từng kịch bản
+def rss_mb():
+    try:
+        with open("/proc/self/status", 'r') as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return round(int(fields["VmHWM"].split()[0]) / 1024, 1)
+    except (OSError, KeyError, ValueError):
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# ===== write_sources =====
+# File sources.json tạm: nguồn synthetic hoặc file video (lặp lại)
+def write_sources(path, video=None, sources=1, width=1280, height=720, fps=30, max_inflight=1):
+    entries = []
+    for i in range(sources):
+        if video:
+            entry = {"id": f"cam{i}", "src": os.path.abspath(video), "loop": True, "fps": fps}
+        else:
+            entry = {"id": f"cam{i}", "src": "synthetic", "width": width, "height": height, "fps": fps, "seed": i}
+        entries.append(dict(entry, max_inflight=max_inflight))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"sources": entries}, f)
+    return path
+
+
+class Harness:
+    # ===== __init__ =====
+    # Đặt biến môi trường rồi import app (app khởi tạo model, camera, UART lúc import)
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.serial = None
+        if "uart" in args.scenarios:
+            from fake_serial import FakeSerialPort
+            self.serial = FakeSerialPort()
+            os.environ["YOLO_UART_PORT"] = self.serial.port
+        else:
+            os.environ.setdefault("YOLO_UART_PORT", os.path.join(workdir, "no-uart"))
+        os.environ["YOLO_SOURCES"] = write_sources(os.path.join(workdir, "sources.json"), args.video,
+                                                   args.sources, args.width, args.height, args.fps,
+                                                   args.max_inflight)
+        # cảnh synthetic lặp lại → tắt scene gate và gộp request để mỗi lần chụp đều chạy model (trừ khi đã đặt)
+        os.environ.setdefault("YOLO_SCENE_THRESHOLD", "0")
+        os.environ.setdefault("YOLO_DEDUP_WINDOW_MS", "0")
+        if args.model.startswith("synthetic"):
+            import backends
+            latency = float(args.model.split(":", 1)[1]) if ":" in args.model else 20.0
+            backends.load_backend = lambda *a, **k: SyntheticModel(latency)
+        self.t0 = time.perf_counter()
+        sys.path.insert(0, BASE_DIR)
+        import app as app_module
+        self.app = app_module
+        self.import_s = time.perf_counter() - self.t0
+        self.first_response_s = None      # từ lúc import tới khi /healthz trả lời
+        self.ready_s = None               # từ lúc import tới khi /readyz = 200 (model load + warm-up)
+        self.server = None
+        self.base_url = None
+
+    # ===== start_server =====
+    def start_server(self):
+        from werkzeug.serving import make_server
+        self.server = make_server("127.0.0.1", 0, self.app.create_app(), threaded=True)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    # ===== wait_ready =====
+    # Chờ /healthz trả lời, /readyz = 200 (model đã warm-up) và nguồn camera có frame đầu tiên
+    def wait_ready(self, timeout=60.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(f"{self.base_url}/healthz", timeout=5):
+                    break
+            except Exception:
+                time.sleep(0.01)
+        self.first_response_s = time.perf_counter() - self.t0
+        while time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(f"{self.base_url}/readyz", timeout=5):
+                    break
+            except urllib.error.HTTPError as e:
+                if e.code != 503:
+                    raise
+            if self.app.startup.failed():
+                raise RuntimeError(f"Startup failed: {self.app.startup.status()['steps']}")
+            time.sleep(0.01)
+        self.ready_s = time.perf_counter() - self.t0
+        while time.monotonic() < deadline:
+            if all(s.camera.latest_seq() > 0 for s in self.app.source_registry):
+                break
+            time.sleep(0.05)
+
+    # ===== bench_detect =====
+    def bench_detect(self):
+        app = self.app
+        source = app.source_registry.get()
+        latencies, errors = [], 0
+        t0 = time.perf_counter()
+        for _ in range(self.args.requests):
+            # frame là view của ring buffer → copy như capture_and_detect
+            ok, frame = source.camera.read()
+            if not ok:
+                errors += 1
+                continue
+            frame = frame.copy()
+            t = time.perf_counter()
+            res, _ = app.detect_frame(frame, app.source_models[source.id], app.CLASS_NAMES, app.UPLOAD_FOLDER,
+                                      app.OUTPUT_FOLDER, app.STATIC_DIR, writer=app.result_writer,
+                                      save_raw=app.SAVE_RAW_UPLOAD, source_id=source.id, class_conf=app.CLASS_CONF,
+                                      bus=app.result_bus, write_json=app.WRITE_LAST_JSON)
+            latencies.append(time.perf_counter() - t)
+            errors += bool(res.get("error"))
+        return latencies, errors, time.perf_counter() - t0, {}
+
+    # ===== bench_capture =====
+    def bench_capture(self):
+        url = f"{self.base_url}/camera_capture?conf=0.5&iou=0.5"
+        if self.args.capture_source:
+            url += f"&source={self.args.capture_source}"
+
+        def one(_):
+            t = time.perf_counter()
+            try:
+                req = urllib.request.Request(url, data=b"", method="POST")
+                with urllib.request.urlopen(req, timeout=60) as resp:
+                    resp.read()
+                    status = str(resp.status)
+            except urllib.error.HTTPError as e:
+                # lỗi có body JSON ("Source busy", ...) → gom theo lý do
+                try:
+                    reason = json.loads(e.read()).get("error", "")
+                except Exception:
+                    reason = ""
+                status = f"{e.code} {reason}".strip()
+            except Exception as e:
+                status = type(e).__name__
+            return time.perf_counter() - t, status
+
+        dedup0 = self.app.shared_results.stats()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            results = list(pool.map(one, range(self.args.requests)))
+        elapsed = time.perf_counter() - t0
+        statuses = {}
+        for _, status in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        # độ trễ / thông lượng chỉ tính request thành công; request bị từ chối nằm trong "status"
+        ok = [lat for lat, status in results if status == "200"]
+        # shared = request nhận kết quả của request khác, không chạy model (window = 0 vẫn gộp
+        # các request trùng đang chạy cùng lúc); so sánh giữa các lần đo theo executed
+        dedup = self.app.shared_results.stats()
+        return ok, len(results) - len(ok), elapsed, \
+            {"concurrency": self.args.concurrency, "status": statuses,
+             "dedup": {"window": dedup["window"], "executed": dedup["executed"] - dedup0["executed"],
+                       "shared": dedup["shared"] - dedup0["shared"]}}
+
+    # ===== bench_stream =====
+    # Mỗi client đọc MJPEG trong `duration` giây; độ trễ = khoảng cách giữa 2 frame liên tiếp
+    def bench_stream(self):
+        url = f"{self.base_url}/camera_stream"
+        duration = self.args.duration
+
+        def client(_):
+            gaps, frames, last = [], 0, None
+            end = time.monotonic() + duration
+            try:
+                with urllib.request.urlopen(url, timeout=10) as resp:
+                    buf = b""
+                    while time.monotonic() < end:
+                        chunk = resp.read1(65536) if hasattr(resp, "read1") else resp.read(4096)
+                        if not chunk:
+                            break
+                        buf += chunk
+                        n = buf.count(b"--frame")
+                        if n:
+                            now = time.perf_counter()
+                            for _ in range(n):
+                                if last is not None:
+                                    gaps.append(now - last)
+                                last = now
+                            frames += n
+                            buf = buf[buf.rfind(b"--frame") + 7:]
+            except Exception:
+                return gaps, frames, False
+            return gaps, frames, True
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            results = list(pool.map(client, range(self.args.concurrency)))
+        elapsed = time.perf_counter() - t0
+        gaps = [g for r in results for g in r[0]]
+        frames = sum(r[1] for r in results)
+        return gaps, sum(not r[2] for r in results), elapsed, \
+            {"clients": self.args.concurrency, "frames": frames,
+             "fps_per_client": round(frames / max(elapsed, 1e-9) / max(1, self.args.concurrency), 2)}
+
+    # ===== bench_uart =====
+    # Gửi yell tuần tự, chờ đủ số dòng trả lời (1, hoặc số nguồn với "yell all")
+    def bench_uart(self):
+        if self.serial is None:
+            return [], 0, 0.0, {"skipped": "no fake serial port"}
+        line = "yell all" if self.args.yell_all else "yell"
+        expect = len(self.app.source_registry) if self.args.yell_all else 1
+        handler = self.app.uart_handler
+        misses0 = handler.deadline_misses
+        deadline = time.monotonic() + 10
+        while handler.uart is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        latencies, errors, replies = [], 0, {}
+        t0 = time.perf_counter()
+        for _ in range(self.args.requests):
+            t = time.perf_counter()
+            self.serial.write_line(line)
+            got = self.serial.read_lines(expect, timeout=30)
+            if len(got) < expect:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - t)
+            for reply in got:
+                replies[reply] = replies.get(reply, 0) + 1
+        elapsed = time.perf_counter() - t0
+        return latencies, errors, elapsed, {"command": line, "deadline_misses": handler.deadline_misses - misses0,
+                                            "replies": replies}
+
+    # ===== bench_batch =====
+    # RoiBatchEngine trên thư mục ảnh (--images) hoặc ảnh synthetic tạo tạm
+    def bench_batch(self):
+        sys.path.insert(0, os.path.join(BASE_DIR, "..", "..", "run_test"))
+        from roi_batch import RoiBatchEngine, list_images
+        image_dir = self.args.images
+        if not image_dir:
+            from camera import SyntheticCapture
+            image_dir = os.path.join(self.workdir, "images")
+            os.makedirs(image_dir, exist_ok=True)
+            cap = SyntheticCapture(self.args.width, self.args.height, seed=7)
+            for i in range(self.args.batch_images):
+                _, frame = cap.read()
+                cv2.imwrite(os.path.join(image_dir, f"{i:05d}.jpg"), frame)
+        paths = list_images(image_dir)[:self.args.batch_images]
+        engine = RoiBatchEngine(self.app.model, batch_size=self.args.batch_size, conf=0.5, iou=0.5,
+                                out_dir=os.path.join(self.workdir, "batch_out"), save_image=True, save_txt=True)
+        gaps, errors, last = [], 0, time.perf_counter()
+        t0 = last
+        for item in engine.run(paths):
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+            errors += bool(item.get("error"))
+        elapsed = time.perf_counter() - t0
+        return gaps, errors, elapsed, {"images": len(paths), "batch_size": self.args.batch_size,
+                                       "infer_seconds": round(engine.stats["infer_seconds"], 3)}
+
+    # ===== run =====
+    def run(self):
+        self.start_server()
+        self.wait_ready()
+        report = {}
+        for name in self.args.scenarios:
+            reset_peak_rss()
+            latencies, errors, elapsed, extra = getattr(self, f"bench_{name}")()
+            ops = len(latencies) if name != "stream" else extra.get("frames", 0)
+            report[name] = {
+                "ops": ops,
+                "errors": errors,
+                "seconds": round(elapsed, 3),
+                "throughput": round(ops / elapsed, 3) if elapsed > 0 else 0.0,
+                "latency_ms": percentiles(latencies),
+                "peak_rss_mb": rss_mb(),
+                **extra,
+            }
+            r = report[name]
+            lat = r["latency_ms"]
+            print(f"{name:<8} {r['throughput']:>8.2f} ops/s  p50 {lat.get('p50', 0):>8.1f}  "
+                  f"p95 {lat.get('p95', 0):>8.1f}  p99 {lat.get('p99', 0):>8.1f} ms  "
+                  f"errors {errors}  rss {r['peak_rss_mb']} MB", file=sys.stderr)
+        return report
+
+    # ===== close =====
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+        if self.serial is not None:
+            self.serial.close()
+
+
+# ===== environment_info =====
+def environment_info(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "backend": "synthetic" if args.model.startswith("synthetic") else os.environ.get("YOLO_BACKEND", "torch"),
+        "model": args.model,
+        "source": args.video or f"synthetic {args.width}x{args.height}@{args.fps}",
+        "sources": args.sources,
+        "env": {k: v for k, v in sorted(os.environ.items()) if k.startswith("YOLO_")},
+    }
+
+
+# ===== compare =====
+# In chênh lệch thông lượng / p95 so với file kết quả cũ
+def compare(report, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        base = json.load(f).get("scenarios", {})
+    print(f"\n{'scenario':<10}{'ops/s':>10}{'Δ':>8}{'p95 ms':>10}{'Δ':>8}{'rss MB':>9}{'Δ':>8}", file=sys.stderr)
+    pct = lambda new, old: f"{(new - old) / old * 100:+.1f}%" if old else "-"
+    for name, r in report.items():
+        b = base.get(name)
+        if not b:
+            continue
+        p95, bp95 = r["latency_ms"].get("p95", 0), b["latency_ms"].get("p95", 0)
+        print(f"{name:<10}{r['throughput']:>10.2f}{pct(r['throughput'], b['throughput']):>8}{p95:>10.1f}"
+              f"{pct(p95, bp95):>8}{r['peak_rss_mb']:>9.1f}{pct(r['peak_rss_mb'], b['peak_rss_mb']):>8}",
+              file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the detection server")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma list of {', '.join(SCENARIOS)}")
+    parser.add_argument("--model", default="backend", help="'backend' (YOLO_BACKEND + best.pt) or synthetic[:ms]")
+    parser.add_argument("--video", default=None, help="video file used as camera source (default: synthetic frames)")
+    parser.add_argument("--sources", type=int, default=1, help="number of camera sources")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--max-inflight", type=int, default=1, help="concurrent detections per source (sources.json)")
+    parser.add_argument("--requests", type=int, default=50, help="operations per scenario (detect/capture/uart)")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel HTTP clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per stream client")
+    parser.add_argument("--capture-source", default=None, help="?source= for /camera_capture (e.g. all)")
+    parser.add_argument("--yell-all", action="store_true", help="send 'yell all' instead of 'yell'")
+    parser.add_argument("--images", default=None, help="image folder for the batch scenario")
+    parser.add_argument("--batch-images", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--out", default=None, help="write JSON results here (default: stdout)")
+    parser.add_argument("--baseline", default=None, help="previous JSON results to compare against")
+    args = parser.parse_args(argv)
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {sorted(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix="yolo_bench_")
+    harness = Harness(args, workdir)
+    try:
+        scenarios = harness.run()
+    finally:
+        harness.close()
+    startup = {"import_s": round(harness.import_s, 3), "first_response_s": round(harness.first_response_s or 0, 3),
+               "ready_s": round(harness.ready_s or 0, 3)}
+    result = {"meta": dict(environment_info(args), startup=startup), "scenarios": scenarios}
+    text = json.dumps(result, indent=1)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.out}", file=sys.stderr)
+    else:
+        print(text)
+    if args.baseline:
+        compare(scenarios, args.baseline)
+    # thread nền của app (camera, scheduler, UART) là daemon / dừng qua atexit
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+import os
+import threading
+import time
+import cv2
+import numpy as np
+import metrics
+
+#======================================
+# CAMERA HANDLER - Quản lý camera trong thread riêng
+#======================================
+# Frame được decode thẳng vào một ring buffer cấp phát sẵn (cap.read(buf)),
+# mỗi frame có sequence number tăng dần. Consumer nhận view read-only (không
+# copy) và có thể chờ tới khi có frame mới hơn frame đã thấy.
+# Lưu ý: view chỉ hợp lệ tới khi ring quay vòng (ring_size - 1 frame sau);
+# nơi nào giữ frame lâu hơn (inference bất đồng bộ, ghi file) phải tự copy.
+
+
+class SyntheticCapture:
+    """ Nguồn frame giả (các khối chữ nhật di chuyển) có giao diện giống cv2.VideoCapture """
+
+    # ===== __init__ =====
+    # objects: số "xe" giả trên khung hình; seed cố định để kết quả lặp lại được
+    def __init__(self, width=640, height=480, objects=6, seed=0):
+        self.width = int(width)
+        self.height = int(height)
+        rng = np.random.default_rng(seed)
+        self._pos = rng.uniform(0, 1, size=(objects, 2)) * (self.width, self.height)
+        self._vel = rng.uniform(-6, 6, size=(objects, 2))
+        self._size = rng.integers(20, 80, size=(objects, 2))
+        self._color = rng.integers(0, 255, size=(objects, 3))
+        self._opened = True
+
+    def isOpened(self):
+        return self._opened
+
+    def set(self, prop, value):
+        return False
+
+    # ===== read =====
+    # Vẽ frame kế tiếp vào image (nếu đúng shape) giống cap.read(buf)
+    def read(self, image=None):
+        if not self._opened:
+            return False, None
+        shape = (self.height, self.width, 3)
+        if image is None or image.shape != shape or image.dtype != np.uint8:
+            image = np.empty(shape, dtype=np.uint8)
+        image[:] = 90
+        self._pos = (self._pos + self._vel) % (self.width, self.height)
+        for (x, y), (w, h), color in zip(self._pos.astype(int), self._size, self._color):
+            cv2.rectangle(image, (x, y), (x + int(w), y + int(h)), tuple(int(c) for c in color), -1)
+        return True, image
+
+    def release(self):
+        self._opened = False
+
+
+class CameraHandler:
+    # ===== __init__ =====
+    # Khởi tạo camera handler: thiết lập source, khoảng time reconnect, ngưỡng frame lỗi
+    # ring_size: số buffer frame cấp phát sẵn
+    # fps: giới hạn tốc độ đọc (cần cho file video / nguồn giả; webcam tự chặn theo nhịp)
+    # loop: tua lại từ đầu khi file video hết
+    # capture_factory: hàm tạo đối tượng capture thay cho cv2.VideoCapture (vd. SyntheticCapture)
+    # name: tên nguồn dùng làm label trong /metrics
+    def __init__(self, src=0, reconnect_interval=2.0, max_missed=20, ring_size=4,
+                 fps=None, loop=False, capture_factory=None, name=None):
+        self.src = src
+        self.name = str(src) if name is None else name
+        self.fps = fps
+        self.loop = loop
+        self.capture_factory = capture_factory
+        self.reconnect_interval = reconnect_interval  # khoảng time reconnect (giây)
+        self.max_missed = max_missed  # số frame lỗi tối đa trước khi reset camera
+        self.cap = None          # đối tượng VideoCapture
+        self.ring_size = max(2, int(ring_size))
+        self._slots = [None] * self.ring_size   # buffer ghi (writable), tái sử dụng mỗi vòng
+        self._views = [None] * self.ring_size   # view read-only tương ứng trả cho consumer
+        self._slot_seq = [0] * self.ring_size   # seq của frame đang nằm trong từng slot
+        self._latest = -1        # index slot chứa frame mới nhất
+        self.seq = 0             # sequence number của frame mới nhất (0 = chưa có frame)
+        self.frame_time = 0.0    # thời điểm (monotonic) nhận frame mới nhất
+        self.cond = threading.Condition()  # báo cho consumer khi có frame mới
+        self.thread = None
+        self.running = False
+        self._missed = 0         # đếm số frame lỗi liên tiếp
+
+    # ===== _open =====
+    # Mở kết nối camera: nếu đang mở thì release rồi mở lại
+    def _open(self):
+        """ Mở kết nối camera. Nếu đang mở thì release rồi mở lại. """
+        metrics.inc("camera_reconnects_total", source=self.name)
+        try:
+            if self.cap is not None:
+                try:
+                    self.cap.release()
+                except Exception:
+                    pass
+            # Windows dùng CAP_DSHOW tránh delay lúc mở camera
+            if self.capture_factory is not None:
+                self.cap = self.capture_factory()
+            elif os.name == 'nt' and isinstance(self.src, int):
+                self.cap = cv2.VideoCapture(self.src, cv2.CAP_DSHOW)
+            else:
+                self.cap = cv2.VideoCapture(self.src)
+            # giảm buffer để hạn chế độ trễ
+            try:
+                self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            except Exception:
+                pass
+        except Exception:
+            self.cap = None
+
+    # ===== start =====
+    # Bắt đầu đọc camera trong thread nền riêng (mở camera lần đầu cũng ở thread đó → không chặn)
+    def start(self):
+        """ Bắt đầu đọc camera trong thread nền riêng """
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._reader, daemon=True)
+        self.thread.start()
+
+    # ===== _grab =====
+    # Đọc một frame vào buffer cho sẵn (cv2 tái sử dụng nếu đúng shape/dtype)
+    def _grab(self, buf):
+        if buf is None:
+            return self.cap.read()
+        return self.cap.read(buf)
+
+    # ===== _reader =====
+    # Luồng nền: đọc camera liên tục vào ring buffer, xử lý reconnect
+    def _reader(self):
+        """ Luồng nền: đọc camera theo vòng lặp liên tục """
+        interval = 1.0 / self.fps if self.fps else 0.0
+        next_tick = time.monotonic()
+        while self.running:
+            if self.cap is None or not self.cap.isOpened():
+                self._open()                        # mở (lại) camera
+                if self.cap is None or not self.cap.isOpened():
+                    time.sleep(self.reconnect_interval)
+                continue
+            # slot kế tiếp sau slot mới nhất (không bao giờ ghi đè frame mới nhất)
+            idx = (self._latest + 1) % self.ring_size
+            with self.cond:
+                self._slot_seq[idx] = 0   # slot sắp bị ghi đè → view cũ không còn hợp lệ
+            try:
+                ret, frame = self._grab(self._slots[idx])  # cap.read() tự chặn theo nhịp camera
+            except Exception:
+                ret, frame = False, None
+            if not ret or frame is None:
+                if self.loop and self._missed == 0 and self._rewind():
+                    self._missed = 1    # file rỗng/hỏng thì lần sau không tua lại liên tục
+                    continue
+                self._missed += 1
+                metrics.inc("camera_missed_frames_total", source=self.name)
+                if self._missed >= self.max_missed:
+                    # Nếu lỗi quá nhiều → reset camera
+                    try:
+                        self._open()
+                    except Exception:
+                        pass
+                    self._missed = 0
+                time.sleep(0.05)
+                continue
+            self._publish(idx, frame)
+            self._missed = 0
+            if interval:
+                # giữ nhịp fps cho nguồn không tự chặn (file video, nguồn giả)
+                next_tick = max(next_tick + interval, time.monotonic() - interval)
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+    # ===== _rewind =====
+    # Tua file video về frame đầu (dùng khi loop=True)
+    def _rewind(self):
+        try:
+            return bool(self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0))
+        except Exception:
+            return False
+
+    # ===== _publish =====
+    # Đánh dấu slot idx là frame mới nhất và đánh thức các consumer đang chờ
+    def _publish(self, idx, frame):
+        with self.cond:
+            if frame is not self._slots[idx]:
+                # lần đầu hoặc đổi độ phân giải → cv2 cấp phát mảng mới, giữ lại làm buffer
+                self._slots[idx] = frame
+                view = frame.view()
+                view.flags.writeable = False
+                self._views[idx] = view
+            self.seq += 1
+            self._slot_seq[idx] = self.seq
+            self._latest = idx
+            self.frame_time = time.monotonic()
+            self.cond.notify_all()
+
+    # ===== read =====
+    # Lấy frame mới nhất (view read-only, không copy)
+    def read(self):
+        """ Lấy frame mới nhất """
+        ok, _, frame = self.read_latest()
+        return ok, frame
+
+    # ===== read_latest =====
+    # Lấy (ok, seq, frame) của frame mới nhất
+    def read_latest(self):
+        with self.cond:
+            if self._latest < 0:
+                return False, 0, None
+            return True, self.seq, self._views[self._latest]
+
+    # ===== wait_for_frame =====
+    # Chặn tới khi có frame mới hơn last_seq (hoặc hết timeout) → (ok, seq, frame)
+    def wait_for_frame(self, last_seq=0, timeout=1.0):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > last_seq or not self.running, timeout):
+                return False, last_seq, None
+            if self._latest < 0 or self.seq <= last_seq:
+                return False, last_seq, None
+            return True, self.seq, self._views[self._latest]
+
+    # ===== is_fresh =====
+    # View của frame seq còn hợp lệ không (slot chưa bị ghi đè)
+    def is_fresh(self, seq):
+        with self.cond:
+            return seq > 0 and seq in self._slot_seq
+
+    # ===== latest_seq =====
+    # Sequence number của frame mới nhất (không copy frame)
+    def latest_seq(self):
+        return self.seq
+
+    # ===== frame_age =====
+    # Số giây kể từ frame mới nhất (None nếu chưa có frame)
+    def frame_age(self):
+        if self.seq == 0:
+            return None
+        return time.monotonic() - self.frame_time
+
+    # ===== is_opened =====
+    # Kiểm tra camera có mở được hay không
+    def is_opened(self):
+        """ Kiểm tra camera có mở được hay không """
+        return self.cap is not None and self.cap.isOpened()
+
+    # ===== stop =====
+    # Tắt thread đọc camera khi app dừng
+    def stop(self):
+        """ Tắt thread đọc camera khi app dừng """
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        try:
+            if self.cap is not None:
+                self.cap.release()
+        except Exception:
+            pass
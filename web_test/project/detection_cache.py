@@ -0,0 +1,234 @@
+import os
+import glob
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from backends import Boxes, Detections, backend_path, DEFAULT_NAMES
+from postprocess import box_arrays
+
+#======================================
+# DETECTION CACHE - bỏ qua inference khi ảnh (hoặc crop ROI) đã detect rồi
+#======================================
+# Key = hash nội dung ảnh đã giải mã / đã crop + hash weights + conf + iou + ROI.
+# Hai tầng: LRU trong RAM (số mục) phía trước, thư mục trên đĩa (giới hạn dung
+# lượng, xoá mục ít dùng nhất) phía sau. Giá trị chỉ là box (xyxy, conf, cls)
+# nên mỗi mục chỉ vài KB; khi trúng cache, kết quả dựng lại thành
+# backends.Detections (có .boxes, .plot()) như kết quả thật.
+
+
+# ===== weights_fingerprint =====
+# Hash file model thực sự được chạy (file export nếu có) + tên backend
+def weights_fingerprint(weights, backend="torch"):
+    path = weights
+    if backend and backend != "torch":
+        try:
+            path = backend_path(backend, weights)
+        except ValueError:
+            pass
+    files = sorted(glob.glob(os.path.join(path, "*"))) if os.path.isdir(path) else [path]
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(backend).encode())
+    for f in files:
+        if not os.path.isfile(f):
+            continue
+        with open(f, 'rb') as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+# ===== image_hash =====
+# Hash nội dung ảnh (pixel + shape), không phụ thuộc file JPEG gốc
+def image_hash(img):
+    h = hashlib.blake2b(np.ascontiguousarray(img).data, digest_size=16)
+    h.update(str(img.shape).encode())
+    return h.hexdigest()
+
+
+class DetectionCache:
+    # ===== __init__ =====
+    # cache_dir: thư mục lưu trên đĩa (None = chỉ RAM)
+    # max_bytes: dung lượng tối đa trên đĩa; mem_items: số mục tối đa trong RAM
+    def __init__(self, cache_dir=None, max_bytes=256 * 1024 * 1024, mem_items=2048):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.mem_items = max(0, int(mem_items))
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()          # key -> (xyxy, conf, cls)
+        self.disk = OrderedDict()            # key -> kích thước file (thứ tự = ít dùng → mới dùng)
+        self.disk_bytes = 0
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._scan()
+
+    # ===== _scan =====
+    # Nạp danh sách file có sẵn, thứ tự LRU theo mtime (lần truy cập cuối)
+    def _scan(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*", "*.npz")):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, os.path.basename(path)[:-4], st.st_size))
+        for _, key, size in sorted(entries):
+            self.disk[key] = size
+            self.disk_bytes += size
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".npz")
+
+    # ===== make_key =====
+    def make_key(self, content_hash, model_hash, conf, iou, roi=None):
+        roi_text = ",".join(str(int(v)) for v in roi) if roi is not None else "-"
+        raw = f"{content_hash}|{model_hash}|{float(conf):.4f}|{float(iou):.4f}|{roi_text}"
+        return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+    # ===== get =====
+    # → (xyxy, conf, cls) hoặc None
+    def get(self, key):
+        with self.lock:
+            value = self.memory.get(key)
+            if value is not None:
+                self.memory.move_to_end(key)
+                self.hits_memory += 1
+                return value
+            on_disk = key in self.disk
+        if on_disk:
+            value = self._read(key)
+            if value is not None:
+                with self.lock:
+                    self.hits_disk += 1
+                    if key in self.disk:
+                        self.disk.move_to_end(key)
+                    self._remember(key, value)
+                return value
+        with self.lock:
+            self.misses += 1
+        return None
+
+    # ===== put =====
+    def put(self, key, xyxy, conf, cls):
+        value = (np.asarray(xyxy, np.float32).reshape(-1, 4),
+                 np.asarray(conf, np.float32).reshape(-1),
+                 np.asarray(cls, np.int64).reshape(-1))
+        with self.lock:
+            self._remember(key, value)
+            known = key in self.disk
+        if self.cache_dir and not known:
+            self._write(key, value)
+
+    # ===== _remember =====
+    # Thêm vào tầng RAM (gọi khi đang giữ lock)
+    def _remember(self, key, value):
+        if not self.mem_items:
+            return
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.mem_items:
+            self.memory.popitem(last=False)
+
+    # ===== _read =====
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                value = (data["xyxy"], data["conf"], data["cls"])
+            os.utime(path)                      # mtime = lần dùng cuối (thứ tự LRU khi khởi động lại)
+            return value
+        except Exception:
+            with self.lock:
+                self.disk_bytes -= self.disk.pop(key, 0)
+            return None
+
+    # ===== _write =====
+    # Ghi file tạm rồi os.replace; vượt dung lượng thì xoá mục ít dùng nhất
+    def _write(self, key, value):
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                np.savez(f, xyxy=value[0], conf=value[1], cls=value[2])
+            os.replace(tmp, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"Detection cache write error: {e}")
+            return
+        with self.lock:
+            self.disk_bytes += size - self.disk.pop(key, 0)
+            self.disk[key] = size
+            self._evict()
+
+    # ===== _evict =====
+    def _evict(self):
+        while self.disk_bytes > self.max_bytes and self.disk:
+            key, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    # ===== stats =====
+    def stats(self):
+        hits = self.hits_memory + self.hits_disk
+        total = hits + self.misses
+        return {
+            "hits": hits,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "memory_items": len(self.memory),
+            "disk_items": len(self.disk),
+            "disk_bytes": self.disk_bytes,
+        }
+
+
+class CachedModel:
+    """ Bọc model / scheduler: cùng giao diện model(frames, conf=, iou=), ảnh đã gặp không chạy lại
+
+    Key là hash chính xác của toàn bộ frame: chỉ trúng khi frame giống hệt từng byte
+    (ảnh upload lại, nguồn phát lại file, camera treo). Frame camera thật có nhiễu nên
+    hầu như luôn trượt - bỏ qua inference cho cảnh gần như không đổi là việc của SceneGate.
+    """
+
+    # ===== __init__ =====
+    # model_hash: weights_fingerprint(...) của model đang chạy
+    def __init__(self, model, cache, model_hash, names=None):
+        self.model = model
+        self.cache = cache
+        self.model_hash = model_hash
+        self.names = names or getattr(model, "names", None) or dict(enumerate(DEFAULT_NAMES))
+
+    # ===== __call__ =====
+    def __call__(self, frames, conf=0.25, iou=0.7, **kwargs):
+        single = isinstance(frames, np.ndarray)
+        if single:
+            frames = [frames]
+        results = [None] * len(frames)
+        keys, miss = [], []
+        for i, frame in enumerate(frames):
+            key = self.cache.make_key(image_hash(frame), self.model_hash, conf, iou)
+            keys.append(key)
+            value = self.cache.get(key)
+            if value is None:
+                miss.append(i)
+            else:
+                results[i] = Detections(frame, Boxes(*value), self.names)
+        if miss:
+            batch = [frames[i] for i in miss]
+            fresh = self.model(batch[0] if single else batch, conf=conf, iou=iou, **kwargs)
+            for i, result in zip(miss, fresh):
+                results[i] = result
+                self.cache.put(keys[i], *box_arrays(result))
+        return results
@@ -0,0 +1,170 @@
+import math
+import threading
+import time
+from collections import deque
+import numpy as np
+from postprocess import summarize, timing_for_total, YELLOW_SECONDS
+from roi import detect_in_roi
+
+#======================================
+# STREAMING DETECTOR - detect liên tục trên camera, giữ số xe theo cửa sổ thời gian
+#======================================
+# Mỗi nguồn camera một thread: chờ frame mới, cứ `stride` frame thì chạy model
+# một lần, lưu (thời điểm, counts) vào cửa sổ trượt. UART "yell" đọc ngay trạng
+# thái đã tính sẵn thay vì chụp + inference. Stride tự tăng/giảm theo thời gian
+# inference đo được để detector không bao giờ tụt lại sau camera.
+
+
+class StreamingDetector:
+    # ===== __init__ =====
+    # model: model hoặc InferenceScheduler (gọi model(frame, conf=, iou=))
+    # window: độ dài cửa sổ đếm (giây)
+    # min_stride / max_stride: giới hạn số frame bỏ qua giữa 2 lần inference
+    # utilization: tỉ lệ thời gian CPU tối đa dành cho inference của nguồn này
+    # class_conf: ngưỡng conf theo lớp (xem postprocess.keep_mask)
+    # roi_getter: hàm trả roi.Roi hiện tại của nguồn (None = cả frame), gọi mỗi lần detect
+    def __init__(self, source_id, camera, model, num_classes=6, conf=0.5, iou=0.5,
+                 window=10.0, min_stride=1, max_stride=30, utilization=0.8, class_conf=None,
+                 roi_getter=None):
+        self.source_id = source_id
+        self.roi_getter = roi_getter
+        self.class_conf = class_conf
+        self.camera = camera
+        self.model = model
+        self.num_classes = num_classes
+        self.conf = conf
+        self.iou = iou
+        self.window = float(window)
+        self.min_stride = max(1, int(min_stride))
+        self.max_stride = max(self.min_stride, int(max_stride))
+        self.utilization = utilization
+        self.stride = self.min_stride
+        self.lock = threading.Lock()
+        self.samples = deque()        # (t, counts) trong cửa sổ
+        self.thread = None
+        self.running = False
+        self._infer_time = None       # EMA thời gian inference (giây)
+        self._frame_interval = None   # EMA khoảng cách giữa 2 frame camera (giây)
+        self.processed = 0
+        self.skipped = 0
+        self.errors = 0
+
+    # ===== start =====
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    # ===== _ema =====
+    @staticmethod
+    def _ema(old, new, alpha=0.2):
+        return new if old is None else (1 - alpha) * old + alpha * new
+
+    # ===== _loop =====
+    # Thread nền: chờ frame mới → bỏ qua theo stride → inference → cập nhật cửa sổ
+    def _loop(self):
+        last_seq = 0
+        last_done_seq = 0
+        last_t = None
+        while self.running:
+            ok, seq, frame = self.camera.wait_for_frame(last_seq, timeout=1.0)
+            if not ok:
+                continue
+            now = time.monotonic()
+            if last_t is not None and seq > last_seq:
+                self._frame_interval = self._ema(self._frame_interval, (now - last_t) / (seq - last_seq))
+            last_t = now
+            last_seq = seq
+            if last_done_seq and seq - last_done_seq < self.stride:
+                self.skipped += 1
+                continue
+            try:
+                roi = self.roi_getter() if self.roi_getter is not None else None
+                t0 = time.monotonic()
+                # frame là view của ring buffer → copy vì inference có thể lâu hơn vòng ring
+                if roi is not None:
+                    result = detect_in_roi(self.model, frame, roi, self.conf, self.iou, copy=True)
+                else:
+                    result = self.model(frame.copy(), conf=self.conf, iou=self.iou)[0]
+                self._infer_time = self._ema(self._infer_time, time.monotonic() - t0)
+                counts = summarize(result, self.num_classes, class_conf=self.class_conf, roi=roi).counts.tolist()
+            except Exception as e:
+                self.errors += 1
+                print(f"Streaming detect error ({self.source_id}): {e}")
+                time.sleep(0.5)
+                continue
+            last_done_seq = seq
+            self.processed += 1
+            self._add_sample(counts)
+            self._adapt_stride()
+
+    # ===== _add_sample =====
+    # Thêm counts mới và bỏ các mẫu đã ra khỏi cửa sổ
+    def _add_sample(self, counts):
+        now = time.monotonic()
+        with self.lock:
+            self.samples.append((now, counts))
+            while self.samples and now - self.samples[0][0] > self.window:
+                self.samples.popleft()
+
+    # ===== _adapt_stride =====
+    # stride = số frame camera trôi qua trong một lần inference (chia cho utilization)
+    def _adapt_stride(self):
+        if not self._infer_time or not self._frame_interval:
+            return
+        needed = self._infer_time / (self._frame_interval * self.utilization)
+        self.stride = min(self.max_stride, max(self.min_stride, int(math.ceil(needed))))
+
+    # ===== snapshot =====
+    # Số xe trung bình theo lớp trong cửa sổ + lệnh m0..m4 (None nếu chưa có mẫu)
+    # max_age: nếu mẫu mới nhất cũ hơn số giây này thì coi như không có dữ liệu
+    def snapshot(self, max_age=None):
+        now = time.monotonic()
+        with self.lock:
+            samples = [s for s in self.samples if now - s[0] <= self.window]
+        if not samples:
+            return None
+        age = now - samples[-1][0]
+        if max_age is not None and age > max_age:
+            return None
+        n = len(samples)
+        arr = np.array([c for _, c in samples], dtype=np.float32)     # (n, num_classes)
+        counts = np.rint(arr.mean(axis=0)).astype(int).tolist()
+        peak = int(arr.sum(axis=1).max())
+        total_vehicles = sum(counts)
+        total_seconds, cmd = timing_for_total(total_vehicles)
+        result = {
+            "counts": counts,
+            "total_vehicles": total_vehicles,
+            "peak_vehicles": peak,
+            "total_seconds": total_seconds,
+            "green_seconds": max(0, int(total_seconds) - YELLOW_SECONDS),
+            "samples": n,
+            "window_seconds": self.window,
+            "age_seconds": round(age, 3),
+            "stride": self.stride,
+            "mode": "streaming",
+            "source": self.source_id,
+            "status": "ready",
+            "timestamp": int(time.time()),
+        }
+        return result, cmd
+
+    # ===== stats =====
+    def stats(self):
+        return {
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "stride": self.stride,
+            "infer_time": self._infer_time,
+            "frame_interval": self._frame_interval,
+        }
+
+    # ===== stop =====
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
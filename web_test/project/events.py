@@ -0,0 +1,132 @@
+import json
+import threading
+from collections import deque
+import metrics
+
+#======================================
+# RESULT BUS - đẩy kết quả detect tới dashboard qua Server-Sent Events
+#======================================
+# detect_frame publish mỗi kết quả vào bus (chỉ giữ trong RAM, không ghi đĩa).
+# Mỗi client /events là một generator chờ trên Condition: có kết quả mới →
+# gửi ngay "id: N / event: detection / data: {...}". Bus giữ history có giới
+# hạn để client mới vào (hoặc reconnect kèm Last-Event-ID) nhận lại các kết
+# quả đã lỡ. Client chậm không làm chậm publish: mỗi client tự đọc từ history,
+# tụt quá xa thì bỏ qua phần cũ (chỉ nhận history còn giữ).
+
+
+class ResultBus:
+    # ===== __init__ =====
+    # history: số kết quả gần nhất giữ lại cho client mới / reconnect
+    # keepalive: gửi comment ": ping" sau bấy nhiêu giây không có kết quả (giữ kết nối qua proxy)
+    # max_clients: số client /events đồng thời tối đa (mỗi client giữ một thread HTTP)
+    def __init__(self, history=20, keepalive=15.0, max_clients=8):
+        self.keepalive = keepalive
+        self.max_clients = max(1, int(max_clients))
+        self.cond = threading.Condition()
+        self._history = deque(maxlen=max(1, int(history)))   # (id, event, data)
+        self._next_id = 1
+        self._clients = 0
+        self.running = True
+        self.published = 0
+        self.skipped = 0          # tổng số sự kiện client bỏ lỡ vì đã rơi khỏi history
+
+    # ===== publish =====
+    # Thêm một sự kiện; data là dict (được serialize 1 lần tại đây, dùng chung mọi client)
+    def publish(self, data, event="detection"):
+        payload = json.dumps(data, ensure_ascii=False)
+        with self.cond:
+            event_id = self._next_id
+            self._next_id += 1
+            self._history.append((event_id, event, payload))
+            self.published += 1
+            self.cond.notify_all()
+        return event_id
+
+    # ===== last_id =====
+    def last_id(self):
+        with self.cond:
+            return self._next_id - 1
+
+    # ===== latest =====
+    # Dict của sự kiện mới nhất (None nếu chưa có)
+    def latest(self, event="detection"):
+        with self.cond:
+            for _, ev, payload in reversed(self._history):
+                if ev == event:
+                    return json.loads(payload)
+        return None
+
+    # ===== _since =====
+    # Các sự kiện có id > last_id còn trong history (gọi khi đang giữ cond)
+    def _since(self, last_id):
+        return [item for item in self._history if item[0] > last_id]
+
+    # ===== subscribe / unsubscribe =====
+    # Giữ một chỗ client; False nếu đã đủ max_clients (route trả 503).
+    # unsubscribe gắn vào response.call_on_close: chạy cả khi client ngắt trước khi generator bắt đầu
+    def subscribe(self):
+        with self.cond:
+            if self._clients >= self.max_clients:
+                return False
+            self._clients += 1
+            return True
+
+    def unsubscribe(self):
+        with self.cond:
+            self._clients = max(0, self._clients - 1)
+
+    # ===== stream =====
+    # Generator text/event-stream cho một client
+    # last_id: Last-Event-ID của client (None = client mới → gửi toàn bộ history)
+    def stream(self, last_id=None, retry_ms=2000):
+        yield f"retry: {int(retry_ms)}\n\n"
+        with self.cond:
+            # id lớn hơn id hiện tại = id của lần chạy server trước → coi như client mới
+            if last_id is None or last_id > self._next_id - 1:
+                last_id = self._history[0][0] - 1 if self._history else self._next_id - 1
+        while self.running:
+            with self.cond:
+                self.cond.wait_for(lambda: self._next_id - 1 > last_id or not self.running, self.keepalive)
+                items = self._since(last_id)
+                oldest = self._history[0][0] if self._history else self._next_id
+            if not self.running:
+                break
+            if not items:
+                yield ": ping\n\n"
+                continue
+            if oldest > last_id + 1:
+                missed = oldest - last_id - 1
+                self.skipped += missed
+                metrics.inc("events_skipped_total", missed)
+            for event_id, event, payload in items:
+                yield f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
+            last_id = items[-1][0]
+
+    # ===== stats =====
+    def stats(self):
+        with self.cond:
+            return {
+                "clients": self._clients,
+                "max_clients": self.max_clients,
+                "published": self.published,
+                "last_id": self._next_id - 1,
+                "history": len(self._history),
+                "skipped": self.skipped,
+            }
+
+    # ===== stop =====
+    # Đánh thức mọi client để generator kết thúc
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+
+# ===== parse_last_event_id =====
+# Header Last-Event-ID (hoặc ?last_id=) → int, None nếu không có / không hợp lệ
+def parse_last_event_id(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
@@ -0,0 +1,97 @@
+import os
+import pty
+import select
+import time
+import tty
+
+#======================================
+# FAKE SERIAL - cặp pty giả lập cổng UART /dev/ttyAMA0 của ESP32
+#======================================
+# UARTHandler mở `port` (đầu slave) bằng pyserial như cổng thật; phía "ESP32"
+# ghi / đọc qua đầu master. Chỉ chạy trên Linux / macOS.
+#
+# Thử nhanh:
+#   python fake_serial.py            # in ra đường dẫn port giả
+#   YOLO_UART_PORT=<port> python app.py
+#   rồi gõ 'yell' / 'yell all' trong terminal của fake_serial để gửi
+
+
+class FakeSerialPort:
+    # ===== __init__ =====
+    def __init__(self):
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.master_fd)
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        self._buf = b""
+
+    # ===== write_line =====
+    # Gửi một dòng như ESP32 gửi (vd. "yell")
+    def write_line(self, line):
+        os.write(self.master_fd, (line + "\n").encode())
+
+    # ===== read_line =====
+    # Đọc một dòng server gửi về (None nếu hết timeout)
+    def read_line(self, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while b"\n" not in self._buf:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            ready, _, _ = select.select([self.master_fd], [], [], remaining)
+            if ready:
+                self._buf += os.read(self.master_fd, 1024)
+        line, self._buf = self._buf.split(b"\n", 1)
+        return line.decode().strip()
+
+    # ===== read_lines =====
+    # Đọc tối đa n dòng trong khoảng timeout
+    def read_lines(self, n, timeout=1.0):
+        lines = []
+        deadline = time.monotonic() + timeout
+        while len(lines) < n:
+            line = self.read_line(max(0.0, deadline - time.monotonic()))
+            if line is None:
+                break
+            lines.append(line)
+        return lines
+
+    # ===== close =====
+    def close(self):
+        for fd in (self.master_fd, self.slave_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# -----------------------------
+# Giả lập ESP32 tương tác: gõ lệnh để gửi, in phản hồi + độ trễ
+# -----------------------------
+def main():
+    with FakeSerialPort() as fake:
+        print(f"Fake UART port: {fake.port}")
+        print("Type a line to send (e.g. 'yell', 'yell all'), Ctrl+C to quit")
+        try:
+            while True:
+                line = input("> ").strip()
+                if not line:
+                    continue
+                t0 = time.monotonic()
+                fake.write_line(line)
+                reply = fake.read_line(timeout=5.0)
+                while reply is not None:
+                    print(f"< {reply}  ({(time.monotonic() - t0) * 1000:.1f} ms)")
+                    reply = fake.read_line(timeout=0.2)
+        except (KeyboardInterrupt, EOFError):
+            pass
+
+
+if __name__ == "__main__":
+    main()
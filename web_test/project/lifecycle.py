@@ -0,0 +1,130 @@
+import threading
+import time
+import traceback
+
+#======================================
+# STARTUP - khởi tạo model / camera / UART ở thread nền, báo trạng thái cho /healthz, /readyz
+#======================================
+# Import app.py chỉ tạo đối tượng (không mở camera, không load model, không mở
+# cổng serial). create_app() đăng ký các bước khởi tạo theo thứ tự rồi chạy ở
+# thread nền: server nhận request ngay (giao diện, /healthz), request cần model
+# nhận 503 + Retry-After tới khi các bước bắt buộc (load model, warm-up) xong.
+# Bước bắt buộc lỗi → các bước bắt buộc sau bị bỏ qua, /healthz báo lỗi;
+# bước tuỳ chọn (UART) lỗi chỉ được ghi lại.
+
+PENDING, RUNNING, OK, FAILED, SKIPPED = "pending", "running", "ok", "failed", "skipped"
+
+
+class Startup:
+    # ===== __init__ =====
+    def __init__(self):
+        self.steps = []              # [(name, fn, required)] theo thứ tự chạy
+        self.state = {}              # name -> {"status", "seconds", "error", "required"}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.started_at = None       # time.monotonic() lúc bắt đầu khởi tạo
+        self.ready_at = None
+        self._done = threading.Event()
+        self._ready = threading.Event()
+
+    # ===== add =====
+    # Đăng ký một bước; required=False → lỗi không chặn readiness
+    def add(self, name, fn, required=True):
+        self.steps.append((name, fn, required))
+        self.state[name] = {"status": PENDING, "seconds": None, "error": None, "required": required}
+        return self
+
+    # ===== start =====
+    # Chạy các bước (một lần duy nhất); background=False → chạy ngay trong thread gọi
+    def start(self, background=True):
+        with self.lock:
+            if self.started_at is not None:
+                return False
+            self.started_at = time.monotonic()
+        if background:
+            self.thread = threading.Thread(target=self._run, name="startup", daemon=True)
+            self.thread.start()
+        else:
+            self._run()
+        return True
+
+    # ===== _run =====
+    def _run(self):
+        blocked = False              # có bước bắt buộc đã lỗi
+        for name, fn, required in self.steps:
+            if blocked and required:
+                self._set(name, status=SKIPPED)
+                continue
+            self._set(name, status=RUNNING)
+            t0 = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                traceback.print_exc()
+                self._set(name, status=FAILED, seconds=round(time.perf_counter() - t0, 3), error=str(e))
+                print(f"Startup step '{name}' failed: {e}")
+                blocked = blocked or required
+                continue
+            self._set(name, status=OK, seconds=round(time.perf_counter() - t0, 3))
+            print(f"Startup step '{name}' done in {time.perf_counter() - t0:.2f}s")
+            if not blocked and self._required_ok():
+                self._mark_ready()
+        self._done.set()
+
+    def _set(self, name, **fields):
+        with self.lock:
+            self.state[name].update(fields)
+
+    def _required_ok(self):
+        with self.lock:
+            return all(s["status"] == OK for s in self.state.values() if s["required"])
+
+    def _mark_ready(self):
+        if self._ready.is_set():
+            return
+        self.ready_at = time.monotonic()
+        self._ready.set()
+        print(f"Ready in {self.ready_at - self.started_at:.2f}s")
+
+    # ===== ready / failed / started =====
+    def ready(self):
+        return self._ready.is_set()
+
+    def failed(self):
+        with self.lock:
+            return any(s["status"] == FAILED and s["required"] for s in self.state.values())
+
+    def started(self):
+        return self.started_at is not None
+
+    # ===== wait =====
+    # Chờ tới khi sẵn sàng (True) hoặc khởi tạo kết thúc mà không sẵn sàng / hết timeout (False)
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._ready.is_set():
+            if self._done.is_set():
+                return False
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._ready.wait(0.1 if remaining is None else min(0.1, remaining))
+        return True
+
+    # ===== retry_after =====
+    # Gợi ý Retry-After (giây) cho request đến khi chưa sẵn sàng
+    def retry_after(self):
+        return 1.0 if self.started() else 5.0
+
+    # ===== status =====
+    def status(self):
+        now = time.monotonic()
+        with self.lock:
+            steps = {name: dict(s) for name, s in self.state.items()}
+        return {
+            "ready": self.ready(),
+            "failed": self.failed(),
+            "started": self.started(),
+            "uptime": round(now - self.started_at, 3) if self.started_at is not None else None,
+            "ready_after": round(self.ready_at - self.started_at, 3) if self.ready_at is not None else None,
+            "steps": steps,
+        }
@@ -0,0 +1,211 @@
+import bisect
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+#======================================
+# METRICS - histogram theo stage, counter, gauge; xuất dạng Prometheus text
+#======================================
+# Chi phí thấp: mỗi lần observe chỉ là perf_counter + bisect + cộng dưới lock.
+# Dùng:  with metrics.timer("inference"): ...
+#        metrics.inc("camera_reconnects_total", source="north")
+#        metrics.render()  → nội dung cho endpoint /metrics
+
+PREFIX = "yolo_"
+
+# bucket (giây) cho latency từng stage: 1 ms .. 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_HELP = "Latency of each pipeline stage in seconds"
+
+COUNTER_HELP = {
+    "camera_reconnects_total": "Camera (re)open attempts",
+    "camera_missed_frames_total": "Failed camera reads",
+    "uart_errors_total": "UART read/send errors",
+    "stream_dropped_frames_total": "MJPEG frames skipped by slow clients",
+    "admission_rejected_total": "Captures rejected because inference capacity was full",
+    "http_rejected_total": "HTTP connections rejected because all server threads were busy",
+    "http_stream_rejected_total": "Streaming connections (/camera_stream, /events) rejected at the stream cap",
+    "events_skipped_total": "Detection events an /events client missed because it fell out of the history",
+}
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # ô cuối = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    # ===== __init__ =====
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}     # stage -> Histogram
+        self.counters = {}       # (name, labels) -> value
+        self.gauges = {}         # name -> (help, fn trả về số hoặc {labels: số})
+
+    # ===== observe =====
+    def observe(self, stage, seconds):
+        with self.lock:
+            hist = self.histograms.get(stage)
+            if hist is None:
+                hist = self.histograms[stage] = Histogram()
+            hist.observe(seconds)
+
+    # ===== inc =====
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    # ===== gauge =====
+    # Đăng ký gauge đọc giá trị lúc render (vd. độ sâu hàng đợi)
+    def gauge(self, name, fn, help_text=""):
+        self.gauges[name] = (help_text, fn)
+
+    # ===== render =====
+    # Xuất toàn bộ metric theo định dạng Prometheus text 0.0.4
+    def render(self):
+        lines = []
+        with self.lock:
+            hists = {k: (list(h.counts), h.sum, h.count, h.buckets) for k, h in self.histograms.items()}
+            counters = dict(self.counters)
+        if hists:
+            name = PREFIX + "stage_seconds"
+            lines.append(f"# HELP {name} {STAGE_HELP}")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, (counts, total, count, buckets) in sorted(hists.items()):
+                cumulative = 0
+                for le, c in zip(buckets, counts):
+                    cumulative += c
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {total:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        seen = set()
+        for (cname, labels), value in sorted(counters.items()):
+            full = PREFIX + cname
+            if cname not in seen:
+                seen.add(cname)
+                lines.append(f"# HELP {full} {COUNTER_HELP.get(cname, cname)}")
+                lines.append(f"# TYPE {full} counter")
+            lines.append(f"{full}{_labels(labels)} {value}")
+        for gname, (help_text, fn) in sorted(self.gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            full = PREFIX + gname
+            lines.append(f"# HELP {full} {help_text or gname}")
+            lines.append(f"# TYPE {full} gauge")
+            if isinstance(value, dict):
+                for labels, v in value.items():
+                    lines.append(f"{full}{_labels(labels)} {v}")
+            else:
+                lines.append(f"{full} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# ===== _labels =====
+# (("source", "north"),) → {source="north"}
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+REGISTRY = Registry()
+
+
+def observe(stage, seconds):
+    REGISTRY.observe(stage, seconds)
+
+
+def inc(name, value=1, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+
+def gauge(name, fn, help_text=""):
+    REGISTRY.gauge(name, fn, help_text)
+
+
+def render():
+    return REGISTRY.render()
+
+
+# ===== timer =====
+# Đo thời gian một đoạn code và ghi vào histogram của stage
+@contextmanager
+def timer(stage):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(stage, time.perf_counter() - t0)
+
+
+#======================================
+# SAMPLING PROFILER - lấy mẫu stack của mọi thread theo chu kỳ
+#======================================
+# Bật tạm thời khi cần tìm điểm nóng trên máy thật; kết quả dạng "collapsed
+# stacks" (mỗi dòng: frame;frame;frame số_mẫu) dùng được với flamegraph.pl / speedscope.
+
+class SamplingProfiler:
+    # ===== __init__ =====
+    # interval: khoảng lấy mẫu (giây)
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.samples = Counter()
+        self.thread = None
+        self.running = False
+        self.started_at = None
+
+    # ===== start =====
+    def start(self):
+        with self.lock:
+            if self.running:
+                return False
+            self.samples = Counter()
+            self.running = True
+            self.started_at = time.time()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return True
+
+    # ===== _sample =====
+    def _sample(self):
+        own = threading.get_ident()
+        while self.running:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = ";".join(f"{f.name} ({f.filename.rsplit('/', 1)[-1]}:{f.lineno})"
+                                 for f in traceback.extract_stack(frame))
+                self.samples[stack] += 1
+            time.sleep(self.interval)
+
+    # ===== stop =====
+    # Dừng lấy mẫu, trả về collapsed stacks
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        return self.collapsed()
+
+    # ===== collapsed =====
+    def collapsed(self, top=None):
+        items = self.samples.most_common(top)
+        return "\n".join(f"{stack} {count}" for stack, count in items) + "\n"
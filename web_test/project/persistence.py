@@ -0,0 +1,149 @@
+import os
+import json
+import queue
+import threading
+import time
+import cv2
+import metrics
+
+#======================================
+# PERSISTENCE - vẽ annotation, encode JPEG, ghi file ở thread nền
+#======================================
+# detect_frame chỉ cần số lượng xe + lệnh m0..m4 để trả về ngay; phần vẽ box,
+# imwrite và ghi last_detection.json được đẩy sang ResultWriter.
+
+
+class PersistJob:
+    """ Một lần lưu kết quả detect: ảnh gốc (tuỳ chọn), ảnh đã vẽ box, JSON """
+    __slots__ = ("frame", "result", "raw_path", "output_path", "json_path", "payload")
+
+    def __init__(self, frame, result, raw_path, output_path, json_path, payload):
+        self.frame = frame            # frame BGR gốc
+        self.result = result          # ultralytics Results (dùng để plot), có thể None
+        self.raw_path = raw_path      # None nếu tắt lưu ảnh upload gốc
+        self.output_path = output_path
+        self.json_path = json_path    # None nếu không ghi last_detection.json
+        self.payload = payload        # dict kết quả trả về cho frontend
+
+
+# ===== write_json_atomic =====
+# Ghi JSON ra file tạm rồi os.replace để frontend không đọc phải file ghi dở
+def write_json_atomic(path, data):
+    t0 = time.perf_counter()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as jf:
+        json.dump(data, jf, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    metrics.observe("json_write", time.perf_counter() - t0)
+
+
+# ===== save_images =====
+# Vẽ box + ghi ảnh gốc / ảnh output của một job
+def save_images(job):
+    if job.raw_path:
+        os.makedirs(os.path.dirname(job.raw_path), exist_ok=True)
+        with metrics.timer("imwrite"):
+            cv2.imwrite(job.raw_path, job.frame)
+    try:
+        with metrics.timer("plot"):
+            img_out = job.result.plot()
+    except Exception:
+        img_out = job.frame
+    os.makedirs(os.path.dirname(job.output_path), exist_ok=True)
+    with metrics.timer("imwrite"):
+        cv2.imwrite(job.output_path, img_out)
+
+
+# ===== persist_detection =====
+# Lưu đồng bộ (dùng khi không có ResultWriter)
+def persist_detection(job):
+    save_images(job)
+    if job.json_path:
+        try:
+            write_json_atomic(job.json_path, job.payload)
+        except Exception:
+            pass
+
+
+class ResultWriter:
+    # ===== __init__ =====
+    # workers: số thread ghi file; max_pending: số job tối đa đang chờ (backpressure)
+    # put_timeout: thời gian chờ tối đa khi hàng đợi đầy trước khi bỏ job (giây)
+    def __init__(self, workers=2, max_pending=8, put_timeout=0.05):
+        self.workers = max(1, int(workers))
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=max(1, int(max_pending)))
+        self.threads = []
+        self.running = False
+        self._json_lock = threading.Lock()
+        self._json_seq = -1           # seq của job đã ghi JSON gần nhất
+        self._seq = 0
+        self._seq_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+    # ===== start =====
+    # Bắt đầu các thread ghi nền
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        for _ in range(self.workers):
+            t = threading.Thread(target=self._worker, daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    # ===== submit =====
+    # Đưa job vào hàng đợi; nếu đầy quá put_timeout thì bỏ job (không chặn request)
+    def submit(self, job):
+        with self._seq_lock:
+            seq = self._seq
+            self._seq += 1
+        try:
+            self.queue.put((seq, job), timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print(f"ResultWriter queue full, dropped {os.path.basename(job.output_path)}")
+            return False
+
+    # ===== _worker =====
+    # Thread nền: lấy job, ghi ảnh, rồi ghi JSON nếu job mới hơn lần ghi trước
+    def _worker(self):
+        while self.running or not self.queue.empty():
+            try:
+                seq, job = self.queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            try:
+                save_images(job)
+                if job.json_path:
+                    with self._json_lock:
+                        # nhiều worker có thể xong không theo thứ tự → chỉ giữ kết quả mới nhất
+                        if seq > self._json_seq:
+                            write_json_atomic(job.json_path, job.payload)
+                            self._json_seq = seq
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"ResultWriter error: {e}")
+            finally:
+                self.queue.task_done()
+
+    # ===== stats =====
+    def stats(self):
+        return {
+            "pending": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+    # ===== stop =====
+    # Dừng writer: các job còn trong hàng đợi được ghi nốt trước khi thoát
+    def stop(self, timeout=5.0):
+        self.running = False
+        for t in self.threads:
+            t.join(timeout=timeout)
+        self.threads = []
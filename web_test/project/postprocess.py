@@ -0,0 +1,128 @@
+import numpy as np
+
+#======================================
+# POSTPROCESS - xử lý kết quả detect bằng NumPy (vector hoá, không lặp từng box)
+#======================================
+# Dùng chung cho detect_frame (HTTP, UART), StreamingDetector và các đường batch.
+# Một lần duyệt: lấy mảng cls/conf/xyxy → lọc conf (chung hoặc theo lớp) →
+# lọc ROI mask → bincount theo lớp → tra bảng thời gian đèn / lệnh UART.
+
+# mapping total vehicles -> seconds and cmd
+# total == 0 → m0, 1..4 → m1, 5..10 → m2, 11..20 → m3, > 20 → m4
+TIMING_EDGES = np.array([0, 4, 10, 20])
+TIMING_SECONDS = np.array([30, 20, 45, 60, 90])
+TIMING_CMDS = np.array(["m0", "m1", "m2", "m3", "m4"])
+YELLOW_SECONDS = 3
+
+
+# ===== to_numpy =====
+# torch.Tensor / list / ndarray → ndarray (không copy nếu đã là ndarray)
+def to_numpy(x, dtype=None):
+    if x is None:
+        return np.zeros((0,), dtype=dtype or np.float32)
+    if hasattr(x, "cpu"):
+        x = x.cpu().numpy()
+    return np.asarray(x, dtype=dtype)
+
+
+# ===== box_arrays =====
+# Lấy (xyxy, conf, cls) dạng NumPy từ ultralytics Results hoặc backends.Detections
+def box_arrays(result):
+    boxes = getattr(result, "boxes", None)
+    if boxes is None:
+        return np.zeros((0, 4), np.float32), np.zeros((0,), np.float32), np.zeros((0,), np.int64)
+    cls = to_numpy(getattr(boxes, "cls", None), np.float32).reshape(-1).astype(np.int64)
+    conf = to_numpy(getattr(boxes, "conf", None), np.float32).reshape(-1)
+    xyxy = to_numpy(getattr(boxes, "xyxy", None), np.float32).reshape(-1, 4)
+    if len(conf) != len(cls):
+        conf = np.ones(len(cls), np.float32)
+    if len(xyxy) != len(cls):
+        xyxy = np.zeros((len(cls), 4), np.float32)
+    return xyxy, conf, cls
+
+
+# ===== timing_for_totals =====
+# Tra bảng thời gian + lệnh cho một hoặc nhiều tổng số xe
+def timing_for_totals(totals):
+    idx = np.searchsorted(TIMING_EDGES, np.asarray(totals), side="left")
+    return TIMING_SECONDS[idx], TIMING_CMDS[idx]
+
+
+# ===== timing_for_total =====
+def timing_for_total(total_vehicles):
+    seconds, cmd = timing_for_totals(total_vehicles)
+    return int(seconds), str(cmd)
+
+
+class DetectionSummary:
+    """ Kết quả gọn của một ảnh: số xe theo lớp, thời gian đèn, lệnh, box đã lọc """
+    __slots__ = ("counts", "total_vehicles", "total_seconds", "green_seconds", "cmd",
+                 "xyxy", "conf", "cls")
+
+    def __init__(self, counts, xyxy, conf, cls):
+        self.counts = counts
+        self.total_vehicles = int(counts.sum())
+        self.total_seconds, self.cmd = timing_for_total(self.total_vehicles)
+        self.green_seconds = max(0, self.total_seconds - YELLOW_SECONDS)
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+    # ===== to_dict =====
+    # Các trường JSON chung cho HTTP / UART / batch
+    def to_dict(self):
+        return {
+            "counts": self.counts.tolist(),
+            "total_vehicles": self.total_vehicles,
+            "total_seconds": self.total_seconds,
+            "green_seconds": self.green_seconds,
+        }
+
+
+# ===== keep_mask =====
+# Mask các box được giữ: class hợp lệ, conf >= ngưỡng (chung / theo lớp), tâm box nằm trong ROI
+# class_conf: mảng ngưỡng theo class id (chỉ nâng ngưỡng, model đã lọc theo conf chung)
+# roi_mask: ảnh nhị phân (H, W) cùng kích thước frame, khác 0 = trong ROI
+# roi: roi.Roi (rect / đa giác), kiểm tra tâm box vector hoá
+def keep_mask(xyxy, conf, cls, num_classes, conf_thres=None, class_conf=None, roi_mask=None, roi=None):
+    keep = (cls >= 0) & (cls < num_classes)
+    if conf_thres is not None:
+        keep &= conf >= conf_thres
+    if class_conf is not None and len(cls):
+        class_conf = np.asarray(class_conf, np.float32)
+        thr = class_conf[np.clip(cls, 0, len(class_conf) - 1)]
+        keep &= conf >= thr
+    if roi_mask is not None and len(cls):
+        h, w = roi_mask.shape[:2]
+        cx = np.clip(((xyxy[:, 0] + xyxy[:, 2]) / 2).astype(np.int64), 0, w - 1)
+        cy = np.clip(((xyxy[:, 1] + xyxy[:, 3]) / 2).astype(np.int64), 0, h - 1)
+        keep &= roi_mask[cy, cx] > 0
+    if roi is not None and len(cls):
+        # roi.Roi: tâm box phải nằm trong rect / đa giác
+        keep &= roi.contains((xyxy[:, 0] + xyxy[:, 2]) / 2, (xyxy[:, 1] + xyxy[:, 3]) / 2)
+    return keep
+
+
+# ===== summarize =====
+# Một lần duyệt từ Results → DetectionSummary
+def summarize(result, num_classes=6, conf_thres=None, class_conf=None, roi_mask=None, roi=None):
+    xyxy, conf, cls = box_arrays(result)
+    keep = keep_mask(xyxy, conf, cls, num_classes, conf_thres, class_conf, roi_mask, roi)
+    xyxy, conf, cls = xyxy[keep], conf[keep], cls[keep]
+    counts = np.bincount(cls, minlength=num_classes)[:num_classes]
+    return DetectionSummary(counts, xyxy, conf, cls)
+
+
+# ===== parse_class_conf =====
+# "0.5,0.4,0.5" → mảng ngưỡng theo lớp (None nếu rỗng / sai định dạng)
+def parse_class_conf(text, num_classes=6):
+    if not text:
+        return None
+    try:
+        values = [float(v) for v in text.split(",") if v.strip()]
+    except ValueError:
+        return None
+    if not values:
+        return None
+    values += [0.0] * (num_classes - len(values))   # lớp không khai báo → không lọc thêm
+    return np.array(values[:num_classes], np.float32)
@@ -0,0 +1,190 @@
+import os
+import json
+import threading
+import time
+import numpy as np
+from backends import Boxes, Detections, DEFAULT_NAMES
+from postprocess import box_arrays
+
+#======================================
+# ROI - vùng đếm xe của từng nguồn camera (hình chữ nhật / đa giác)
+#======================================
+# File cấu hình JSON (mặc định rois.json cạnh app.py), toạ độ pixel của frame camera:
+#   {"north": {"rect": [100, 200, 1180, 720]},
+#    "south": {"polygon": [[0, 720], [420, 300], [760, 300], [1280, 720]]},
+#    "east":  {"polygons": [[[...], ...], [[...], ...]]}}
+# Frame được crop theo bbox của ROI trước khi đưa vào model (ít pixel hơn), rồi box
+# có tâm nằm ngoài đa giác (vd. làn ngược chiều) bị loại bằng phép thử điểm-trong-
+# đa-giác vector hoá. Sửa file là có hiệu lực, không cần khởi động lại server.
+
+
+# ===== points_in_polygon =====
+# Ray casting vector hoá: x, y (N,) → mask (N,) điểm nằm trong đa giác poly (M, 2)
+def points_in_polygon(x, y, poly):
+    x = np.asarray(x, np.float32)[:, None]
+    y = np.asarray(y, np.float32)[:, None]
+    x1, y1 = poly[:, 0][None, :], poly[:, 1][None, :]
+    x2, y2 = np.roll(poly[:, 0], -1)[None, :], np.roll(poly[:, 1], -1)[None, :]
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return ((crosses & (x < x_cross)).sum(axis=1) % 2) == 1
+
+
+class Roi:
+    """ Vùng đếm xe: một hình chữ nhật hoặc một / nhiều đa giác (pixel frame) """
+
+    # ===== __init__ =====
+    def __init__(self, rect=None, polygons=None):
+        self.polygons = [np.asarray(p, np.float32).reshape(-1, 2) for p in (polygons or [])]
+        self.polygons = [p for p in self.polygons if len(p) >= 3]
+        if rect is not None:
+            x1, y1, x2, y2 = (float(v) for v in rect)
+            self.rect = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        elif self.polygons:
+            pts = np.concatenate(self.polygons)
+            self.rect = (*pts.min(axis=0).tolist(), *pts.max(axis=0).tolist())
+        else:
+            raise ValueError("ROI needs 'rect', 'polygon' or 'polygons'")
+
+    # ===== from_config =====
+    @classmethod
+    def from_config(cls, entry):
+        polygons = entry.get("polygons") or ([entry["polygon"]] if entry.get("polygon") else None)
+        return cls(rect=entry.get("rect"), polygons=polygons)
+
+    # ===== to_dict =====
+    def to_dict(self):
+        data = {"rect": [round(v, 1) for v in self.rect]}
+        if self.polygons:
+            data["polygons"] = [p.round(1).tolist() for p in self.polygons]
+        return data
+
+    # ===== bbox =====
+    # Bbox của ROI kẹp vào frame w x h (số nguyên); None nếu ROI nằm ngoài frame
+    def bbox(self, w, h):
+        x1, y1, x2, y2 = self.rect
+        x1, y1 = max(0, int(x1)), max(0, int(y1))
+        x2, y2 = min(w, int(np.ceil(x2))), min(h, int(np.ceil(y2)))
+        if x2 <= x1 or y2 <= y1:
+            return None
+        return x1, y1, x2, y2
+
+    # ===== crop =====
+    # → (view của frame trong bbox ROI, (x1, y1)); ROI ngoài frame → cả frame
+    def crop(self, frame):
+        h, w = frame.shape[:2]
+        box = self.bbox(w, h)
+        if box is None:
+            return frame, (0, 0)
+        x1, y1, x2, y2 = box
+        return frame[y1:y2, x1:x2], (x1, y1)
+
+    # ===== contains =====
+    # Mask điểm (x, y) nằm trong ROI (trong một đa giác bất kỳ, hoặc trong rect)
+    def contains(self, x, y):
+        x = np.asarray(x, np.float32)
+        y = np.asarray(y, np.float32)
+        if not self.polygons:
+            x1, y1, x2, y2 = self.rect
+            return (x >= x1) & (x <= x2) & (y >= y1) & (y <= y2)
+        inside = np.zeros(len(x), dtype=bool)
+        for poly in self.polygons:
+            inside |= points_in_polygon(x, y, poly)
+        return inside
+
+
+# ===== detect_in_roi =====
+# Chạy model trên crop theo bbox ROI, trả kết quả với box theo toạ độ frame gốc
+# (để vẽ / lọc đa giác / ghi ảnh như khi chạy cả frame)
+# copy=True: frame là view của ring buffer → chỉ copy phần crop trước khi inference
+def detect_in_roi(model, frame, roi, conf=0.5, iou=0.5, copy=False):
+    crop, (ox, oy) = roi.crop(frame)
+    if copy:
+        crop = crop.copy()
+    results = model(crop, conf=conf, iou=iou)
+    xyxy, scores, cls = box_arrays(results[0])
+    xyxy = xyxy + np.array([ox, oy, ox, oy], np.float32)
+    names = getattr(results[0], "names", None) or dict(enumerate(DEFAULT_NAMES))
+    det = Detections(frame, Boxes(xyxy, scores, cls), names, polygons=roi_outline(roi))
+    det.tiling = getattr(results[0], "tiling", None)
+    return det
+
+
+# ===== roi_outline =====
+# Đường viền để vẽ lên ảnh kết quả
+def roi_outline(roi):
+    if roi is None:
+        return None
+    if roi.polygons:
+        return roi.polygons
+    x1, y1, x2, y2 = roi.rect
+    return [np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], np.float32)]
+
+
+class RoiStore:
+    # ===== __init__ =====
+    # path: file rois.json; check_interval: tối đa bao lâu (giây) thì kiểm tra file đã sửa chưa
+    def __init__(self, path=None, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.rois = {}               # source_id -> Roi
+        self.version = 0             # tăng mỗi lần nạp lại (scene gate / cache dựa vào đây)
+        self.error = None
+        self._mtime = None
+        self._checked = 0.0
+        self.reload()
+
+    # ===== reload =====
+    # Đọc lại file; file lỗi → giữ ROI cũ, ghi lại lỗi để /rois báo
+    def reload(self):
+        with self.lock:
+            self._checked = time.monotonic()
+            if not self.path or not os.path.exists(self.path):
+                if self.rois or self._mtime is not None:
+                    self.rois, self._mtime = {}, None
+                    self.version += 1
+                return True
+            mtime = os.path.getmtime(self.path)
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                rois = {str(k): Roi.from_config(v) for k, v in data.items() if v}
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                self._mtime = mtime          # chỉ đọc lại khi file được sửa tiếp
+                print(f"ROI config error ({self.path}): {self.error}")
+                return False
+            self.rois, self._mtime, self.error = rois, mtime, None
+            self.version += 1
+            print(f"Loaded ROIs for {sorted(rois)} from {self.path}")
+            return True
+
+    # ===== maybe_reload =====
+    # Gọi thường xuyên (mỗi lần chụp); chỉ stat file mỗi check_interval giây
+    def maybe_reload(self):
+        if time.monotonic() - self._checked < self.check_interval:
+            return
+        try:
+            mtime = os.path.getmtime(self.path) if self.path and os.path.exists(self.path) else None
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+        else:
+            self._checked = time.monotonic()
+
+    # ===== get =====
+    def get(self, source_id):
+        self.maybe_reload()
+        return self.rois.get(str(source_id))
+
+    # ===== to_dict =====
+    def to_dict(self):
+        return {
+            "path": self.path,
+            "version": self.version,
+            "error": self.error,
+            "rois": {sid: roi.to_dict() for sid, roi in self.rois.items()},
+        }
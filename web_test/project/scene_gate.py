@@ -0,0 +1,87 @@
+import threading
+import time
+import numpy as np
+import cv2
+
+#======================================
+# SCENE GATE - bỏ qua inference khi cảnh gần như không đổi
+#======================================
+# Ban đêm / lúc đèn đỏ camera thấy gần như cùng một cảnh. Mỗi lần chụp, frame
+# được thu nhỏ thành ảnh xám (mặc định 96x54, vài chục µs) và so với ảnh thu nhỏ
+# của lần inference gần nhất. Đo tỉ lệ pixel đổi hơn pixel_delta mức xám (không
+# dùng chênh lệch trung bình: một xe mới vào chỉ chiếm một góc nhỏ của khung);
+# tỉ lệ dưới ngưỡng → dùng lại kết quả + lệnh trước đó. Kết quả cũ hơn max_age
+# vẫn detect lại.
+
+
+# ===== thumbnail =====
+# Frame BGR → ảnh xám thu nhỏ (float32) để so sánh, làm mờ nhẹ để bớt nhiễu sensor
+def thumbnail(frame, size=(96, 54)):
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return cv2.GaussianBlur(small, (3, 3), 0).astype(np.float32)
+
+
+class SceneGate:
+    # ===== __init__ =====
+    # threshold: tỉ lệ pixel thay đổi (0..1) dưới ngưỡng này coi như cảnh không đổi (0 = tắt)
+    # pixel_delta: pixel lệch hơn bấy nhiêu mức xám mới tính là thay đổi (lọc nhiễu sensor)
+    # max_age: dùng lại kết quả tối đa bấy nhiêu giây rồi bắt buộc detect lại
+    def __init__(self, threshold=0.01, pixel_delta=12, max_age=30.0, size=(96, 54)):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.max_age = max_age
+        self.size = size
+        self.lock = threading.Lock()
+        self._thumb = None
+        self._result = None
+        self._time = 0.0
+        self._tag = None
+        self.last_diff = None
+        self.skipped = 0
+        self.inferred = 0
+
+    # ===== check =====
+    # → (thumb, (result, cmd) của lần trước) nếu bỏ qua được, (thumb, None) nếu phải detect
+    # tag: cấu hình đi kèm kết quả (vd. (phiên bản ROI, conf, iou)); khác tag của lần trước → detect lại
+    def check(self, frame, tag=None):
+        if not self.threshold:
+            # gate tắt: không tốn công thu nhỏ ảnh
+            return None, None
+        thumb = thumbnail(frame, self.size)
+        with self.lock:
+            if self._thumb is None or self._result is None or tag != self._tag:
+                return thumb, None
+            if self.max_age and time.monotonic() - self._time > self.max_age:
+                return thumb, None
+            diff = float((np.abs(thumb - self._thumb) > self.pixel_delta).mean())
+            self.last_diff = diff
+            if diff >= self.threshold:
+                return thumb, None
+            self.skipped += 1
+            return thumb, self._result
+
+    # ===== update =====
+    # Ghi lại ảnh thu nhỏ + kết quả của lần inference vừa xong (bỏ qua kết quả lỗi)
+    def update(self, thumb, result, cmd, tag=None):
+        with self.lock:
+            self.inferred += 1
+            if isinstance(result, dict) and result.get("error"):
+                self._thumb = self._result = None
+                return
+            self._thumb = thumb
+            self._result = (result, cmd)
+            self._tag = tag
+            self._time = time.monotonic()
+
+    # ===== stats =====
+    def stats(self):
+        total = self.skipped + self.inferred
+        return {
+            "threshold": self.threshold,
+            "skipped": self.skipped,
+            "inferred": self.inferred,
+            "skip_rate": round(self.skipped / total, 4) if total else 0.0,
+            "last_diff": None if self.last_diff is None else round(self.last_diff, 4),
+        }
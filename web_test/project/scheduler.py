@@ -0,0 +1,196 @@
+import threading
+import time
+import queue
+from collections import deque
+from concurrent.futures import Future
+import metrics
+
+#======================================
+# INFERENCE SCHEDULER - gom frame thành micro-batch
+#======================================
+# Mọi request (/camera_capture, UART yell) đẩy frame vào hàng đợi, một thread
+# worker duy nhất sở hữu model và chạy các frame theo batch động.
+# Mỗi caller nhận về một Future riêng chứa kết quả của frame mình.
+
+
+class SchedulerFull(Exception):
+    """ Hàng đợi inference đã đầy """
+
+
+class _Job:
+    __slots__ = ("frames", "batch", "conf", "iou", "future", "t_submit")
+
+    # frames: list ảnh; batch=False → Future trả kết quả của ảnh duy nhất, True → list kết quả
+    def __init__(self, frames, conf, iou, batch=False):
+        self.frames = frames
+        self.batch = batch
+        self.conf = conf
+        self.iou = iou
+        self.future = Future()
+        self.t_submit = time.monotonic()
+
+
+class InferenceScheduler:
+    # ===== __init__ =====
+    # max_batch_size: số frame tối đa mỗi lần gọi model
+    # max_wait: thời gian tối đa (giây) chờ gom thêm frame sau frame đầu tiên
+    # latency_budget: giới hạn p99 (giây); vượt quá thì tự giảm kích thước batch
+    # timeout: thời gian tối đa caller chờ kết quả khi gọi scheduler(frame, ...)
+    def __init__(self, model, max_batch_size=4, max_wait=0.015, max_queue=32,
+                 latency_budget=1.5, timeout=30.0, window=200):
+        self.model = model
+        self.timeout = timeout
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait))
+        self.latency_budget = latency_budget
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = None
+        self.running = False
+        self._batch_limit = self.max_batch_size   # kích thước batch hiện hành (tự điều chỉnh)
+        self._latencies = deque(maxlen=window)     # latency gần nhất của từng frame
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.frames = 0
+
+    # ===== start =====
+    # Bắt đầu thread worker chạy model
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    # ===== submit =====
+    # Đưa một frame vào hàng đợi, trả về Future (kết quả là Results của ultralytics)
+    def submit(self, frame, conf=0.5, iou=0.5):
+        return self._enqueue(_Job([frame], conf, iou))
+
+    # ===== submit_batch =====
+    # Nhiều ảnh của cùng một request (vd. các tile của một frame) đi chung một lần gọi model;
+    # Future trả về list kết quả theo thứ tự frames
+    def submit_batch(self, frames, conf=0.5, iou=0.5):
+        return self._enqueue(_Job(list(frames), conf, iou, batch=True))
+
+    def _enqueue(self, job):
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            job.future.set_exception(SchedulerFull("Inference queue full"))
+        return job.future
+
+    # ===== __call__ =====
+    # Giao diện giống model(frame hoặc list frame, conf=, iou=) để detect_frame dùng trực tiếp
+    def __call__(self, frame, conf=0.5, iou=0.5, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        if isinstance(frame, (list, tuple)):
+            return self.submit_batch(frame, conf, iou).result(timeout=timeout)
+        return [self.submit(frame, conf, iou).result(timeout=timeout)]
+
+    # ===== _collect =====
+    # Lấy frame đầu tiên (chờ), sau đó gom thêm tới khi đủ batch hoặc hết max_wait
+    def _collect(self):
+        try:
+            first = self.queue.get(timeout=0.2)
+        except queue.Empty:
+            return []
+        jobs = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(jobs) < self._batch_limit:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                jobs.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return jobs
+
+    # ===== _worker =====
+    # Thread nền: gom batch, nhóm theo (conf, iou) rồi gọi model một lần cho mỗi nhóm
+    def _worker(self):
+        while self.running:
+            jobs = self._collect()
+            if not jobs:
+                continue
+            groups = {}
+            for job in jobs:
+                if job.future.set_running_or_notify_cancel():
+                    groups.setdefault((job.conf, job.iou), []).append(job)
+            for (conf, iou), group in groups.items():
+                self._run_group(group, conf, iou)
+
+    # ===== _run_group =====
+    # Chạy model trên một nhóm frame cùng tham số và trả kết quả cho từng Future
+    def _run_group(self, group, conf, iou):
+        start = time.monotonic()
+        for job in group:
+            metrics.observe("queue_wait", start - job.t_submit)
+        try:
+            with metrics.timer("inference"):
+                results = self.model([f for job in group for f in job.frames], conf=conf, iou=iou)
+        except Exception as e:
+            for job in group:
+                job.future.set_exception(e)
+            return
+        done = time.monotonic()
+        i = 0
+        for job in group:
+            n = len(job.frames)
+            job.future.set_result(list(results[i:i + n]) if job.batch else results[i])
+            i += n
+        with self._stats_lock:
+            self.batches += 1
+            self.frames += i
+            for job in group:
+                self._latencies.append(done - job.t_submit)
+        self._adapt()
+
+    # ===== _adapt =====
+    # Điều chỉnh kích thước batch để p99 latency nằm trong latency_budget
+    def _adapt(self):
+        if not self.latency_budget:
+            return
+        p99 = self.percentile(99)
+        if p99 is None:
+            return
+        if p99 > self.latency_budget and self._batch_limit > 1:
+            self._batch_limit -= 1
+        elif p99 < 0.7 * self.latency_budget and self._batch_limit < self.max_batch_size:
+            self._batch_limit += 1
+
+    # ===== percentile =====
+    # Tính percentile latency (giây) trên cửa sổ gần nhất
+    def percentile(self, p):
+        with self._stats_lock:
+            data = sorted(self._latencies)
+        if not data:
+            return None
+        idx = min(len(data) - 1, int(round(p / 100.0 * (len(data) - 1))))
+        return data[idx]
+
+    # ===== stats =====
+    # Thống kê nhanh cho debug / log
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "queue_depth": self.queue.qsize(),
+            "batch_limit": self._batch_limit,
+            "p50_latency": self.percentile(50),
+            "p99_latency": self.percentile(99),
+        }
+
+    # ===== stop =====
+    # Dừng worker, huỷ các frame còn trong hàng đợi
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            job.future.cancel()
@@ -0,0 +1,127 @@
+import os
+import json
+import threading
+from camera import CameraHandler, SyntheticCapture
+
+#======================================
+# SOURCE REGISTRY - mỗi hướng (approach) của giao lộ là một nguồn camera
+#======================================
+# File cấu hình JSON (mặc định sources.json cạnh app.py), ví dụ:
+#   {"sources": [
+#       {"id": "north", "src": 0},
+#       {"id": "south", "src": "videos/south.mp4", "loop": true, "fps": 15},
+#       {"id": "east",  "src": "synthetic", "width": 1280, "height": 720, "fps": 10},
+#       {"id": "west",  "src": "rtsp://...", "tiling": {"tile_size": 640, "overlap": 0.2}}
+#   ]}
+# src: số (index webcam), đường dẫn file video / URL RTSP, hoặc "synthetic".
+# Đường dẫn tương đối được tính theo thư mục chứa file cấu hình.
+# tiling: cấu hình detect theo tile của nguồn (xem tiling.py), false = tắt kể cả khi bật mặc định.
+
+DEFAULT_SOURCES = [{"id": "main", "src": 0}]
+
+
+class Source:
+    """ Một nguồn camera + tài nguyên riêng (giới hạn số lần detect đồng thời) """
+
+    # ===== __init__ =====
+    # max_inflight: số lần chụp + detect đồng thời tối đa của nguồn này
+    # stale_after: frame cũ hơn số giây này coi như camera bị treo
+    # tiling: dict cấu hình tile (None = theo mặc định của app, False = tắt)
+    def __init__(self, source_id, camera, max_inflight=1, stale_after=5.0, tiling=None):
+        self.id = source_id
+        self.camera = camera
+        self.tiling = tiling
+        self.stale_after = stale_after
+        self.slots = threading.BoundedSemaphore(max(1, int(max_inflight)))
+
+    # ===== acquire / release =====
+    # Mặc định không chờ: nếu nguồn đang bận thì báo lỗi ngay, không chặn nguồn khác
+    # timeout (giây): chờ nguồn rảnh (UART chờ lần detect đang chạy thay vì bị từ chối)
+    def acquire(self, timeout=None):
+        if timeout is None:
+            return self.slots.acquire(blocking=False)
+        return self.slots.acquire(timeout=timeout)
+
+    def release(self):
+        self.slots.release()
+
+    # ===== is_stale =====
+    def is_stale(self):
+        age = self.camera.frame_age()
+        return age is None or (self.stale_after and age > self.stale_after)
+
+
+class SourceRegistry:
+    # ===== __init__ =====
+    def __init__(self, ring_size=4):
+        self.ring_size = ring_size
+        self.sources = {}        # id -> Source (giữ thứ tự khai báo)
+
+    # ===== load =====
+    # Đọc file cấu hình; không có file → một camera index 0 như trước
+    def load(self, config_path=None):
+        entries = DEFAULT_SOURCES
+        base_dir = os.getcwd()
+        if config_path and os.path.exists(config_path):
+            with open(config_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            entries = data.get("sources", data) if isinstance(data, dict) else data
+            base_dir = os.path.dirname(os.path.abspath(config_path))
+        for entry in entries:
+            self.add(entry, base_dir)
+        return self
+
+    # ===== add =====
+    # Tạo CameraHandler cho một entry cấu hình
+    def add(self, entry, base_dir="."):
+        source_id = str(entry.get("id", len(self.sources)))
+        if source_id in self.sources:
+            raise ValueError(f"Duplicate source id: {source_id}")
+        src = entry.get("src", 0)
+        factory = None
+        if isinstance(src, str) and src.startswith("synthetic"):
+            factory = lambda: SyntheticCapture(entry.get("width", 640), entry.get("height", 480),
+                                               entry.get("objects", 6), entry.get("seed", 0))
+        elif isinstance(src, str) and src.isdigit():
+            src = int(src)
+        elif isinstance(src, str) and "://" not in src and not os.path.isabs(src):
+            src = os.path.join(base_dir, src)
+        camera = CameraHandler(
+            src,
+            ring_size=entry.get("ring_size", self.ring_size),
+            fps=entry.get("fps"),
+            loop=entry.get("loop", False),
+            capture_factory=factory,
+            name=source_id,
+        )
+        source = Source(source_id, camera,
+                        max_inflight=entry.get("max_inflight", 1),
+                        stale_after=entry.get("stale_after", 5.0),
+                        tiling=entry.get("tiling"))
+        self.sources[source_id] = source
+        return source
+
+    # ===== get =====
+    # source_id None → nguồn đầu tiên (tương thích API một camera cũ)
+    def get(self, source_id=None):
+        if source_id is None:
+            return next(iter(self.sources.values()), None)
+        return self.sources.get(str(source_id))
+
+    def ids(self):
+        return list(self.sources.keys())
+
+    def __iter__(self):
+        return iter(list(self.sources.values()))
+
+    def __len__(self):
+        return len(self.sources)
+
+    # ===== start / stop =====
+    def start(self):
+        for source in self:
+            source.camera.start()
+
+    def stop(self):
+        for source in self:
+            source.camera.stop()
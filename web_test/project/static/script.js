@@ -99,12 +99,25 @@ function updateLightTimes(g, y, r) {
     document.getElementById("redTime").textContent = `${r}s`;
 }
 
+// ==============================================
+//   NẠP ẢNH CÓ THỬ LẠI
+//   (server trả kết quả trước, ảnh được ghi ở thread nền nên có thể chưa có)
+// ==============================================
+function loadImageWithRetry(img, url, retries = 10, delayMs = 200) {
+    let attempt = 0;
+    img.onerror = () => {
+        if (attempt++ >= retries) return;
+        setTimeout(() => { img.src = noCache(url); }, delayMs);
+    };
+    img.src = noCache(url);
+}
+
 // ==============================================
 //     HIỆN ẢNH ĐÃ XỬ LÝ
 // ==============================================
 function showProcessedImage(url) {
     processedImg.onload = () => processedImg.classList.add("active");
-    processedImg.src = url;
+    loadImageWithRetry(processedImg, url);
 }
 
 // ==============================================
@@ -124,13 +137,13 @@ function handleCaptureResponse(data) {
 
     // ----------- Ảnh gốc -----------  
     if (data.input_image_url) {
-        originalImg.src = noCache(data.input_image_url);
+        loadImageWithRetry(originalImg, data.input_image_url);
         originalImg.classList.add("active");
     }
 
     // ----------- Ảnh detect -----------  
     if (data.processed_image_url) {
-        showProcessedImage(noCache(data.processed_image_url));
+        showProcessedImage(data.processed_image_url);
         downloadBtn.href = data.processed_image_url;
     }
 
@@ -191,8 +204,8 @@ function startCamera() {
 window.addEventListener("DOMContentLoaded", () => {
     // Chỉ hiển thị camera – KHÔNG tự detect
     startCamera();
-    // Bắt đầu polling file last_detection.json để cập nhật ảnh khi có detect từ UART
-    startLastDetectionPolling();
+    // Nhận kết quả detect (kể cả detect từ UART) do server đẩy về qua /events
+    startDetectionEvents();
 });
 
 // ==============================================
@@ -240,24 +253,66 @@ form.addEventListener("submit", async (e) => {
 });
 
 // ==========================
-// Polling last_detection.json
+// Kết quả detect đẩy từ server (Server-Sent Events /events)
 // ==========================
+// Không có EventSource hoặc kết nối /events lỗi → hỏi /last_detection định kỳ.
+// Mất kết nối tạm thời (server restart, rớt mạng): trình duyệt tự kết nối lại và
+// server gửi bù các kết quả đã lỡ theo Last-Event-ID; chỉ hỏi định kỳ trong lúc chờ.
+const EVENTS_MAX_FAILURES = 3;         // lỗi liên tiếp trước khi bật hỏi định kỳ
+const EVENTS_RETRY_MS = 30000;         // server từ chối hẳn → thử lại /events sau
 let lastDetectionTimestamp = 0;
+let detectionEvents = null;
+let detectionEventFailures = 0;
 let lastPollInterval = null;
 
+function applyDetection(data) {
+    if (!data || !data.timestamp) return;
+    // history gửi lại khi kết nối có thể cũ hơn kết quả đang hiển thị
+    if (data.timestamp < lastDetectionTimestamp) return;
+    lastDetectionTimestamp = data.timestamp;
+    handleCaptureResponse(data);
+}
+
+function startDetectionEvents() {
+    if (!window.EventSource) {
+        startLastDetectionPolling();
+        return;
+    }
+    if (detectionEvents) return;
+    detectionEvents = new EventSource("/events");
+    detectionEvents.addEventListener("detection", (e) => {
+        // SSE chạy lại → tắt hỏi định kỳ
+        stopLastDetectionPolling();
+        try {
+            applyDetection(JSON.parse(e.data));
+        } catch (err) {
+            // bỏ qua sự kiện lỗi
+        }
+    });
+    detectionEvents.onopen = () => {
+        detectionEventFailures = 0;
+    };
+    detectionEvents.onerror = () => {
+        detectionEventFailures += 1;
+        if (detectionEvents.readyState === EventSource.CLOSED) {
+            // server từ chối (503: quá số client /events) → trình duyệt không tự kết nối lại
+            detectionEvents = null;
+            startLastDetectionPolling();
+            setTimeout(startDetectionEvents, EVENTS_RETRY_MS);
+        } else if (detectionEventFailures >= EVENTS_MAX_FAILURES) {
+            // trình duyệt vẫn đang kết nối lại; hỏi định kỳ trong lúc chờ
+            startLastDetectionPolling();
+        }
+    };
+}
+
 async function pollLastDetection() {
     try {
-        const res = await fetch(noCache('/static/last_detection.json'));
+        const res = await fetch(noCache('/last_detection'));
         if (!res.ok) return;
-        const data = await res.json();
-        if (!data || !data.timestamp) return;
-        if (data.timestamp > lastDetectionTimestamp) {
-            lastDetectionTimestamp = data.timestamp;
-            // Update UI using existing handler
-            handleCaptureResponse(data);
-        }
+        applyDetection(await res.json());
     } catch (e) {
-        // ignore fetch errors (file may not exist yet)
+        // ignore fetch errors (chưa có kết quả)
     }
 }
 
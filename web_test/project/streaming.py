@@ -0,0 +1,128 @@
+import threading
+import time
+import cv2
+import metrics
+
+#======================================
+# MJPEG BROADCASTER - encode mỗi frame camera đúng 1 lần, phát cho mọi client
+#======================================
+# Một thread encoder chờ frame mới từ CameraHandler (theo sequence number),
+# resize + encode JPEG một lần rồi đặt vào slot "mới nhất". Mỗi client chỉ
+# lấy frame mới nhất: client chậm sẽ bỏ qua frame chứ không tích hàng đợi.
+
+
+class MjpegBroadcaster:
+    # ===== __init__ =====
+    # fps: giới hạn số frame encode mỗi giây
+    # max_width / max_height: giới hạn độ phân giải stream (giữ tỉ lệ)
+    # quality: chất lượng JPEG (0..100)
+    def __init__(self, camera, fps=15, max_width=640, max_height=480, quality=70):
+        self.camera = camera
+        self.fps = max(1.0, float(fps))
+        self.max_width = max_width
+        self.max_height = max_height
+        self.quality = int(quality)
+        self.cond = threading.Condition()
+        self.thread = None
+        self.running = False
+        self._has_subscribers = threading.Event()
+        self._subscribers = 0
+        self._index = 0            # số thứ tự frame đã encode (tăng dần)
+        self._frame_seq = 0        # sequence number camera của frame đã encode gần nhất
+        self._jpeg = None
+        self.encoded = 0
+        self.dropped = 0           # tổng số frame client bỏ qua vì đọc chậm
+
+    # ===== start =====
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._encoder, daemon=True)
+        self.thread.start()
+
+    # ===== _resize =====
+    # Thu nhỏ frame về trong khung max_width x max_height
+    def _resize(self, frame):
+        h, w = frame.shape[:2]
+        scale = 1.0
+        if self.max_width and w > self.max_width:
+            scale = min(scale, self.max_width / w)
+        if self.max_height and h > self.max_height:
+            scale = min(scale, self.max_height / h)
+        if scale >= 1.0:
+            return frame
+        return cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+    # ===== _encoder =====
+    # Thread nền: chỉ chạy khi có client; encode frame mới theo nhịp fps
+    def _encoder(self):
+        interval = 1.0 / self.fps
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+        next_tick = time.monotonic()
+        while self.running:
+            if not self._has_subscribers.wait(timeout=0.5):
+                continue
+            now = time.monotonic()
+            if now < next_tick:
+                time.sleep(next_tick - now)
+            next_tick = max(next_tick + interval, time.monotonic())
+
+            # chờ frame mới hơn frame đã encode; không có frame mới → không encode lại
+            ret, seq, frame = self.camera.wait_for_frame(self._frame_seq, timeout=0.5)
+            if not ret or frame is None:
+                continue
+            with metrics.timer("stream_encode"):
+                ok, jpeg = cv2.imencode('.jpg', self._resize(frame), params)
+            if not ok:
+                continue
+            with self.cond:
+                self._frame_seq = seq
+                self._index += 1
+                self._jpeg = jpeg.tobytes()
+                self.encoded += 1
+                self.cond.notify_all()
+
+    # ===== frames =====
+    # Generator cho một client: trả về bytes JPEG mới nhất mỗi khi có frame mới
+    def frames(self, timeout=5.0):
+        with self.cond:
+            self._subscribers += 1
+            self._has_subscribers.set()
+            # client mới nhận ngay frame đã encode gần nhất (nếu có)
+            last = self._index - 1 if self._jpeg is not None else self._index
+        try:
+            while self.running:
+                with self.cond:
+                    if not self.cond.wait_for(lambda: self._index != last or not self.running, timeout):
+                        continue
+                    index, data = self._index, self._jpeg
+                if index - last > 1:
+                    self.dropped += index - last - 1
+                    metrics.inc("stream_dropped_frames_total", index - last - 1, source=self.camera.name)
+                last = index
+                if data is not None:
+                    yield data
+        finally:
+            with self.cond:
+                self._subscribers -= 1
+                if self._subscribers <= 0:
+                    self._has_subscribers.clear()
+
+    # ===== stats =====
+    def stats(self):
+        return {
+            "subscribers": self._subscribers,
+            "encoded": self.encoded,
+            "dropped": self.dropped,
+            "frame_seq": self._frame_seq,
+        }
+
+    # ===== stop =====
+    def stop(self):
+        self.running = False
+        self._has_subscribers.set()
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
@@ -0,0 +1,54 @@
+import os
+import sys
+import threading
+import numpy as np
+import pytest
+
+# module của web_test/project import trực tiếp (như khi chạy app.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backends import Boxes, Detections, DEFAULT_NAMES
+
+
+# ===== make_detections =====
+# make_detections([[x1, y1, x2, y2], ...], conf=[...], cls=[...]) → backends.Detections
+@pytest.fixture
+def make_detections():
+    def make(boxes=(), conf=None, cls=None, image=None):
+        xyxy = np.asarray(boxes, np.float32).reshape(-1, 4)
+        n = len(xyxy)
+        conf = np.full(n, 0.9, np.float32) if conf is None else np.asarray(conf, np.float32)
+        cls = np.zeros(n, np.int64) if cls is None else np.asarray(cls, np.int64)
+        image = np.zeros((64, 64, 3), np.uint8) if image is None else image
+        return Detections(image, Boxes(xyxy, conf, cls), dict(enumerate(DEFAULT_NAMES)))
+    return make
+
+
+class FakeModel:
+    """ Model giả: model(list ảnh, conf=, iou=) → một Detections cho mỗi ảnh, ghi lại mọi lần gọi """
+
+    def __init__(self, make, detect=None):
+        self.make = make
+        self.detect = detect          # detect(image) → (boxes, conf, cls); None = không có box
+        self.calls = []               # [(số ảnh, conf, iou)]
+        self.lock = threading.Lock()
+        self.names = dict(enumerate(DEFAULT_NAMES))
+
+    def __call__(self, images, conf=0.25, iou=0.7, **kwargs):
+        if isinstance(images, np.ndarray):
+            images = [images]
+        with self.lock:
+            self.calls.append((len(images), conf, iou))
+        results = []
+        for image in images:
+            boxes, scores, cls = self.detect(image) if self.detect else ((), None, None)
+            results.append(self.make(boxes, scores, cls, image=image))
+        return results
+
+
+# ===== fake_model =====
+# fake_model(detect=None) → FakeModel; detect(image) trả box của từng ảnh
+@pytest.fixture
+def fake_model(make_detections):
+    def make(detect=None):
+        return FakeModel(make_detections, detect)
+    return make
@@ -0,0 +1,125 @@
+import threading
+import time
+import pytest
+from admission import AdmissionController, Overloaded, SharedResults
+
+
+#======================================
+# AdmissionController (slot dành riêng cho UART) và SharedResults (gộp request trùng)
+#======================================
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+# ===== reserved UART slot =====
+# Web dùng tối đa max_inflight - reserved slot; slot còn lại chỉ UART vào được
+def test_web_cannot_take_the_reserved_uart_slot():
+    admission = AdmissionController(max_inflight=2, reserved=1, max_waiting=0)
+    web = admission.acquire("web")
+    with pytest.raises(Overloaded) as exc:
+        admission.acquire("web")
+    assert exc.value.retry_after > 0
+    uart = admission.acquire("uart")
+    assert admission.stats()["inflight"] == {"uart": 1, "web": 1}
+    assert admission.stats()["rejected"] == 1
+    admission.release("uart", uart)
+    admission.release("web", web)
+
+
+def test_web_times_out_waiting_for_a_slot():
+    admission = AdmissionController(max_inflight=2, reserved=1, max_waiting=1, max_wait=0.05)
+    with admission.slot("web"):
+        with pytest.raises(Overloaded):
+            admission.acquire("web")
+    assert admission.stats()["timeouts"] == 1
+    # slot đã trả → vào lại được
+    with admission.slot("web"):
+        pass
+
+
+# Web và UART cùng chờ → slot vừa trả thuộc về UART (dù web đến trước)
+def test_waiting_uart_gets_the_next_free_slot():
+    admission = AdmissionController(max_inflight=2, reserved=0, max_waiting=1, max_wait=2)
+    held = [admission.acquire("web"), admission.acquire("web")]
+    done = threading.Event()
+
+    def client(priority):
+        started = admission.acquire(priority, timeout=2)
+        done.wait(2)
+        admission.release(priority, started)
+
+    threads = [threading.Thread(target=client, args=("web",))]
+    threads[0].start()
+    wait_until(lambda: admission.stats()["waiting"]["web"] == 1)
+    threads.append(threading.Thread(target=client, args=("uart",)))
+    threads[1].start()
+    wait_until(lambda: admission.stats()["waiting"]["uart"] == 1)
+    admission.release("web", held.pop())
+    wait_until(lambda: admission.stats()["inflight"]["uart"] == 1)
+    assert admission.stats()["waiting"]["web"] == 1
+    # slot kế tiếp mới tới lượt web
+    admission.release("web", held.pop())
+    wait_until(lambda: admission.stats()["inflight"]["web"] == 1)
+    done.set()
+    for t in threads:
+        t.join(2)
+    assert admission.stats()["inflight"] == {"uart": 0, "web": 0}
+
+
+# ===== SharedResults =====
+# Request trùng key đang chạy → chờ chung, fn chỉ chạy một lần
+def test_concurrent_requests_share_one_execution():
+    shared = SharedResults(window=0)
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(2)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(shared.run("k", fn))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    wait_until(lambda: shared.stats()["shared"] == 3)
+    release.set()
+    for t in threads:
+        t.join(2)
+    assert results == ["result"] * 4 and len(calls) == 1
+    assert shared.stats()["executed"] == 1
+    # window = 0: xong rồi thì lần sau chạy lại
+    shared.run("k", fn)
+    assert len(calls) == 2
+
+
+def test_recent_result_is_reused_within_window_unless_rejected():
+    shared = SharedResults(window=5)
+    calls = []
+
+    def fn(value):
+        calls.append(value)
+        return value
+
+    assert shared.run("a", lambda: fn("ok")) == "ok"
+    assert shared.run("a", lambda: fn("again")) == "ok"
+    assert shared.run("b", lambda: fn("other")) == "other"
+    # kết quả lỗi không được giữ lại
+    shared.run("c", lambda: fn("error"), reusable=lambda r: r != "error")
+    assert shared.run("c", lambda: fn("fixed")) == "fixed"
+    assert calls == ["ok", "other", "error", "fixed"]
+
+
+def test_exception_is_shared_and_not_cached():
+    shared = SharedResults(window=5)
+
+    def boom():
+        raise RuntimeError("camera")
+
+    with pytest.raises(RuntimeError):
+        shared.run("k", boom)
+    assert shared.run("k", lambda: "ok") == "ok"
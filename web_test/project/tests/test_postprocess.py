@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from postprocess import summarize, keep_mask, parse_class_conf
+from roi import Roi
+
+
+#======================================
+# summarize / keep_mask: lọc box + tra bảng thời gian đèn / lệnh UART
+#======================================
+
+# ===== baseline_timing =====
+# Bảng if/elif của app.py bản gốc (trước khi vector hoá) - kết quả phải giữ nguyên
+def baseline_timing(total):
+    if 0 < total < 5:
+        return 20, "m1"
+    elif 5 <= total <= 10:
+        return 45, "m2"
+    elif 10 < total <= 20:
+        return 60, "m3"
+    elif total > 20:
+        return 90, "m4"
+    return 30, "m0"
+
+
+@pytest.mark.parametrize("total", list(range(0, 26)) + [100])
+def test_summarize_matches_baseline_mapping(make_detections, total):
+    det = make_detections([[0, 0, 10, 10]] * total, cls=[i % 6 for i in range(total)])
+    summary = summarize(det)
+    seconds, cmd = baseline_timing(total)
+    assert summary.total_vehicles == total
+    assert (summary.total_seconds, summary.cmd) == (seconds, cmd)
+    assert summary.green_seconds == seconds - 3
+    assert summary.counts.sum() == total
+
+
+def test_summarize_counts_per_class_and_drops_unknown_classes(make_detections):
+    det = make_detections([[0, 0, 10, 10]] * 5, cls=[0, 2, 2, 7, -1])
+    summary = summarize(det, num_classes=6)
+    assert summary.counts.tolist() == [1, 0, 2, 0, 0, 0]
+    assert summary.cls.tolist() == [0, 2, 2]
+
+
+def test_summarize_without_boxes(make_detections):
+    summary = summarize(make_detections())
+    assert summary.to_dict() == {"counts": [0] * 6, "total_vehicles": 0, "total_seconds": 30, "green_seconds": 27}
+
+
+# ===== keep_mask =====
+def test_keep_mask_applies_global_and_per_class_conf():
+    xyxy = np.zeros((4, 4), np.float32)
+    conf = np.array([0.3, 0.6, 0.45, 0.9], np.float32)
+    cls = np.array([0, 0, 1, 1])
+    assert keep_mask(xyxy, conf, cls, 6, conf_thres=0.5).tolist() == [False, True, False, True]
+    # lớp 1 cần conf >= 0.5, lớp 0 chỉ cần 0.25
+    class_conf = parse_class_conf("0.25,0.5", 6)
+    assert keep_mask(xyxy, conf, cls, 6, class_conf=class_conf).tolist() == [True, True, False, True]
+
+
+def test_keep_mask_filters_on_box_centre_in_roi():
+    # tâm: (5, 5), (25, 5), (5, 25)
+    xyxy = np.array([[0, 0, 10, 10], [20, 0, 30, 10], [0, 20, 10, 30]], np.float32)
+    conf = np.full(3, 0.9, np.float32)
+    cls = np.zeros(3, np.int64)
+    mask = np.zeros((40, 40), np.uint8)
+    mask[:, :15] = 1
+    assert keep_mask(xyxy, conf, cls, 6, roi_mask=mask).tolist() == [True, False, True]
+    # tam giác chỉ chứa góc trên trái
+    roi = Roi(polygons=[[[0, 0], [20, 0], [0, 20]]])
+    assert keep_mask(xyxy, conf, cls, 6, roi=roi).tolist() == [True, False, False]
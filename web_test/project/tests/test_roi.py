@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+from roi import Roi, points_in_polygon, detect_in_roi
+
+
+#======================================
+# ROI: điểm trong đa giác (vector hoá), rect, crop + dịch box về toạ độ frame
+#======================================
+
+# hình chữ U (lõm): phần khuyết ở giữa x 4..6, y 4..10 nằm ngoài
+U_SHAPE = np.array([[0, 0], [10, 0], [10, 10], [6, 10], [6, 4], [4, 4], [4, 10], [0, 10]], np.float32)
+
+
+# ===== points_in_polygon =====
+def test_points_in_concave_polygon():
+    x = np.array([2, 8, 5, 5, 12, -1])
+    y = np.array([8, 8, 2, 8, 5, 5])
+    assert points_in_polygon(x, y, U_SHAPE).tolist() == [True, True, True, False, False, False]
+
+
+def test_points_in_polygon_matches_opencv():
+    rng = np.random.default_rng(0)
+    poly = np.array([[0, 720], [420, 300], [760, 300], [1280, 720]], np.float32)
+    pts = rng.uniform(0, 1280, size=(500, 2)).astype(np.float32)
+    # bỏ các điểm sát cạnh (hai cách làm tròn khác nhau ở biên)
+    dist = np.array([cv2.pointPolygonTest(poly, (float(px), float(py)), True) for px, py in pts])
+    pts, dist = pts[np.abs(dist) > 1e-3], dist[np.abs(dist) > 1e-3]
+    assert (points_in_polygon(pts[:, 0], pts[:, 1], poly) == (dist > 0)).all()
+
+
+# ===== Roi =====
+def test_roi_rect_contains_and_crop():
+    roi = Roi(rect=[30, 20, 10, 5])                 # góc đảo ngược vẫn được chuẩn hoá
+    assert roi.rect == (10, 5, 30, 20)
+    assert roi.contains([10, 20, 31], [5, 12, 12]).tolist() == [True, True, False]
+    frame = np.zeros((40, 50, 3), np.uint8)
+    crop, offset = roi.crop(frame)
+    assert crop.shape[:2] == (15, 20) and offset == (10, 5)
+    # ROI nằm ngoài frame → dùng cả frame
+    crop, offset = Roi(rect=[100, 100, 120, 120]).crop(frame)
+    assert crop.shape == frame.shape and offset == (0, 0)
+
+
+def test_roi_from_config_polygons():
+    roi = Roi.from_config({"polygon": U_SHAPE.tolist()})
+    assert roi.rect == (0, 0, 10, 10)
+    assert roi.contains([2, 5], [8, 8]).tolist() == [True, False]
+
+
+# ===== detect_in_roi =====
+# Model chỉ thấy crop; box trả về theo toạ độ frame gốc
+def test_detect_in_roi_shifts_boxes_to_frame(fake_model):
+    model = fake_model(lambda image: ([[1, 2, 5, 6]], [0.8], [3]))
+    frame = np.zeros((100, 200, 3), np.uint8)
+    det = detect_in_roi(model, frame, Roi(rect=[50, 40, 150, 90]), conf=0.4, iou=0.6)
+    assert model.calls == [(1, 0.4, 0.6)]
+    assert det.boxes.xyxy.tolist() == [[51, 42, 55, 46]]
+    assert det.boxes.cls.tolist() == [3]
+    assert det.orig_img is frame
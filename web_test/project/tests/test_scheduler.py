@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from scheduler import InferenceScheduler, SchedulerFull
+
+
+#======================================
+# InferenceScheduler: gom frame thành batch, nhóm theo (conf, iou)
+#======================================
+# Frame được submit trước start() nên đã nằm sẵn trong hàng đợi → batch xác định.
+
+def frames(n):
+    return [np.full((8, 8, 3), i, np.uint8) for i in range(n)]
+
+
+@pytest.fixture
+def scheduler(fake_model):
+    created = []
+
+    def make(max_batch_size=4, **kwargs):
+        s = InferenceScheduler(fake_model(), max_batch_size=max_batch_size, max_wait=0.05,
+                               latency_budget=None, **kwargs)
+        created.append(s)
+        return s
+    yield make
+    for s in created:
+        s.stop()
+
+
+# ===== batching =====
+# Các frame đang chờ đi chung một lần gọi model, mỗi Future nhận đúng kết quả của frame mình
+def test_queued_frames_share_one_model_call(scheduler):
+    s = scheduler()
+    imgs = frames(3)
+    futures = [s.submit(img, conf=0.5, iou=0.5) for img in imgs]
+    s.start()
+    results = [f.result(timeout=2) for f in futures]
+    assert s.model.calls == [(3, 0.5, 0.5)]
+    assert all(r.orig_img is img for r, img in zip(results, imgs))
+
+
+def test_batches_are_capped_at_max_batch_size(scheduler):
+    s = scheduler(max_batch_size=2)
+    futures = [s.submit(img) for img in frames(5)]
+    s.start()
+    for f in futures:
+        f.result(timeout=2)
+    assert [n for n, _, _ in s.model.calls] == [2, 2, 1]
+    assert s.stats()["frames"] == 5
+
+
+# ===== grouping =====
+# conf / iou khác nhau trong cùng một lượt gom → mỗi nhóm một lần gọi model với đúng tham số
+def test_jobs_are_grouped_by_conf_and_iou(scheduler):
+    s = scheduler()
+    imgs = frames(3)
+    a = s.submit(imgs[0], conf=0.5, iou=0.5)
+    b = s.submit(imgs[1], conf=0.25, iou=0.7)
+    c = s.submit(imgs[2], conf=0.5, iou=0.5)
+    s.start()
+    assert a.result(timeout=2).orig_img is imgs[0]
+    assert b.result(timeout=2).orig_img is imgs[1]
+    assert c.result(timeout=2).orig_img is imgs[2]
+    assert sorted(s.model.calls) == [(1, 0.25, 0.7), (2, 0.5, 0.5)]
+
+
+# ===== submit_batch =====
+# Ảnh của một request trả về list theo thứ tự, đi chung batch với frame lẻ
+def test_submit_batch_returns_results_in_order(scheduler):
+    s = scheduler()
+    single, *tiles = frames(4)
+    f_single = s.submit(single)
+    f_tiles = s.submit_batch(tiles)
+    s.start()
+    results = f_tiles.result(timeout=2)
+    assert len(results) == 3 and all(r.orig_img is t for r, t in zip(results, tiles))
+    assert f_single.result(timeout=2).orig_img is single
+    assert s.model.calls == [(4, 0.5, 0.5)]
+
+
+def test_full_queue_fails_the_future(scheduler):
+    s = scheduler(max_queue=1)
+    s.submit(frames(1)[0])
+    with pytest.raises(SchedulerFull):
+        s.submit(frames(1)[0]).result(timeout=1)
@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+from tiling import tile_grid, merge_nms, TiledModel
+
+
+#======================================
+# TILING: lưới tile phủ kín frame, NMS gộp box trùng giữa các tile
+#======================================
+
+# ===== tile_grid =====
+def test_tile_grid_covers_frame_with_requested_overlap():
+    w, h, size, overlap = 1920, 1080, 640, 0.2
+    grid = tile_grid(w, h, size, overlap)
+    covered = np.zeros((h, w), bool)
+    for x1, y1, x2, y2 in grid:
+        assert 0 <= x1 < x2 <= w and 0 <= y1 < y2 <= h
+        assert (x2 - x1, y2 - y1) == (size, size)
+        covered[y1:y2, x1:x2] = True
+    assert covered.all()
+    xs = sorted({x1 for x1, _, _, _ in grid})
+    assert all(b - a <= size * (1 - overlap) for a, b in zip(xs, xs[1:]))
+
+
+def test_tile_grid_small_frame_is_one_tile():
+    assert tile_grid(320, 240, 640) == [(0, 0, 320, 240)]
+
+
+# ===== merge_nms =====
+# Xe vắt qua đường nối: tile trái thấy box cụt, tile phải thấy box đầy đủ → giữ một box
+def test_merge_nms_collapses_duplicate_across_seam():
+    xyxy = np.array([[600, 100, 640, 140],      # bị cắt ở mép tile trái (x = 640)
+                     [600, 100, 660, 140],      # đầy đủ trong tile phải
+                     [600, 100, 660, 140]],     # cùng chỗ nhưng khác lớp
+                    np.float32)
+    conf = np.array([0.6, 0.9, 0.5], np.float32)
+    cls = np.array([0, 0, 2])
+    assert sorted(merge_nms(xyxy, conf, cls).tolist()) == [1, 2]
+    # IoU của box cụt với box đầy đủ chỉ 0.67 → metric "iou" với ngưỡng 0.7 giữ cả hai
+    assert len(merge_nms(xyxy, conf, cls, threshold=0.7, metric="iou")) == 3
+
+
+def test_merge_nms_keeps_separate_boxes():
+    xyxy = np.array([[0, 0, 10, 10], [50, 50, 60, 60]], np.float32)
+    assert sorted(merge_nms(xyxy, np.array([0.5, 0.9], np.float32), np.zeros(2, np.int64)).tolist()) == [0, 1]
+    assert merge_nms(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64)).tolist() == []
+
+
+# ===== TiledModel =====
+# Model giả "thấy" mọi vùng trắng trong ảnh nó nhận (tile), conf tăng theo độ rộng box
+def blobs(image):
+    n, _, stats, _ = cv2.connectedComponentsWithStats((image[..., 0] > 0).astype(np.uint8))
+    boxes = [[x, y, x + w, y + h] for x, y, w, h, _ in stats[1:n]]
+    return boxes, [0.5 + (b[2] - b[0]) / 1000 for b in boxes], [0] * len(boxes)
+
+
+def test_tiled_model_reports_each_vehicle_once(fake_model):
+    frame = np.zeros((500, 1000, 3), np.uint8)
+    frame[100:140, 500:560] = 255      # nằm gọn trong cả hai tile (x 0..640 và 360..1000)
+    frame[200:240, 620:700] = 255      # vắt qua mép phải của tile trái
+    model = fake_model(blobs)
+    tiled = TiledModel(model, tile_size=640, overlap=0.2, full_frame=False)
+    det = tiled(frame, conf=0.3, iou=0.6)[0]
+    assert model.calls == [(2, 0.3, 0.6)]
+    assert sorted(det.boxes.xyxy.tolist()) == [[500, 100, 560, 140], [620, 200, 700, 240]]
+    timing = det.tiling
+    assert timing["tiles"] == 2
+    assert timing["boxes_before_merge"] == 4 and timing["boxes_after_merge"] == 2
+    assert timing["mean_tile_ms"] <= timing["infer_ms"]
@@ -0,0 +1,133 @@
+import threading
+import time
+import pytest
+
+pytest.importorskip("serial")
+fake_serial = pytest.importorskip("fake_serial")   # cần pty (Linux / macOS)
+from uart import UARTHandler
+
+
+#======================================
+# UARTHandler qua cổng pty giả (FakeSerialPort): phía test đóng vai ESP32
+#======================================
+
+def result(cmd, total=1):
+    return {"total_vehicles": total}, cmd
+
+
+@pytest.fixture
+def fake():
+    port = fake_serial.FakeSerialPort()
+    yield port
+    port.close()
+
+
+def start_handler(fake, on_yell, **kwargs):
+    handler = UARTHandler(fake.port, timeout=0.1, on_yell=on_yell, **kwargs)
+    assert handler.uart is not None
+    handler.start_listening()
+    return handler
+
+
+# ===== coalescing =====
+# 'yell' trùng trong lúc yêu cầu trước đang chạy → chỉ một lần detect, một dòng trả lời
+def test_duplicate_yells_are_coalesced(fake):
+    release = threading.Event()
+    calls = []
+
+    def on_yell(target):
+        calls.append(target)
+        release.wait(5)
+        return {None: result("m2")}
+
+    handler = start_handler(fake, on_yell)
+    try:
+        for _ in range(3):
+            fake.write_line("yell")
+        deadline = time.monotonic() + 2
+        while handler.yells < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        assert fake.read_line(timeout=2) == "m2"
+        assert fake.read_line(timeout=0.3) is None
+        assert calls == [None]
+        assert handler.coalesced == 2
+    finally:
+        handler.stop()
+
+
+# ===== deadline fallback =====
+# Quá hạn → gửi lệnh gần nhất đã biết; kết quả đến muộn chỉ cập nhật lệnh gần nhất
+def test_deadline_sends_last_known_command(fake):
+    delay = {"value": 0.0}
+
+    def on_yell(target):
+        time.sleep(delay["value"])
+        return {None: result("m3")}
+
+    handler = start_handler(fake, on_yell, deadline=0.15)
+    try:
+        # chưa có lệnh nào → quá hạn trả m0
+        delay["value"] = 0.5
+        t0 = time.monotonic()
+        fake.write_line("yell")
+        assert fake.read_line(timeout=1) == "m0"
+        assert time.monotonic() - t0 < 0.45
+        # kết quả muộn không gửi thêm dòng nào nhưng được nhớ
+        assert fake.read_line(timeout=0.6) is None
+        assert handler.last_cmd[None] == "m3"
+        assert handler.deadline_misses == 1
+
+        # lần sau quá hạn → gửi lệnh gần nhất (m3)
+        fake.write_line("yell")
+        assert fake.read_line(timeout=1) == "m3"
+        assert handler.deadline_misses == 2
+
+        # kịp hạn → trả kết quả thật
+        time.sleep(0.5)
+        delay["value"] = 0.0
+        fake.write_line("yell")
+        assert fake.read_line(timeout=1) == "m3"
+        assert handler.deadline_misses == 2
+    finally:
+        handler.stop()
+
+
+# ===== yell all / yell <id> =====
+# Mỗi nguồn một dòng "<id>:mN"; lỗi của một nguồn → "<id>:m0"
+def test_yell_all_prefixes_each_source(fake):
+    targets = []
+
+    def on_yell(target):
+        targets.append(target)
+        if target == "all":
+            return {"north": result("m1"), "south": ({"error": "Camera not available"}, "m0"),
+                    "east": result("m4")}
+        return {target: result("m2")}
+
+    handler = start_handler(fake, on_yell, source_ids=["north", "south", "east"])
+    try:
+        fake.write_line("yell ALL")
+        assert sorted(fake.read_lines(3, timeout=2)) == ["east:m4", "north:m1", "south:m0"]
+        fake.write_line("yell north")
+        assert fake.read_line(timeout=1) == "north:m2"
+        assert targets == ["all", "north"]
+        assert handler.last_cmd == {"north": "m2", "east": "m4"}
+    finally:
+        handler.stop()
+
+
+def test_yell_all_deadline_falls_back_per_source(fake):
+    def on_yell(target):
+        time.sleep(0.5)
+        return {"north": result("m1"), "south": result("m3")}
+
+    handler = start_handler(fake, on_yell, deadline=0.1, source_ids=["north", "south"])
+    handler.last_cmd["south"] = "m2"
+    try:
+        fake.write_line("yell all")
+        assert fake.read_lines(2, timeout=1) == ["north:m0", "south:m2"]
+        assert fake.read_line(timeout=0.7) is None
+        assert handler.last_cmd == {"north": "m1", "south": "m3"}
+    finally:
+        handler.stop()
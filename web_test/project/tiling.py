@@ -0,0 +1,144 @@
+import math
+import time
+import numpy as np
+import metrics
+from backends import Boxes, Detections, DEFAULT_NAMES
+from postprocess import box_arrays
+
+#======================================
+# TILING - detect theo tile chồng lấn cho camera độ phân giải cao
+#======================================
+# Frame (hoặc crop ROI) 1080p / 4K bị thu về imgsz khi đưa nguyên vào model nên
+# xe máy / xe ba bánh ở xa gần như biến mất. Ở chế độ tile, frame được cắt thành
+# các tile tile_size x tile_size chồng lấn nhau `overlap`, tất cả tile (cộng thêm
+# một ảnh cả frame nếu full_frame=True, để giữ xe lớn nằm vắt qua nhiều tile) đi
+# chung một lần gọi model; box được dịch về toạ độ frame rồi gộp bằng NMS vector
+# hoá giữa các tile. Đổi tile_size / overlap theo từng camera để cân giữa độ chính
+# xác và tốc độ.
+
+
+# ===== tile_grid =====
+# Vị trí tile (x1, y1, x2, y2) phủ kín ảnh w x h, các tile cách đều, chồng lấn >= overlap
+def tile_grid(w, h, tile_size=640, overlap=0.2):
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        stride = max(1, int(tile_size * (1 - overlap)))
+        n = math.ceil((length - tile_size) / stride) + 1
+        return np.round(np.linspace(0, length - tile_size, n)).astype(int).tolist()
+    return [(x, y, min(w, x + tile_size), min(h, y + tile_size)) for y in starts(h) for x in starts(w)]
+
+
+# ===== box_overlap =====
+# Ma trận chồng lấn (N, N) giữa các box; metric "iou" hoặc "ios" (giao / diện tích box nhỏ hơn,
+# hợp với box bị tile cắt cụt: box cụt nằm gọn trong box đầy đủ nên IoU thấp nhưng IoS cao)
+def box_overlap(xyxy, metric="ios"):
+    x1 = np.maximum(xyxy[:, None, 0], xyxy[None, :, 0])
+    y1 = np.maximum(xyxy[:, None, 1], xyxy[None, :, 1])
+    x2 = np.minimum(xyxy[:, None, 2], xyxy[None, :, 2])
+    y2 = np.minimum(xyxy[:, None, 3], xyxy[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    if metric == "iou":
+        denom = area[:, None] + area[None, :] - inter
+    else:
+        denom = np.minimum(area[:, None], area[None, :])
+    return inter / np.maximum(denom, 1e-6)
+
+
+# ===== merge_nms =====
+# NMS theo lớp giữa các tile → chỉ số box được giữ (conf giảm dần)
+# Ma trận chồng lấn tính một lần cho mọi cặp; vòng lặp chỉ đi qua box còn sống
+def merge_nms(xyxy, conf, cls, threshold=0.5, metric="ios"):
+    if len(conf) == 0:
+        return np.zeros((0,), np.int64)
+    order = np.argsort(-conf, kind="stable")
+    xyxy, cls = xyxy[order], cls[order]
+    overlap = box_overlap(xyxy, metric)
+    # chỉ so box cùng lớp
+    suppress = (overlap > threshold) & (cls[:, None] == cls[None, :])
+    alive = np.ones(len(order), dtype=bool)
+    for i in range(len(order)):
+        if alive[i]:
+            alive[i + 1:] &= ~suppress[i, i + 1:]
+    return order[alive]
+
+
+class TiledModel:
+    """ Bọc model / scheduler: cùng giao diện model(frame, conf=, iou=), chạy theo tile """
+
+    # ===== __init__ =====
+    # tile_size: cạnh tile (pixel frame); overlap: tỉ lệ chồng lấn giữa 2 tile kề nhau
+    # full_frame: thêm ảnh cả frame vào cùng batch; merge_threshold / merge_metric: NMS giữa tile
+    def __init__(self, model, tile_size=640, overlap=0.2, full_frame=True,
+                 merge_threshold=0.5, merge_metric="ios", names=None, source_id=None):
+        self.model = model
+        self.tile_size = max(32, int(tile_size))
+        self.overlap = min(max(float(overlap), 0.0), 0.9)
+        self.full_frame = full_frame
+        self.merge_threshold = merge_threshold
+        self.merge_metric = merge_metric
+        self.names = names or getattr(model, "names", None) or dict(enumerate(DEFAULT_NAMES))
+        self.source_id = source_id
+        self.last_timing = None
+
+    # ===== __call__ =====
+    def __call__(self, frames, conf=0.25, iou=0.7, **kwargs):
+        if isinstance(frames, np.ndarray):
+            frames = [frames]
+        return [self.detect(frame, conf, iou) for frame in frames]
+
+    # ===== detect =====
+    # Một frame → Detections (toạ độ frame) + .tiling (thời gian, số box từng tile)
+    def detect(self, frame, conf=0.25, iou=0.7):
+        h, w = frame.shape[:2]
+        grid = tile_grid(w, h, self.tile_size, self.overlap)
+        images = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in grid]
+        offsets = [(x1, y1) for x1, y1, _, _ in grid]
+        if self.full_frame and len(grid) > 1:
+            images.append(frame)
+            offsets.append((0, 0))
+        t0 = time.perf_counter()
+        results = self.model(images, conf=conf, iou=iou)
+        infer_s = time.perf_counter() - t0
+
+        t1 = time.perf_counter()
+        all_xyxy, all_conf, all_cls, per_tile = [], [], [], []
+        for (ox, oy), result in zip(offsets, results):
+            xyxy, scores, cls = box_arrays(result)
+            all_xyxy.append(xyxy + np.array([ox, oy, ox, oy], np.float32))
+            all_conf.append(scores)
+            all_cls.append(cls)
+            per_tile.append(len(cls))
+        xyxy = np.concatenate(all_xyxy) if all_xyxy else np.zeros((0, 4), np.float32)
+        scores = np.concatenate(all_conf) if all_conf else np.zeros((0,), np.float32)
+        cls = np.concatenate(all_cls) if all_cls else np.zeros((0,), np.int64)
+        keep = merge_nms(xyxy, scores, cls, self.merge_threshold, self.merge_metric) if len(grid) > 1 \
+            else np.arange(len(cls))
+        merge_s = time.perf_counter() - t1
+
+        # cả batch tile chạy trong một lần gọi model → chỉ đo được thời gian cả batch;
+        # mean_tile_ms là trung bình chia đều, không phải thời gian đo riêng từng tile
+        metrics.observe("tile_batch_inference", infer_s)
+        metrics.observe("tile_merge", merge_s)
+        timing = {
+            "tiles": len(grid),
+            "full_frame": len(images) > len(grid),
+            "tile_size": self.tile_size,
+            "overlap": self.overlap,
+            "infer_ms": round(infer_s * 1000, 2),
+            "mean_tile_ms": round(infer_s * 1000 / max(1, len(images)), 2),
+            "merge_ms": round(merge_s * 1000, 2),
+            "boxes_per_tile": per_tile,
+            "boxes_before_merge": int(len(cls)),
+            "boxes_after_merge": int(len(keep)),
+        }
+        self.last_timing = timing
+        det = Detections(frame, Boxes(xyxy[keep], scores[keep], cls[keep]), self.names)
+        det.tiling = timing
+        return det
+
+    # ===== stats =====
+    def stats(self):
+        return {"tile_size": self.tile_size, "overlap": self.overlap,
+                "full_frame": self.full_frame, "last": self.last_timing}
@@ -0,0 +1,224 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+try:
+    import serial
+except ImportError:
+    serial = None
+
+# -------------------------------------------------------------------------
+# UART HANDLER - Giao tiếp với ESP32
+# -------------------------------------------------------------------------
+# Thread đọc chỉ đọc dòng và chuyển 'yell' cho worker, nên UART không bị dồn
+# trong lúc inference. 'yell' trùng (cùng đích) đến khi yêu cầu trước chưa xong
+# được gộp lại. Mỗi yêu cầu có hạn trả lời (deadline): quá hạn thì gửi lệnh gần
+# nhất đã biết của hướng đó, kết quả đến muộn chỉ cập nhật lệnh gần nhất.
+#
+# Giao thức:
+#   "yell"       → "m0".."m4"              (nguồn mặc định, như cũ)
+#   "yell <id>"  → "<id>:m0".."<id>:m4"
+#   "yell all"   → một dòng "<id>:mN" cho mỗi nguồn
+
+
+class UARTHandler:
+    # ===== __init__ =====
+    # Khởi tạo UART handler: thiết lập port, baudrate, timeout, kết nối
+    # on_yell(target) -> {source_id: (result, cmd)}: hàm chụp + detect (target None/"<id>"/"all")
+    # deadline: hạn trả lời (giây), None = chờ tới khi có kết quả
+    # source_ids: danh sách nguồn (dùng khi trả lời 'yell all' bằng lệnh gần nhất)
+    def __init__(self, port="/dev/ttyAMA0", baudrate=115200, timeout=1,
+                 on_yell=None, deadline=None, source_ids=None, workers=2):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.on_yell = on_yell
+        self.deadline = deadline
+        self.source_ids = list(source_ids or [])
+        self.uart = None
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="uart-yell")
+        self._state_lock = threading.Lock()
+        self._inflight = {}          # target → trạng thái yêu cầu đang chạy
+        self.last_cmd = {}           # source_id (None = mặc định) → lệnh gần nhất đã biết
+        self.yells = 0
+        self.coalesced = 0
+        self.deadline_misses = 0
+        self.errors = 0
+        self._connect()
+
+    # ===== _connect =====
+    # Kết nối UART với serial port (nếu pyserial có sẵn)
+    def _connect(self):
+        try:
+            if serial is None:
+                print("serial module not available")
+                return
+            self.uart = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
+            print(f"UART connected to {self.port}")
+        except Exception as e:
+            print(f"UART connection failed: {e}")
+            self.uart = None
+
+    # ===== send =====
+    # Gửi cmd/message đến ESP32 qua UART
+    def send(self, msg):
+        if self.uart is None:
+            return False
+        try:
+            with metrics.timer("uart_send"), self.lock:
+                self.uart.write((msg + "\n").encode())
+                print(f"UART sent: {msg}")
+            return True
+        except Exception as e:
+            self.errors += 1
+            metrics.inc("uart_errors_total")
+            print(f"UART send error: {e}")
+            return False
+
+    # ===== start_listening =====
+    # Bắt đầu thread lắng nghe UART từ ESP32
+    def start_listening(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._listen, daemon=True)
+        self.thread.start()
+        print("UART listener started")
+
+    # ===== _listen =====
+    # Thread nền: lắng nghe UART từ ESP32, chuyển 'yell' cho worker rồi đọc tiếp ngay
+    def _listen(self):
+        while self.running:
+            if self.uart is None or not self.uart.is_open:
+                time.sleep(0.5)
+                continue
+            try:
+                data = self.uart.readline().decode().strip()
+                if data:
+                    print(f"UART received: {data}")
+                    self.handle_line(data)
+            except Exception as e:
+                self.errors += 1
+                metrics.inc("uart_errors_total")
+                print(f"UART read error: {e}")
+                time.sleep(0.1)
+
+    # ===== handle_line =====
+    # Phân tích một dòng nhận được
+    def handle_line(self, data):
+        parts = data.split()
+        if parts and parts[0].lower() == "yell":
+            # "yell" → nguồn mặc định, "yell <id>" → một hướng, "yell all" → mọi hướng
+            target = parts[1] if len(parts) > 1 else None
+            if target is not None and target.lower() == "all":
+                target = "all"
+            self.dispatch_yell(target)
+
+    # ===== dispatch_yell =====
+    # Gộp yell trùng, giao cho worker, hẹn giờ deadline
+    def dispatch_yell(self, target=None):
+        self.yells += 1
+        with self._state_lock:
+            req = self._inflight.get(target)
+            if req is not None:
+                if req["answered"]:
+                    # yêu cầu trước đã quá hạn và vẫn đang chạy → trả lời ngay bằng lệnh gần nhất
+                    self._send_fallback(target)
+                else:
+                    self.coalesced += 1
+                return
+            req = {"answered": False, "timer": None}
+            self._inflight[target] = req
+        if self.deadline:
+            req["timer"] = threading.Timer(self.deadline, self._on_deadline, args=(target, req))
+            req["timer"].daemon = True
+            req["timer"].start()
+        future = self.pool.submit(self._run_yell, target)
+        future.add_done_callback(lambda f: self._on_result(target, req, f))
+
+    # ===== _run_yell =====
+    def _run_yell(self, target):
+        if self.on_yell is None:
+            return {}
+        return self.on_yell(target)
+
+    # ===== _on_result =====
+    # Kết quả inference: cập nhật lệnh gần nhất, gửi nếu chưa trả lời (chưa quá hạn)
+    def _on_result(self, target, req, future):
+        if req["timer"] is not None:
+            req["timer"].cancel()
+        try:
+            results = future.result()
+        except Exception as e:
+            self.errors += 1
+            print(f"Error handling yell: {e}")
+            results = None
+        with self._state_lock:
+            send_now = not req["answered"]
+            req["answered"] = True
+            self._inflight.pop(target, None)
+        if results is None:
+            if send_now:
+                self._send_fallback(target)
+            return
+        for sid, (res, cmd) in results.items():
+            ok = not (isinstance(res, dict) and res.get('error'))
+            if ok:
+                self.last_cmd[sid] = cmd
+            if not send_now:
+                continue
+            prefix = f"{sid}:" if target is not None else ""
+            if ok:
+                self.send(prefix + cmd)
+                print(f"Detected {res.get('total_vehicles', 0)} vehicles, sent {prefix + cmd}")
+            else:
+                print(f"Yell capture error ({sid}): {res.get('error')}")
+                self.send(prefix + "m0")
+
+    # ===== _on_deadline =====
+    # Hết hạn mà chưa có kết quả → gửi lệnh gần nhất đã biết
+    def _on_deadline(self, target, req):
+        with self._state_lock:
+            if req["answered"]:
+                return
+            req["answered"] = True
+        self.deadline_misses += 1
+        print(f"Yell deadline missed ({target or 'default'}), sending last known command")
+        self._send_fallback(target)
+
+    # ===== _send_fallback =====
+    def _send_fallback(self, target):
+        if target is None:
+            self.send(self.last_cmd.get(None, "m0"))
+            return
+        sids = self.source_ids if target == "all" else [target]
+        for sid in sids:
+            self.send(f"{sid}:{self.last_cmd.get(sid, 'm0')}")
+
+    # ===== stats =====
+    def stats(self):
+        return {
+            "connected": self.uart is not None,
+            "yells": self.yells,
+            "coalesced": self.coalesced,
+            "deadline_misses": self.deadline_misses,
+            "errors": self.errors,
+            "inflight": len(self._inflight),
+        }
+
+    # ===== stop =====
+    # Tắt UART: dừng thread lắng nghe, đóng serial port
+    def stop(self):
+        """Tắt UART"""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1)
+        self.pool.shutdown(wait=False)
+        try:
+            if self.uart:
+                self.uart.close()
+        except:
+            pass
@@ -19,6 +19,89 @@ export FLASK_APP="$APP_PATH"
 export FLASK_ENV=production
 export PYTHONUNBUFFERED=1
 
+# Backend inference CPU: torch | onnx | onnx-int8 | openvino | openvino-int8
+# Export 1 lần trước khi chạy: python backends.py export --backend onnx
+# export YOLO_BACKEND=onnx
+# export YOLO_THREADS=4                 # số thread inference (mặc định = số core)
+# export YOLO_IMGSZ=640
+# export YOLO_CLASS_CONF=0.5,0.4,0.5,0.5,0.3,0.5   # ngưỡng conf riêng theo lớp (tuỳ chọn)
 
-# Chạy Flask server
-flask run --host=0.0.0.0 --port=5000
\ No newline at end of file
+# Cấu hình inference scheduler (micro-batch) - bỏ comment để thay đổi mặc định
+# export YOLO_BATCH_MAX_SIZE=4          # số frame tối đa mỗi batch
+# export YOLO_BATCH_MAX_WAIT_MS=15      # thời gian chờ gom batch (ms)
+# export YOLO_LATENCY_BUDGET_MS=1500    # giới hạn p99 latency (ms)
+# export YOLO_INFER_TIMEOUT=30          # thời gian chờ kết quả tối đa (s)
+
+# Ghi ảnh / JSON ở thread nền
+# export YOLO_WRITER_WORKERS=2          # số thread ghi file
+# export YOLO_WRITER_QUEUE=8            # số job chờ tối đa (đầy thì bỏ bớt)
+# export YOLO_SAVE_RAW=0                # 0 = không lưu ảnh upload gốc
+
+# UART (ESP32)
+# export YOLO_UART_PORT=/dev/ttyAMA0    # thử với cổng giả: python fake_serial.py
+# export YOLO_UART_DEADLINE_MS=800      # hạn trả lời 'yell', quá hạn gửi lệnh gần nhất (0 = tắt)
+
+# Camera
+# export YOLO_CAMERA_RING=4             # số buffer frame cấp phát sẵn
+# export YOLO_SOURCES=/path/to/sources.json   # danh sách camera (xem sources.example.json)
+
+# Streaming detector (detect liên tục, UART 'yell' trả lời ngay từ số xe đã tính)
+# export YOLO_STREAMING=1               # bật detect liên tục
+# export YOLO_STREAMING_WINDOW=10       # cửa sổ đếm xe (giây)
+# export YOLO_STREAMING_MAX_AGE=3       # số liệu cũ hơn (giây) → chụp + detect lại
+# export YOLO_STREAMING_MIN_STRIDE=1    # stride nhỏ nhất (frame)
+
+# Camera stream MJPEG (/camera_stream)
+# export YOLO_STREAM_FPS=15             # fps tối đa
+# export YOLO_STREAM_MAX_WIDTH=640      # độ phân giải tối đa
+# export YOLO_STREAM_MAX_HEIGHT=480
+# export YOLO_STREAM_QUALITY=70         # chất lượng JPEG
+
+# ROI theo nguồn (rect / đa giác, xem rois.example.json); sửa file là tự nạp lại
+# export YOLO_ROIS=/path/to/rois.json   # mặc định rois.json cạnh app.py
+
+# Detect theo tile cho camera độ phân giải cao (có thể đặt riêng từng nguồn: "tiling" trong sources.json)
+# export YOLO_TILE_SIZE=640             # cạnh tile (pixel frame), 0 = tắt
+# export YOLO_TILE_OVERLAP=0.2          # tỉ lệ chồng lấn giữa 2 tile
+# export YOLO_TILE_FULL_FRAME=1         # thêm ảnh cả frame vào cùng batch (giữ xe lớn)
+
+# Scene gate (cảnh gần như không đổi → dùng lại kết quả lần trước, không inference); mặc định tắt
+# export YOLO_SCENE_THRESHOLD=0.01      # tỉ lệ pixel thay đổi (0..1), 0 = tắt (mặc định)
+# export YOLO_SCENE_PIXEL_DELTA=12      # pixel lệch hơn bấy nhiêu mức xám mới tính là đổi
+# export YOLO_SCENE_MAX_AGE=30          # dùng lại tối đa (giây) rồi detect lại
+
+# Detection cache (frame giống hệt → không chạy lại model)
+# export YOLO_CACHE=1                   # bật cache trong RAM
+# export YOLO_CACHE_DIR=/var/cache/yolo # thêm tầng trên đĩa (tự bật cache)
+# export YOLO_CACHE_MAX_MB=256          # dung lượng tối đa trên đĩa
+# export YOLO_CACHE_MEM_ITEMS=512       # số mục tối đa trong RAM
+
+# Metrics (/metrics, Prometheus text) + sampling profiler
+# export YOLO_PROFILER=1                # bật /debug/profile?seconds=N (collapsed stacks)
+
+# Kết quả detect đẩy tới dashboard qua /events (Server-Sent Events)
+# export YOLO_EVENTS_HISTORY=20         # số kết quả gần nhất gửi lại cho client mới / reconnect
+# export YOLO_EVENTS_MAX_CLIENTS=8      # số dashboard đồng thời (mỗi client giữ 1 thread HTTP)
+# export YOLO_EVENTS_KEEPALIVE=15       # ping khi không có kết quả (giây)
+# export YOLO_LAST_DETECTION_JSON=1     # vẫn ghi static/last_detection.json cho client cũ (mặc định tắt)
+
+# Admission control (quá tải → /camera_capture trả 503 + Retry-After, UART luôn được ưu tiên; xem /admission)
+# export YOLO_MAX_INFLIGHT=2            # số chụp + detect đồng thời tối đa
+# export YOLO_UART_RESERVED=1           # số slot chỉ dành cho UART
+# export YOLO_MAX_WAITING=4             # số request web được xếp hàng chờ slot
+# export YOLO_ADMISSION_WAIT_MS=1000    # web chờ slot tối đa (ms), 0 = từ chối ngay
+# export YOLO_DEDUP_WINDOW_MS=300       # request giống nhau trong cửa sổ này dùng chung kết quả (0 = chỉ gộp request đang chạy)
+
+# Server HTTP (python app.py): số thread cố định, quá tải → 503 ngay
+# export YOLO_PORT=5000
+# export YOLO_HTTP_WORKERS=16           # số thread xử lý request
+# export YOLO_HTTP_BACKLOG=32           # số kết nối được xếp hàng chờ thread
+# export YOLO_HTTP_STREAMS=16           # số kết nối /camera_stream + /events đồng thời (thread riêng ngoài pool)
+
+
+# Chạy server (thread pool cố định). Server nhận request ngay, model / camera / UART
+# khởi tạo ở thread nền: /healthz = process sống, /readyz = 200 khi model đã load + warm-up
+# (trong lúc khởi động /camera_capture trả 503 + Retry-After, UART 'yell' nhận m0)
+python "$APP_PATH"
+# Server dev của Flask: khởi tạo ở request đầu tiên, hoặc ngay lúc chạy với factory:
+# flask --app "app:create_app()" run --host=0.0.0.0 --port=5000
\ No newline at end of file